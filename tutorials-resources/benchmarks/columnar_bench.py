@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+columnar_bench compares the cost per target update of turning batches of decoded target updates into DataFrames with
+pd.DataFrame(batch), as the notebooks do, with building them column by column with columnar.ColumnarBuilder.
+
+Besides the total cost, it reports the cost at the batch boundary (build and conversion), which is the time the
+stream is held up when a batch is delivered: ColumnarBuilder does part of the work as target updates arrive.
+Requires pandas >= 2.0 for the ISO8601 timestamp format of the typed baseline.
+"""
+
+import sys
+import time
+from os import path
+
+sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)), "..", "docker"))
+
+import pandas as pd  # noqa: E402
+
+from client import _ListBuilder  # noqa: E402
+from columnar import ColumnarBuilder, ColumnType, AIRSAFE_SCHEMA  # noqa: E402
+from datasets import demo_targets  # noqa: E402
+
+N_TARGETS = 100000
+BATCH_SIZE = 10000
+TIMESTAMP_FIELDS = [name for name, column_type in AIRSAFE_SCHEMA if column_type == ColumnType.TIMESTAMP]
+
+
+def typed_data_frame(batch):
+    df = pd.DataFrame(batch)
+    for name in TIMESTAMP_FIELDS:
+        if name in df:
+            df[name] = pd.to_datetime(df[name], utc=True, format="ISO8601")
+    return df
+
+
+def run(builder, convert, targets) -> float:
+    """
+    run appends all targets batch by batch, and converts every batch
+    :return: the time spent at the batch boundaries
+    """
+    boundary = 0.0
+    for i in range(0, len(targets), BATCH_SIZE):
+        for t in targets[i:i + BATCH_SIZE]:
+            builder.append(t)
+        start = time.perf_counter()
+        convert(builder.build())
+        boundary += time.perf_counter() - start
+    return boundary
+
+
+def measure(name, builder_factory, convert, targets):
+    start = time.perf_counter()
+    boundary = run(builder_factory(), convert, targets)
+    elapsed = time.perf_counter() - start
+    n = len(targets)
+    print("{:<44} {:>8.2f} us/target {:>8.2f} us/target at batch boundary".format(
+        name, 1e6 * elapsed / n, 1e6 * boundary / n))
+    return elapsed
+
+
+def main():
+    demo = demo_targets()
+    targets = (demo * (N_TARGETS // len(demo) + 1))[:N_TARGETS]
+
+    measure("list + pd.DataFrame(batch)", _ListBuilder, pd.DataFrame, targets)
+    typed = measure("list + pd.DataFrame(batch) + pd.to_datetime", _ListBuilder, typed_data_frame, targets)
+    columnar = measure("ColumnarBuilder + to_pandas()", lambda: ColumnarBuilder(BATCH_SIZE),
+                       lambda b: b.to_pandas(), targets)
+    print("speed-up over typed DataFrame: {:.2f}x".format(typed / columnar))
+    measure("ColumnarBuilder (NumPy columns)", lambda: ColumnarBuilder(BATCH_SIZE), len, targets)
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        print("pyarrow is not installed, skipping to_arrow()")
+        return 0
+    measure("ColumnarBuilder + to_arrow()", lambda: ColumnarBuilder(BATCH_SIZE), lambda b: b.to_arrow(), targets)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+connection_reuse_bench measures the connect latency of Client.stream against a local HTTPS server that ends every
+stream after a few messages, as it happens on server disconnects. It compares a new connection per stream() call
+(as with the module-level requests.get) with the client's persistent session.
+TLS requires the openssl command line tool to create a temporary certificate, plain HTTP is used otherwise.
+"""
+
+import http.server
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from os import path
+
+import requests
+
+sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)), "..", "docker"))
+
+from client import Client, ErrServerDisconnected  # noqa: E402
+
+N_STREAMS = 200
+BODY = b'{"status":{"timestamp":"2021-03-20T12:00:00Z","level":"INFO","message":"Welcome","code":100}}\n' \
+       b'{"position_token":"dG9rZW4=="}\n'
+
+
+class StreamHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+def self_signed_certificate(directory: str):
+    if shutil.which("openssl") is None:
+        return None
+    cert, key = path.join(directory, "cert.pem"), path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", key, "-out", cert,
+                    "-days", "1", "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost"],
+                   check=True, capture_output=True)
+    return cert, key
+
+
+def time_to_first_message(client: Client) -> float:
+    """
+    time_to_first_message runs one stream() call and returns the seconds until its first message arrived
+    """
+    start = time.perf_counter()
+    first = []
+    try:
+        client.stream(None, status_message_callback=lambda _: first.append(time.perf_counter()))
+    except ErrServerDisconnected:
+        pass
+    return first[0] - start
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    print("{:<26} p50 {:>7.0f} us  p90 {:>7.0f} us  p99 {:>7.0f} us".format(
+        name, *(1e6 * latencies[int(p * (len(latencies) - 1))] for p in (0.5, 0.9, 0.99))))
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    server = http.server.ThreadingHTTPServer(("localhost", 0), StreamHandler)
+    scheme, verify = "http", True
+    certificate = self_signed_certificate(directory)
+    if certificate is not None:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(*certificate)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme, verify = "https", certificate[0]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "{}://localhost:{}/v2/targets/stream".format(scheme, server.server_address[1])
+
+    def session():
+        s = requests.Session()
+        s.trust_env = False  # CA bundles from the environment would take precedence over the temporary certificate
+        s.verify = verify
+        return s
+
+    new_connections = []
+    for _ in range(N_STREAMS):
+        with Client("token", base_url=url, session=session()) as c:
+            new_connections.append(time_to_first_message(c))
+
+    reused = []
+    with Client("token", base_url=url, session=session()) as c:
+        for _ in range(N_STREAMS):
+            reused.append(time_to_first_message(c))
+
+    print("{} streams over {}".format(N_STREAMS, scheme))
+    report("new connection per stream", new_connections)
+    report("persistent session", reused)
+
+    server.shutdown()
+    shutil.rmtree(directory)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""
+datasets builds realistic /stream and /history payloads from the demo dataset shipped with the Shanghai airport \
+notebook, so that benchmarks can run offline.
+"""
+
+import csv
+import json
+from os import path
+from typing import Dict, List, Any
+
+DEMO_CSV = path.join(path.dirname(path.abspath(__file__)), "..", "..",
+                     "jupyter-notebooks", "shanghai-airport", "datasets", "demo.csv")
+
+_FLOAT_FIELDS = {"latitude", "longitude", "altitude_baro", "heading", "vertical_rate", "speed"}
+_BOOL_FIELDS = {"on_ground"}
+
+
+def _typed(key: str, value: str) -> Any:
+    if key in _FLOAT_FIELDS:
+        return float(value)
+    if key in _BOOL_FIELDS:
+        return value == "True"
+    return value
+
+
+def demo_targets() -> List[Dict[str, Any]]:
+    """
+    demo_targets reads demo.csv and returns its rows as target updates, typed as the API would send them.
+    Empty CSV cells are omitted, as the API omits unknown fields.
+    """
+    with open(DEMO_CSV, newline="") as f:
+        return [{k: _typed(k, v) for k, v in row.items() if v != ""} for row in csv.DictReader(f)]
+
+
+def stream_lines(n: int, targets_per_token: int = 100, targets_per_status: int = 1000) -> List[bytes]:
+    """
+    stream_lines returns n raw /stream lines, cycling through the demo targets and interleaving position tokens and
+    keep-alive status messages at the given rates.
+    :param n: The number of lines to generate
+    :param targets_per_token: The number of target updates between two position tokens
+    :param targets_per_status: The number of target updates between two status messages
+    """
+    targets = [json.dumps({"target": t}, separators=(",", ":")).encode("utf-8") for t in demo_targets()]
+    lines = []
+    i = 0
+    while len(lines) < n:
+        lines.append(targets[i % len(targets)])
+        i += 1
+        if i % targets_per_token == 0:
+            lines.append('{{"position_token":"dG9rZW4t{:010d}=="}}'.format(i).encode("utf-8"))
+        if i % targets_per_status == 0:
+            lines.append(b'{"status":{"timestamp":"2021-03-20T12:00:00Z","level":"INFO",'
+                         b'"message":"Keep-alive","code":101}}')
+    return lines[:n]
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+geofence_bench measures geofence.Geofence lookups against a few hundred irregular zones: per position with zones_at,
+and over arrays of positions with assign. It uses the positions of the demo dataset (around Shanghai), and synthetic
+zones around them and around the globe.
+"""
+
+import math
+import random
+import sys
+import time
+from os import path
+
+sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)), "..", "docker"))
+
+import numpy as np  # noqa: E402
+
+from geofence import Geofence, Zone  # noqa: E402
+from datasets import demo_targets  # noqa: E402
+
+N_ZONES = 300
+REPEAT = 5
+
+
+def random_zones(n, rng):
+    """
+    random_zones returns n star-shaped zones between 4 and 60 vertices, a fifth of them small zones around Shanghai
+    """
+    zones = []
+    for i in range(n):
+        if i % 5 == 0:
+            cx, cy, radius = rng.uniform(120.5, 122.5), rng.uniform(30.5, 32), rng.uniform(0.05, 0.3)
+        else:
+            cx, cy, radius = rng.uniform(-170, 170), rng.uniform(-70, 70), rng.uniform(0.05, 1.5)
+        k = rng.randint(4, 60)
+        ring = [(cx + radius * rng.uniform(0.4, 1) * math.cos(2 * math.pi * j / k),
+                 cy + radius * rng.uniform(0.4, 1) * math.sin(2 * math.pi * j / k)) for j in range(k)]
+        zones.append(Zone("zone-{}".format(i), [[ring]]))
+    return zones
+
+
+def best_of(fn):
+    best = math.inf
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    rng = random.Random(42)
+    zones = random_zones(N_ZONES, rng)
+    start = time.perf_counter()
+    fence = Geofence(zones)
+    print("index of {} zones built in {:.2f}s, cell size {:.3f} degrees".format(
+        N_ZONES, time.perf_counter() - start, fence.cell_size))
+
+    positions = [(t["latitude"], t["longitude"]) for t in demo_targets()]
+    positions += [(rng.uniform(-80, 80), rng.uniform(-180, 180)) for _ in range(len(positions))]
+    n = len(positions)
+    zones_at = fence.zones_at
+
+    elapsed = best_of(lambda: [zones_at(lat, lon) for lat, lon in positions])
+    print("{:<40} {:>8.3f} us/position".format("zones_at", 1e6 * elapsed / n))
+    latitudes = np.array([lat for lat, _ in positions])
+    longitudes = np.array([lon for _, lon in positions])
+    elapsed = best_of(lambda: fence.assign(latitudes, longitudes))
+    print("{:<40} {:>8.3f} us/position".format("assign", 1e6 * elapsed / n))
+    hits = sum(1 for lat, lon in positions if zones_at(lat, lon))
+    print("{} of {} positions are in a zone, bounding box {}".format(hits, n, fence.bounding_box()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+harness runs the benchmarks of suite.py and compares their results between commits.
+
+A benchmark is a function that runs its workload once, calls lap() after every operation (a message, or a batch for
+batch workloads) and returns the number of messages it processed. The harness runs it
+
+- to measure the throughput, best of repeat runs with a no-op lap;
+- to measure the latency of every operation between two laps;
+- to measure the peak of the memory allocated by the run, with tracemalloc.
+
+Results are written as JSON, together with the commit and the interpreter they were measured with.
+"""
+
+import json
+import math
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Optional, Dict, List, Any, Callable
+
+PERCENTILES = (50, 90, 99, 99.9)
+# THRESHOLD is the relative change (in percent) that compare reports as a regression
+THRESHOLD = 20.0
+
+
+def _noop():
+    pass
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """
+    percentile returns the p-th percentile of sorted values, by the nearest-rank method
+    """
+    if not sorted_values:
+        return math.nan
+    rank = max(int(math.ceil(p / 100 * len(sorted_values))), 1)
+    return sorted_values[rank - 1]
+
+
+def run(name: str, benchmark: Callable[[Callable[[], None]], int], unit: str = "message",
+        repeat: int = 3) -> Dict[str, Any]:
+    """
+    run measures a benchmark, see the module documentation
+    :param name: The name of the benchmark
+    :param benchmark: The function that runs the workload, called with lap
+    :param unit: What an operation between two laps is, for the latency percentiles
+    :param repeat: The number of runs of which the fastest gives the throughput
+    :return: the result of the benchmark
+    """
+    # a warm-up run fills caches and imports lazily loaded modules
+    benchmark(_noop)
+
+    best, messages = math.inf, 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        messages = benchmark(_noop)
+        best = min(best, time.perf_counter() - start)
+
+    laps = []
+    append, perf_counter = laps.append, time.perf_counter
+    laps.append(perf_counter())
+    benchmark(lambda: append(perf_counter()))
+    latencies = sorted(b - a for a, b in zip(laps, laps[1:]))
+
+    tracemalloc.start()
+    try:
+        benchmark(_noop)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "name": name,
+        "messages": messages,
+        "seconds": best,
+        "messages_per_second": messages / best if best > 0 else math.inf,
+        "unit": unit,
+        "operations": len(latencies),
+        "latency_us": dict([("p{:g}".format(p), 1e6 * percentile(latencies, p)) for p in PERCENTILES] +
+                           [("max", 1e6 * latencies[-1] if latencies else math.nan)]),
+        "peak_memory_bytes": peak,
+    }
+
+
+def report(result: Dict[str, Any]):
+    """
+    report prints a result on one line
+    """
+    latency = result["latency_us"]
+    print("{:<30} {:>9.0f} msgs/s  p50 {:>9.1f} p99 {:>9.1f} max {:>9.1f} us/{:<8}  peak {:>7.2f} MiB".format(
+        result["name"], result["messages_per_second"], latency["p50"], latency["p99"], latency["max"],
+        result["unit"], result["peak_memory_bytes"] / 2 ** 20))
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, check=True,
+                              text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write(results: List[Dict[str, Any]], file_name: str):
+    """
+    write writes results and the environment they were measured in to a JSON file
+    """
+    document = {
+        "commit": _commit(),
+        "time": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version,
+        "platform": platform.platform(),
+        "benchmarks": {result["name"]: result for result in results},
+    }
+    with open(file_name, "w") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+
+
+def compare(base_file: str, new_file: str, threshold: float = THRESHOLD) -> List[str]:
+    """
+    compare prints the change of the results of new_file against base_file, for the benchmarks in both
+    :param threshold: The change in percent above which a lower throughput or higher peak memory is a regression
+    :return: the names of the benchmarks that regressed
+    """
+    with open(base_file) as f:
+        base = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    print("{} ({}) -> {} ({})".format(base_file, base.get("commit"), new_file, new.get("commit")))
+
+    def change(old, value) -> float:
+        return 100 * (value - old) / old if old else 0.0
+
+    regressions = []
+    for name in sorted(set(base["benchmarks"]) & set(new["benchmarks"])):
+        a, b = base["benchmarks"][name], new["benchmarks"][name]
+        throughput = change(a["messages_per_second"], b["messages_per_second"])
+        latency = change(a["latency_us"]["p99"], b["latency_us"]["p99"])
+        memory = change(a["peak_memory_bytes"], b["peak_memory_bytes"])
+        regressed = throughput < -threshold or memory > threshold
+        if regressed:
+            regressions.append(name)
+        print("{:<30} msgs/s {:>+7.1f}%  p99 {:>+7.1f}%  peak memory {:>+7.1f}%{}".format(
+            name, throughput, latency, memory, "  REGRESSION" if regressed else ""))
+    return regressions
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""
+predicate_bench measures the cost per target update of a compiled predicate.Predicate, evaluated on single target
+updates and on columnar batches, against the equivalent hand-written Python function, and prints the selectivity of
+its terms on the demo dataset.
+"""
+
+import sys
+import time
+from os import path
+
+sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)), "..", "docker"))
+
+from columnar import ColumnarBuilder  # noqa: E402
+from predicate import Predicate  # noqa: E402
+from datasets import demo_targets  # noqa: E402
+
+N_TARGETS = 100000
+BATCH_SIZE = 10000
+EXPRESSION = "speed > 200 and collection_type == 'terrestrial' and aircraft_type_icao.startswith(('A3', 'B7'))"
+
+
+def hand_written(t) -> bool:
+    speed = t.get("speed")
+    aircraft_type = t.get("aircraft_type_icao")
+    return speed is not None and speed > 200 and t.get("collection_type") == "terrestrial" and \
+        aircraft_type is not None and aircraft_type.startswith(("A3", "B7"))
+
+
+def measure(name, fn, n):
+    start = time.perf_counter()
+    matches = fn()
+    elapsed = time.perf_counter() - start
+    print("{:<36} {:>8.3f} us/target {:>8} matches".format(name, 1e6 * elapsed / n, matches))
+
+
+def main():
+    demo = demo_targets()
+    targets = (demo * (N_TARGETS // len(demo) + 1))[:N_TARGETS]
+    batches = []
+    for i in range(0, N_TARGETS, BATCH_SIZE):
+        builder = ColumnarBuilder(BATCH_SIZE)
+        for t in targets[i:i + BATCH_SIZE]:
+            builder.append(t)
+        batches.append(builder.build())
+
+    measure("hand-written function", lambda: sum(1 for t in targets if hand_written(t)), N_TARGETS)
+    p = Predicate(EXPRESSION)
+    measure("Predicate, per target update", lambda: sum(1 for t in targets if p(t)), N_TARGETS)
+    measure("Predicate.mask, columnar batches", lambda: sum(int(Predicate(EXPRESSION).mask(b).sum())
+                                                            for b in batches), N_TARGETS)
+    for s in p.stats():
+        print("{:<72} selectivity {:.2f}".format(s.expression, s.selectivity))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+stream_compression_bench compares bytes on the wire and CPU time per message of an uncompressed stream with a gzip
+compressed stream, as received by Client.stream (incremental decompression, line framing and decoding).
+The compressed stream is flushed after every batch of lines, as a streaming server has to do to keep latency low.
+"""
+
+import sys
+import time
+import zlib
+from os import path
+
+sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)), "..", "docker"))
+
+from client import JSONDecoder, _CHUNK_SIZE, _gunzip, _iter_lines  # noqa: E402
+from datasets import stream_lines  # noqa: E402
+
+N_LINES = 100000
+LINES_PER_FLUSH = [1, 10, 100]
+
+
+def chunked(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def gzip_stream(lines, lines_per_flush: int) -> bytes:
+    c = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    out = []
+    for i in range(0, len(lines), lines_per_flush):
+        out.append(c.compress(b"".join(line + b"\n" for line in lines[i:i + lines_per_flush])))
+        out.append(c.flush(zlib.Z_SYNC_FLUSH))
+    out.append(c.flush())
+    return b"".join(out)
+
+
+def receive(chunks, compressed: bool) -> float:
+    decode = JSONDecoder().decode
+    start = time.process_time()
+    if compressed:
+        chunks = _gunzip(chunks)
+    for line in _iter_lines(chunks):
+        decode(line)
+    return time.process_time() - start
+
+
+def main():
+    lines = stream_lines(N_LINES)
+    raw = b"".join(line + b"\n" for line in lines)
+    cpu = receive(chunked(raw, _CHUNK_SIZE), False)
+    print("{:<22} {:>12} bytes {:>6.1f} bytes/msg {:>6.2f} us/msg".format(
+        "uncompressed", len(raw), len(raw) / len(lines), 1e6 * cpu / len(lines)))
+
+    for lines_per_flush in LINES_PER_FLUSH:
+        body = gzip_stream(lines, lines_per_flush)
+        cpu = receive(chunked(body, _CHUNK_SIZE), True)
+        print("{:<22} {:>12} bytes {:>6.1f} bytes/msg {:>6.2f} us/msg  ({:.1f}x smaller)".format(
+            "gzip, flush/{} lines".format(lines_per_flush), len(body), len(body) / len(lines),
+            1e6 * cpu / len(lines), len(raw) / len(body)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+stream_decode_bench compares the per-line work of the original Client.stream loop (decode to str, json.loads, probe
+the message keys) with the Decoder based dispatch that Client.stream uses now.
+"""
+
+import json
+import sys
+import time
+from os import path
+
+sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)), "..", "docker"))
+
+from client import JSONDecoder, _MessageKey  # noqa: E402
+from datasets import stream_lines  # noqa: E402
+
+N_LINES = 200000
+
+
+def legacy_loop(lines, on_target, on_token, on_status):
+    for line in lines:
+        decoded_line = line.decode('utf-8')
+        data = json.loads(decoded_line)
+
+        if _MessageKey.TARGET.value in data.keys():
+            on_target(data[_MessageKey.TARGET.value])
+        elif _MessageKey.POSITION_TOKEN.value in data.keys():
+            on_token(data[_MessageKey.POSITION_TOKEN.value])
+        elif _MessageKey.STATUS.value in data.keys():
+            on_status(data[_MessageKey.STATUS.value])
+
+
+def decoder_loop(decoder, lines, on_target, on_token, on_status):
+    handlers = {
+        _MessageKey.TARGET.value: on_target,
+        _MessageKey.POSITION_TOKEN.value: on_token,
+        _MessageKey.STATUS.value: on_status,
+    }
+    decode = decoder.decode
+    for line in lines:
+        key, payload = decode(line)
+        handlers[key](payload)
+
+
+def measure(name, fn, n_lines):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print("{:<28} {:>10.0f} lines/s {:>8.2f} us/line".format(name, n_lines / elapsed, 1e6 * elapsed / n_lines))
+    return elapsed
+
+
+def main():
+    lines = stream_lines(N_LINES)
+    sink = []
+    noop = sink.append
+
+    baseline = measure("legacy loop", lambda: legacy_loop(lines, noop, noop, noop), len(lines))
+    sink.clear()
+    stdlib = measure("JSONDecoder (json)",
+                     lambda: decoder_loop(JSONDecoder(loads=json.loads), lines, noop, noop, noop), len(lines))
+    sink.clear()
+    print("speed-up (json):   {:.2f}x".format(baseline / stdlib))
+    try:
+        import orjson
+    except ImportError:
+        print("orjson is not installed, skipping the orjson backend")
+        return 0
+    fast = measure("JSONDecoder (orjson)",
+                   lambda: decoder_loop(JSONDecoder(loads=orjson.loads), lines, noop, noop, noop), len(lines))
+    print("speed-up (orjson): {:.2f}x".format(baseline / fast))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
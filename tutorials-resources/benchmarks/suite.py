@@ -0,0 +1,437 @@
+#!/usr/bin/env python
+"""
+suite runs the benchmarks of the client and of the tutorial pipelines, and writes their throughput, latency
+percentiles and peak memory to a JSON file, so that regressions can be compared between commits:
+
+    python suite.py --output base.json
+    git checkout other-branch
+    python suite.py --output new.json
+    python suite.py --compare base.json new.json
+
+Benchmarks can be selected by name, e.g. python suite.py client.stream. Benchmarks whose dependencies (see the
+requirements.txt of the tutorials) are not installed are skipped.
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+from os import path
+from typing import Dict, List, Any, Callable
+
+HERE = path.dirname(path.abspath(__file__))
+sys.path.insert(0, path.join(HERE, "..", "docker"))
+
+import requests  # noqa: E402
+
+import harness  # noqa: E402
+from client import Client, ErrServerDisconnected, StreamConfig, ContinueFromPositionToken, Compression, \
+    FilterLatitude, FilterLongitude, FilterAltitude, FilterIcaoAddress, FilterAirline, _STREAM_V2_URL  # noqa: E402
+from datasets import demo_targets, stream_lines  # noqa: E402
+from geofence import Geofence, Zone  # noqa: E402
+from history import HistoryClient  # noqa: E402
+from recorder import Recorder, Replayer  # noqa: E402
+
+try:
+    import pandas as _pd
+except ImportError:
+    _pd = None
+try:
+    import pyarrow as _pa
+except ImportError:
+    _pa = None
+
+N_LINES = 100000
+N_SERVER_MESSAGES = 100000
+N_CONFIGS = 10000
+N_EXPORT_TARGETS = 50000
+N_FLIGHTS = 20
+# EXPORT_BATCH is the number of target updates per CSV file of the exports and per /history response
+EXPORT_BATCH = 5000
+HISTORY_CONNECTIONS = 4
+HISTORY_SLICES = 16
+
+# _fixtures holds the data and modules that the setups prepare for the benchmarks
+_fixtures: Dict[str, Any] = {}
+
+
+class _ReplayBody(object):
+    """
+    _ReplayBody is the raw body of the responses of _ReplayAdapter, read in chunks of the size the client asks for
+    """
+
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def stream(self, amt: int, decode_content=None):
+        body = self.body
+        for i in range(0, len(body), amt):
+            yield body[i:i + amt]
+
+    def close(self):
+        pass
+
+
+class _ReplayAdapter(requests.adapters.BaseAdapter):
+    """
+    _ReplayAdapter answers every request with the same body, so that Client.stream can be measured without the
+    overhead of a connection
+    """
+
+    def __init__(self, body: bytes):
+        super().__init__()
+        self.body = body
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["Content-Type"] = "application/x-ndjson"
+        response.raw = _ReplayBody(self.body)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+
+def _load(name: str, directory: str):
+    """
+    _load imports the main.py of a tutorial as module name, with the tutorial directory first on the path
+    """
+    directory = path.join(HERE, "..", directory)
+    sys.path.insert(0, directory)
+    try:
+        spec = importlib.util.spec_from_file_location(name, path.join(directory, "main.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    finally:
+        sys.path.remove(directory)
+
+
+def _history_lines(targets: List[Dict[str, Any]], n: int) -> List[str]:
+    lines = [json.dumps({"target": t}, separators=(",", ":")) for t in targets]
+    return (lines * (n // len(lines) + 1))[:n]
+
+
+def bench_client_stream(lap: Callable[[], None]) -> int:
+    """
+    bench_client_stream measures the parsing and dispatch of Client.stream, from a body in memory
+    """
+    session = requests.Session()
+    session.mount("https://", _ReplayAdapter(_fixtures["body"]))
+    handler = lambda _: lap()  # noqa: E731
+    try:
+        Client("token", session=session).stream(handler, handler, handler)
+    except ErrServerDisconnected:
+        pass
+    return N_LINES
+
+
+def _serve(queue, n: int):
+    sys.path.insert(0, path.join(HERE, "..", "local-airsafe-server"))
+    import server
+    s = server.make_server(server.load_targets(server.DEMO_CSV), "127.0.0.1", 0,
+                           server.Options(disconnect_after=n))
+    queue.put(s.server_address[1])
+    s.serve_forever()
+
+
+@contextlib.contextmanager
+def local_server(n: int):
+    """
+    local_server runs the local stand-in server in another process, so that it does not compete for the GIL
+    :return: the URL of its stream endpoint
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(queue, n), daemon=True)
+    process.start()
+    try:
+        yield "http://127.0.0.1:{}/v2/targets/stream".format(queue.get(timeout=30))
+    finally:
+        process.terminate()
+        process.join()
+
+
+def bench_client_stream_local_server(lap: Callable[[], None]) -> int:
+    """
+    bench_client_stream_local_server measures Client.stream over HTTP, against the local stand-in server
+    """
+    client = _fixtures["client"]
+    handler = lambda _: lap()  # noqa: E731
+    try:
+        client.stream(handler, handler, handler)
+    except ErrServerDisconnected:
+        pass
+    return N_SERVER_MESSAGES
+
+
+def bench_history_local_server(lap: Callable[[], None]) -> int:
+    """
+    bench_history_local_server measures HistoryClient.lines over HTTP, against the local stand-in server, for the
+    window of its demo data in HISTORY_SLICES slices over HISTORY_CONNECTIONS connections
+    """
+    lines = 0
+    for _ in _fixtures["history_client"].lines("2021-03-20T12:00:00Z", "2021-03-20T14:30:00Z", slices=HISTORY_SLICES):
+        lap()
+        lines += 1
+    return lines
+
+
+def bench_recorder(lap: Callable[[], None]) -> int:
+    """
+    bench_recorder measures recording the lines of a stream with recorder.Recorder, including the final compression
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        with Recorder(directory) as recorder:
+            for line in _fixtures["stream_lines"]:
+                recorder(line)
+                lap()
+    return N_LINES
+
+
+def bench_replay(lap: Callable[[], None]) -> int:
+    """
+    bench_replay measures Client.replay of a recording made with recorder.Recorder
+    """
+    handler = lambda _: lap()  # noqa: E731
+    Client("token").replay(Replayer(_fixtures["recording"]).lines(), handler, handler, handler)
+    return N_LINES
+
+
+def bench_stream_config(lap: Callable[[], None]) -> int:
+    """
+    bench_stream_config measures building a StreamConfig and encoding it into the URL of a request
+    """
+    for i in range(N_CONFIGS):
+        config = StreamConfig()
+        config.add(ContinueFromPositionToken("dG9rZW4tMDAwMDAwMDAwMQ=="))
+        config.add(Compression(Compression.GZIP))
+        config.add(FilterLatitude(31.02988460440661, 31.36374539559339))
+        config.add(FilterLongitude(121.1632295670742, 121.52071043292581))
+        config.add(FilterAltitude(0, 40000))
+        config.add(FilterIcaoAddress(["780A3F", "ADB984", "A1B2C3"]))
+        config.add(FilterAirline(["MU", "FM"]))
+        requests.Request("GET", _STREAM_V2_URL, params=config.get()).prepare()
+        lap()
+    return N_CONFIGS
+
+
+def bench_stream_csv_export(lap: Callable[[], None]) -> int:
+    """
+    bench_stream_csv_export measures the exports of tracking-stream-csv-export, every EXPORT_BATCH targets: the
+    rotation of the buffer on the stream thread, and the writing of the CSV files by the exporter thread until all
+    are written. The laps time the stream thread.
+    """
+    main = _fixtures["stream_csv_export"]
+    targets = _fixtures["targets"]
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        cwd = os.getcwd()
+        os.chdir(directory)
+        main.start_exporter()
+        try:
+            for i in range(0, len(targets), EXPORT_BATCH):
+                main.target_updates.extend(targets[i:i + EXPORT_BATCH])
+                main.rotate_buffer()
+                lap()
+        finally:
+            main.stop_exporter()
+            os.chdir(cwd)
+    return len(targets)
+
+
+def bench_history_csv_export(lap: Callable[[], None]) -> int:
+    """
+    bench_history_csv_export measures the parsing, geofencing and CSV writing of tracking-history-csv-export, per
+    /history response of EXPORT_BATCH lines
+    """
+    main = _fixtures["history_csv_export"]
+    lines = _fixtures["lines"]
+    fence = _fixtures["fence"]
+    with tempfile.TemporaryDirectory() as directory:
+        sink = main.CSVSink(directory, name_format="data_{sequence}.csv")
+        for i in range(0, len(lines), EXPORT_BATCH):
+            sink.write_all(main.read_targets(lines[i:i + EXPORT_BATCH], fence))
+            os.remove(sink.rotate())
+            lap()
+    return len(lines)
+
+
+def bench_history_parquet_export(lap: Callable[[], None]) -> int:
+    """
+    bench_history_parquet_export measures the parsing, geofencing and Parquet writing of tracking-history-csv-export
+    with FORMAT parquet, per /history response of EXPORT_BATCH lines
+    """
+    main = _fixtures["history_csv_export"]
+    lines = _fixtures["lines"]
+    fence = _fixtures["fence"]
+    with tempfile.TemporaryDirectory() as directory:
+        sink = main.ParquetSink(directory, cell_degrees=1)
+        for i in range(0, len(lines), EXPORT_BATCH):
+            sink.write_all(main.read_targets(lines[i:i + EXPORT_BATCH], fence))
+            for file_path in sink.rotate():
+                os.remove(file_path)
+            lap()
+    return len(lines)
+
+
+def bench_flight_distance(lap: Callable[[], None]) -> int:
+    """
+    bench_flight_distance measures flight_distance of calculate-flight-distance over the N_FLIGHTS longest flight
+    paths of the demo dataset
+    """
+    flight_distance = _fixtures["calculate_flight_distance"].flight_distance
+    n = 0
+    for df in _fixtures["flights"]:
+        flight_distance(df)
+        n += len(df.index)
+        lap()
+    return n
+
+
+def notebook_data_frame(lines):
+    # as in the Shanghai airport notebook
+    data = []
+    for line in lines:
+        if line and '"target":{' in line:
+            data.append(json.loads(line)["target"])
+    return _pd.DataFrame(data)
+
+
+def bench_notebook_data_frame(lap: Callable[[], None]) -> int:
+    """
+    bench_notebook_data_frame measures building the DataFrame of the Shanghai airport notebook, per /history response
+    of EXPORT_BATCH lines
+    """
+    lines = _fixtures["lines"]
+    for i in range(0, len(lines), EXPORT_BATCH):
+        notebook_data_frame(lines[i:i + EXPORT_BATCH])
+        lap()
+    return len(lines)
+
+
+def setup_client_stream(stack: contextlib.ExitStack):
+    if "stream_lines" not in _fixtures:
+        _fixtures["stream_lines"] = stream_lines(N_LINES)
+        _fixtures["body"] = b"".join(line + b"\n" for line in _fixtures["stream_lines"])
+
+
+def setup_replay(stack: contextlib.ExitStack):
+    setup_client_stream(stack)
+    _fixtures["recording"] = stack.enter_context(tempfile.TemporaryDirectory())
+    with Recorder(_fixtures["recording"]) as recorder:
+        for line in _fixtures["stream_lines"]:
+            recorder(line)
+
+
+def setup_local_server(stack: contextlib.ExitStack):
+    url = stack.enter_context(local_server(N_SERVER_MESSAGES))
+    _fixtures["client"] = stack.enter_context(contextlib.closing(Client("token", base_url=url)))
+
+
+def setup_history_local_server(stack: contextlib.ExitStack):
+    url = stack.enter_context(local_server(N_SERVER_MESSAGES))
+    _fixtures["history_client"] = stack.enter_context(contextlib.closing(
+        HistoryClient("token", base_url=url.replace("/stream", "/history"), connections=HISTORY_CONNECTIONS)))
+
+
+def setup_history(stack: contextlib.ExitStack):
+    if "lines" in _fixtures:
+        return
+    targets = demo_targets()
+    _fixtures["targets"] = (targets * (N_EXPORT_TARGETS // len(targets) + 1))[:N_EXPORT_TARGETS]
+    _fixtures["lines"] = _history_lines(targets, N_EXPORT_TARGETS)
+
+
+def setup_stream_csv_export(stack: contextlib.ExitStack):
+    setup_history(stack)
+    _fixtures["stream_csv_export"] = _load("stream_csv_export", "tracking-stream-csv-export")
+
+
+def setup_history_csv_export(stack: contextlib.ExitStack):
+    setup_history(stack)
+    _fixtures["history_csv_export"] = _load("history_csv_export", "tracking-history-csv-export")
+    # the western half of the area of the Shanghai airport notebook
+    area = [(121.16, 31.02), (121.34, 31.02), (121.34, 31.37), (121.16, 31.37), (121.16, 31.02)]
+    _fixtures["fence"] = Geofence([Zone("west", [[area]])])
+
+
+def setup_history_parquet_export(stack: contextlib.ExitStack):
+    if _pa is None:
+        raise ImportError("No module named 'pyarrow'")
+    setup_history_csv_export(stack)
+
+
+def setup_notebook(stack: contextlib.ExitStack):
+    if _pd is None:
+        raise ImportError("No module named 'pandas'")
+    setup_history(stack)
+
+
+def setup_flight_distance(stack: contextlib.ExitStack):
+    setup_notebook(stack)
+    _fixtures["calculate_flight_distance"] = _load("calculate_flight_distance", "calculate-flight-distance")
+    targets = demo_targets()
+    df = notebook_data_frame(_history_lines(targets, len(targets)))
+    flights = sorted((flight.reset_index(drop=True) for _, flight in df.groupby("icao_address")),
+                     key=lambda flight: len(flight.index), reverse=True)
+    _fixtures["flights"] = flights[:N_FLIGHTS]
+
+
+# BENCHMARKS are (name, benchmark, unit, setup), setup prepares the fixtures of the benchmark
+BENCHMARKS = [
+    ("client.stream", bench_client_stream, "message", setup_client_stream),
+    ("client.stream local server", bench_client_stream_local_server, "message", setup_local_server),
+    ("history.lines local server", bench_history_local_server, "line", setup_history_local_server),
+    ("recorder.record", bench_recorder, "message", setup_client_stream),
+    ("client.replay", bench_replay, "message", setup_replay),
+    ("stream_config.encode", bench_stream_config, "config", None),
+    ("tracking-stream-csv-export", bench_stream_csv_export, "export", setup_stream_csv_export),
+    ("tracking-history-csv-export", bench_history_csv_export, "response", setup_history_csv_export),
+    ("tracking-history-parquet", bench_history_parquet_export, "response", setup_history_parquet_export),
+    ("calculate-flight-distance", bench_flight_distance, "flight", setup_flight_distance),
+    ("notebook.data_frame", bench_notebook_data_frame, "response", setup_notebook),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("names", nargs="*", help="the benchmarks to run, all if none")
+    parser.add_argument("--output", default="results.json", help="the JSON file to write the results to")
+    parser.add_argument("--repeat", type=int, default=3, help="the runs of which the fastest gives the throughput")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two result files")
+    parser.add_argument("--threshold", type=float, default=harness.THRESHOLD,
+                        help="the change in percent that is reported as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        return 1 if harness.compare(*args.compare, threshold=args.threshold) else 0
+
+    results = []
+    with contextlib.ExitStack() as stack:
+        for name, benchmark, unit, setup in BENCHMARKS:
+            if args.names and name not in args.names:
+                continue
+            try:
+                if setup is not None:
+                    setup(stack)
+            except ImportError as e:
+                print("{:<30} skipped, {}".format(name, e))
+                continue
+            result = harness.run(name, benchmark, unit, args.repeat)
+            harness.report(result)
+            results.append(result)
+    harness.write(results, args.output)
+    print("results written to {}".format(args.output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
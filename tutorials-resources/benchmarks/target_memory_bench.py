@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+target_memory_bench compares the memory held by buffered target updates as decoded dicts and as Target records,
+and the decoding throughput with and without the Target conversion.
+"""
+
+import gc
+import sys
+import time
+import tracemalloc
+from os import path
+
+sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)), "..", "docker"))
+
+from client import JSONDecoder  # noqa: E402
+from target import Target  # noqa: E402
+from datasets import stream_lines  # noqa: E402
+
+N_TARGETS = 100000
+
+
+def decode_all(decoder, lines):
+    decode = decoder.decode
+    return [decode(line)[1] for line in lines]
+
+
+def measure(name, decoder, lines):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    held = decode_all(decoder, lines)
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("{:<24} {:>8.1f} MB {:>6.0f} bytes/target {:>10.0f} targets/s".format(
+        name, size / 2 ** 20, size / len(held), len(held) / elapsed))
+    return size
+
+
+def main():
+    # targets only, as the consumer would buffer them
+    lines = stream_lines(N_TARGETS, targets_per_token=N_TARGETS + 1, targets_per_status=N_TARGETS + 1)
+
+    dicts = measure("dict", JSONDecoder(), lines)
+    targets = measure("Target", JSONDecoder(target_factory=Target.from_dict), lines)
+    print("memory reduction: {:.2f}x".format(dicts / targets))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
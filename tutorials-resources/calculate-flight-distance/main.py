@@ -9,6 +9,37 @@ from colorama import init, Fore, Style, Back
 import reverse_geocoder as rg
 
 
+def read_targets(lines):
+    """
+    read_targets returns the target updates of the lines of a /history response as a DataFrame
+    """
+    data = []
+    for line in lines:
+        if line and '"target":{' in line:
+            data.append(json.loads(line)["target"])
+    return pd.DataFrame(data)
+
+
+def flight_distance(df):
+    """
+    flight_distance returns the distance in km along the positions of a flight path, and the positions
+    """
+    total_distance_km = 0
+
+    row_iterator = df.iterrows()
+    _, last = next(row_iterator)
+    coordinates = []
+    for i, row in row_iterator:
+        coord_last = (last["latitude"], last["longitude"])
+        coordinates.append(coord_last)
+        coord_current = (row["latitude"], row["longitude"])
+        last = row
+        # Using geopy and the geodesic distance between 2 points, we can calculate the total distance
+        total_distance_km += distance.distance(coord_last, coord_current).km
+    coordinates.append(coord_current)
+    return total_distance_km, coordinates
+
+
 if __name__ == "__main__":
     init()
 
@@ -33,11 +64,7 @@ if __name__ == "__main__":
         print(Style.RESET_ALL + Fore.RED + "invalid token.")
         exit()
     else:
-        data = []
-        for line in resp.iter_lines(decode_unicode=True):
-            if line and '"target":{' in line:
-                data.append(json.loads(line)["target"])
-        df = pd.DataFrame(data)
+        df = read_targets(resp.iter_lines(decode_unicode=True))
 
     # Find a target update that fits the route we are interested in
     flight_analysed = df[
@@ -79,11 +106,7 @@ if __name__ == "__main__":
             print("Failed to query API")
             sys.exit()
 
-        data = []
-        for line in resp.iter_lines(decode_unicode=True):
-            if line and '"target":{' in line:
-                data.append(json.loads(line)["target"])
-        df = pd.DataFrame(data)
+        df = read_targets(resp.iter_lines(decode_unicode=True))
 
         print(
             Style.RESET_ALL + Fore.GREEN + f"Datapoints found:" + Style.RESET_ALL,
@@ -97,19 +120,7 @@ if __name__ == "__main__":
             f"Latest point found at: {df['timestamp'].tail(1).to_string(index=False)}"
         )
 
-        total_distance_km = 0
-
-        row_iterator = df.iterrows()
-        _, last = next(row_iterator)
-        coordinates = []
-        for i, row in row_iterator:
-            coord_last = (last["latitude"], last["longitude"])
-            coordinates.append(coord_last)
-            coord_current = (row["latitude"], row["longitude"])
-            last = row
-            # Using geopy and the geodesic distance between 2 points, we can calculate the total distance
-            total_distance_km += distance.distance(coord_last, coord_current).km
-        coordinates.append(coord_current)
+        total_distance_km, coordinates = flight_distance(df)
 
         print(Style.RESET_ALL)
         # We can now check the countries flown by by using a reverse offline geocoder
@@ -0,0 +1,313 @@
+"""
+async_client is the asyncio counterpart of client. It is built on aiohttp and exposes \
+api.airsafe.spire.com/v2/targets/stream as an async iterator, so that a single process can follow many streams \
+(and serve other I/O) on one event loop.
+
+It shares StreamConfig, the Filter* parameters, the Decoder and the error types with client.
+"""
+
+import asyncio
+import collections
+import http
+import logging
+import zlib
+from typing import Optional, Any, List, NamedTuple, Deque
+
+import aiohttp
+
+from client import StreamConfig, Decoder, JSONDecoder, ErrInvalidToken, ErrServerDisconnected, Compression
+from client import _Timer, _MessageKey, _StatusFields, _STATUS_LEVELS_MAP, _STREAM_V2_URL, _min_reasonable_timeout, \
+    _COMPRESSION_KEY, _GZIP_MAGIC
+
+
+class Message(NamedTuple):
+    """
+    Message is yielded by AsyncStream for every message that arrives.
+    key is one of "target", "position_token" or "status", value is the respective payload.
+    """
+    key: str
+    value: Any
+
+
+class _GzipLines(object):
+    """
+    _GzipLines reads the lines of a gzip compressed response body, decompressing it incrementally as chunks arrive,
+    like client._gunzip. Bodies that are not gzip compressed (e.g. if the server ignored the compression parameter)
+    are passed through. readline returns b"" at the end of the body, like aiohttp.StreamReader.readline.
+    """
+
+    def __init__(self, content: aiohttp.StreamReader):
+        self._content = content
+        # _gzip is None until the first bytes of the body tell whether it is compressed
+        self._gzip: Optional[bool] = None
+        self._head = b""
+        self._d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._buffer = b""
+        self._lines: Deque[bytes] = collections.deque()
+        self._eof = False
+
+    async def readline(self) -> bytes:
+        while not self._lines:
+            if self._eof:
+                line, self._buffer = self._buffer, b""
+                return line
+            chunk = await self._content.readany()
+            if chunk:
+                self._feed(chunk)
+                continue
+            self._eof = True
+            if self._gzip is None:
+                self._split(self._head)
+            elif self._gzip:
+                self._split(self._d.flush())
+        return self._lines.popleft()
+
+    def _feed(self, chunk: bytes):
+        if self._gzip is None:
+            self._head += chunk
+            if len(self._head) < len(_GZIP_MAGIC):
+                return
+            chunk, self._head = self._head, b""
+            self._gzip = chunk.startswith(_GZIP_MAGIC)
+        if not self._gzip:
+            self._split(chunk)
+            return
+        pending = chunk
+        while pending:
+            self._split(self._d.decompress(pending))
+            pending = b""
+            if self._d.eof:
+                # the next gzip member starts in the same chunk
+                pending = self._d.unused_data
+                self._d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def _split(self, data: bytes):
+        if not data:
+            return
+        lines = (self._buffer + data).split(b"\n")
+        self._buffer = lines.pop()
+        self._lines.extend(line + b"\n" for line in lines)
+
+
+class AsyncStream(object):
+    """
+    AsyncStream is returned by AsyncClient.stream(). It is an async iterator over the incoming messages and an async
+    context manager that releases the connection on exit, including when the consuming task is cancelled.
+    The last received position token is available as last_position_token at any point, and is returned by aclose().
+    """
+
+    def __init__(self, client: "AsyncClient", config: Optional[StreamConfig], timeout: Optional[float],
+                 graceful_timeout: bool):
+        self._client = client
+        self._logger = client.logger
+        self._params = config.get() if config is not None else None
+        self._timeout = timeout
+        self._graceful_timeout = graceful_timeout
+
+        self._timer: Optional[_Timer] = None
+        self._watchdog: List[asyncio.TimerHandle] = []
+        self._response: Optional[aiohttp.ClientResponse] = None
+        self._reader = None
+        self._closed = False
+        self._stop_reason: Optional[str] = None
+
+        self.last_position_token: Optional[str] = None
+
+    async def __aenter__(self) -> "AsyncStream":
+        await self._connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    def __aiter__(self) -> "AsyncStream":
+        return self
+
+    async def __anext__(self) -> Message:
+        if self._closed:
+            raise StopAsyncIteration
+        try:
+            if self._response is None:
+                await self._connect()
+            return await self._next_message()
+        except StopAsyncIteration:
+            await self.aclose()
+            raise
+        except BaseException:
+            # covers asyncio.CancelledError: the connection must not outlive the consuming task
+            self._release()
+            raise
+
+    async def aclose(self) -> Optional[str]:
+        """
+        aclose releases the connection. It is safe to call aclose multiple times.
+        :return: the last received position_token or None
+        """
+        if not self._closed:
+            self._release()
+            self._logger.info("last position_token: {}".format(self.last_position_token))
+        return self.last_position_token
+
+    def _start_watchdog(self):
+        """
+        _start_watchdog schedules the graceful period and the deadline of the timer on the event loop. At the deadline,
+        a pending read fails, so that the stream times out on time even if no message arrives.
+        """
+        if self._timeout is None or self._timer.expired:
+            return
+        remaining = self._timer.remaining()
+
+        def expire():
+            self._timer.expire()
+            if self._response is not None:
+                self._response.content.set_exception(_Timer.ErrTimerUp())
+
+        loop = asyncio.get_running_loop()
+        self._watchdog = [loop.call_later(max(remaining - _min_reasonable_timeout, 0), self._timer.grace),
+                          loop.call_later(max(remaining, 0), expire)]
+
+    def _release(self):
+        self._closed = True
+        for handle in self._watchdog:
+            handle.cancel()
+        if self._response is not None:
+            self._response.close()
+
+    async def _connect(self):
+        if self._response is not None:
+            return
+        if self._timeout is not None and self._timeout < _min_reasonable_timeout and self._graceful_timeout:
+            self._logger.warning("timeout of {}s might be too low to gracefully time out; "
+                                 "recommended values are > {}s".format(self._timeout, _min_reasonable_timeout))
+        self._logger.debug("attempting to connect to {}".format(self._client.base_url))
+
+        self._timer = _Timer(self._timeout, watchdog=False)
+        self._start_watchdog()
+        session = await self._client._get_session()
+        headers = {'Authorization': 'Bearer {0}'.format(self._client.token)}
+        self._response = await session.get(self._client.base_url, params=self._params, headers=headers)
+        if self._response.status == http.HTTPStatus.UNAUTHORIZED:
+            body = await self._response.json(content_type=None)
+            self._release()
+            raise ErrInvalidToken(body)
+        # a gzip Content-Encoding is decoded by aiohttp, a gzip body is decoded by _GzipLines
+        self._reader = self._response.content
+        if self._params is not None and self._params.get(_COMPRESSION_KEY) == Compression.GZIP:
+            self._reader = _GzipLines(self._response.content)
+        self._logger.debug("connection established")
+
+    async def _next_message(self) -> Message:
+        if self._stop_reason is not None:
+            self._logger.info("{} timeout after {}s".format(self._stop_reason, self._timer.elapsed()))
+            raise StopAsyncIteration
+
+        decode = self._client.decoder.decode
+        while True:
+            if self._timer.expired:
+                self._logger.info("hard timeout after {}s".format(self._timer.elapsed()))
+                raise StopAsyncIteration
+            try:
+                line = await self._reader.readline()
+            except _Timer.ErrTimerUp:
+                self._logger.info("hard timeout after {}s".format(self._timer.elapsed()))
+                raise StopAsyncIteration
+            if line == b"":
+                self._release()
+                raise ErrServerDisconnected
+
+            line = line.strip()
+            if not line:
+                continue
+            key, payload = decode(line)
+            if key == _MessageKey.TARGET.value:
+                return Message(key, payload)
+            if key == _MessageKey.POSITION_TOKEN.value:
+                self.last_position_token = payload
+                self._logger.debug("position_token: {}".format(payload))
+                if self._graceful_timeout and self._timer.graceful:
+                    self._stop_reason = "graceful"
+                return Message(key, payload)
+            if key == _MessageKey.STATUS.value:
+                log_level = _STATUS_LEVELS_MAP[payload[_StatusFields.LEVEL.value]]
+                self._logger.log(log_level, "status at {}: {}".format(payload[_StatusFields.TIMESTAMP.value],
+                                                                       payload[_StatusFields.MESSAGE.value]))
+                return Message(key, payload)
+            self._logger.error("unprocessable message: {}".format(line.decode('utf-8', errors='replace')))
+
+
+class AsyncClient(object):
+    """
+    AsyncClient contains the Airsafe streaming client configuration and is used to call stream().
+    It owns an aiohttp session that is shared by all of its streams, and should be closed with close() or used as
+    an async context manager.
+    """
+
+    def __init__(self, token: str, logger: Optional[logging.Logger] = None, base_url: str = _STREAM_V2_URL,
+                 decoder: Optional[Decoder] = None, session: Optional[aiohttp.ClientSession] = None):
+        """
+
+        :param token: The customer token, issued by the Spire sales team
+        :param logger: The custom logger that is used to log debug statements, infos, warnings and errors
+        :param base_url: The base url the client will attempt to connect to when stream() is called
+        :param decoder: The Decoder that parses incoming lines, defaults to JSONDecoder
+        :param session: An aiohttp session to use instead of the client's own. It is not closed by close().
+        """
+        self.token: str = token
+        self.logger: logging.Logger = logging.getLogger()
+        self.base_url: str = base_url
+        if logger is not None:
+            self.logger = logger
+        self.decoder: Decoder = JSONDecoder()
+        if decoder is not None:
+            self.decoder = decoder
+
+        self._session: Optional[aiohttp.ClientSession] = session
+        self._owns_session = session is None
+
+    async def __aenter__(self) -> "AsyncClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            # Read-timeout in this context is the wait-time between bytes sent from the server
+            # Keep-alive status messages are sent every 15 seconds if no other messages are available.
+            timeout = aiohttp.ClientTimeout(total=None, connect=_min_reasonable_timeout,
+                                            sock_read=_min_reasonable_timeout)
+            self._session = aiohttp.ClientSession(timeout=timeout)
+        return self._session
+
+    async def close(self):
+        """
+        close closes the client's own aiohttp session
+        """
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def stream(self,
+               config: Optional[StreamConfig] = None,
+               timeout: Optional[float] = None,
+               graceful_timeout: bool = True) -> AsyncStream:
+        """
+        stream returns an AsyncStream over the messages of the stream API. The connection is established on first
+        iteration, or when entering the AsyncStream as a context manager:
+
+            async with client.stream(config=cfg, timeout=300) as s:
+                async for msg in s:
+                    ...
+            last_position_token = s.last_position_token
+
+        Timeouts behave as in Client.stream(): per default the stream does not time out. If a timeout is provided, \
+        the stream attempts to end right after a position token has been yielded. The hard timeout is enforced even \
+        if no messages arrive.
+        Iteration raises ErrServerDisconnected when the server closes the connection, and ErrInvalidToken if the \
+        token is rejected.
+        :param config: A StreamConfig object that defines server-side message filters and restart behavior.
+        :param timeout: The timeout in seconds.
+        :param graceful_timeout: If True, the stream will attempt to end right after a position_token message.
+        :return: an AsyncStream yielding Message tuples
+        """
+        return AsyncStream(self, config, timeout, graceful_timeout)
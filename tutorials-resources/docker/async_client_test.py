@@ -0,0 +1,207 @@
+import asyncio
+import gzip
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from async_client import AsyncClient, Message
+from client import ErrInvalidToken, ErrServerDisconnected, StreamConfig, ContinueFromPositionToken, Compression
+
+
+class StreamServer(object):
+    """
+    StreamServer serves the given lines on /v2/targets/stream, and optionally keeps the connection open until the
+    server is closed. If compressed, every line is a gzip member of the body, written in chunks of 7 bytes.
+    """
+
+    def __init__(self, lines, status=200, hang=False, compressed=False):
+        self.lines = lines
+        self.status = status
+        self.hang = hang
+        self.compressed = compressed
+        self.params = None
+        self.server = None
+        self._closing = None
+
+    async def handle(self, request):
+        self.params = dict(request.query)
+        if self.status != 200:
+            return web.json_response({}, status=self.status)
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for line in self.lines:
+            data = line.encode("utf-8") + b"\n"
+            if not self.compressed:
+                await response.write(data)
+                continue
+            data = gzip.compress(data)
+            for i in range(0, len(data), 7):
+                await response.write(data[i:i + 7])
+        if self.hang:
+            await self._closing.wait()
+        return response
+
+    async def __aenter__(self):
+        self._closing = asyncio.Event()
+        app = web.Application()
+        app.router.add_get("/v2/targets/stream", self.handle)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        # the hanging handlers return first, the server waits for them on close
+        self._closing.set()
+        await self.server.close()
+
+    def url(self):
+        return str(self.server.make_url("/v2/targets/stream"))
+
+
+class TestAsyncClient(object):
+
+    def test_stream_messages(self):
+        """
+        test_stream_messages tests that all messages are yielded in order, that the config is sent as query
+        parameters, and that a server disconnect is raised
+        """
+
+        async def run():
+            lines = ['{"target":{"icao_address": "ADB984"}}',
+                     '{"position_token":"the=token=="}',
+                     '{"status":{"timestamp":"2020-09-07T16:33:10Z","level":"INFO","message":"hi","code":100}}']
+            async with StreamServer(lines) as server:
+                async with AsyncClient("token", base_url=server.url()) as c:
+                    cfg = StreamConfig()
+                    cfg.add(ContinueFromPositionToken("BEGINNING"))
+                    messages = []
+                    s = c.stream(config=cfg)
+                    try:
+                        async for msg in s:
+                            messages.append(msg)
+                        assert False  # expected behavior is not to arrive here
+                    except ErrServerDisconnected:
+                        pass
+                    return messages, s.last_position_token, server.params
+
+        messages, token, params = asyncio.run(run())
+        assert messages == [Message("target", {"icao_address": "ADB984"}),
+                            Message("position_token", "the=token=="),
+                            Message("status", {"timestamp": "2020-09-07T16:33:10Z", "level": "INFO", "message": "hi",
+                                               "code": 100})]
+        assert token == "the=token=="
+        assert params == {"position_token": "BEGINNING"}
+
+    def test_stream_gzip(self):
+        """
+        test_stream_gzip tests that gzip compressed bodies are decompressed as they arrive, also across gzip members
+        and chunks, and that uncompressed bodies are passed through
+        """
+
+        async def run(compressed):
+            lines = ['{"target":{"icao_address": "ADB984"}}',
+                     '{"position_token":"the=token=="}',
+                     '{"target":{"icao_address": "ADB985"}}']
+            async with StreamServer(lines, compressed=compressed) as server:
+                async with AsyncClient("token", base_url=server.url()) as c:
+                    cfg = StreamConfig()
+                    cfg.add(Compression(Compression.GZIP))
+                    messages = []
+                    try:
+                        async for msg in c.stream(config=cfg):
+                            messages.append(msg)
+                    except ErrServerDisconnected:
+                        pass
+                    return messages, server.params
+
+        for compressed in [True, False]:
+            messages, params = asyncio.run(run(compressed))
+            assert messages == [Message("target", {"icao_address": "ADB984"}),
+                                Message("position_token", "the=token=="),
+                                Message("target", {"icao_address": "ADB985"})]
+            assert params == {"compression": "gzip"}
+
+    def test_stream_unauthorized(self):
+        """
+        test_stream_unauthorized tests that unauthorized requests are handled correctly
+        """
+
+        async def run():
+            async with StreamServer([], status=401) as server:
+                async with AsyncClient("INVALID_TOKEN", base_url=server.url()) as c:
+                    try:
+                        async for _ in c.stream():
+                            pass
+                    except ErrInvalidToken:
+                        return True
+            return False
+
+        assert asyncio.run(run())
+
+    def test_stream_graceful_timeout(self):
+        """
+        test_stream_graceful_timeout tests that the stream ends right after a position token when the timeout is near
+        """
+
+        async def run():
+            lines = ['{"target":{"icao_address": "ADB984"}}',
+                     '{"position_token":"the=token=="}',
+                     '{"target":{"icao_address": "ADB985"}}']
+            async with StreamServer(lines, hang=True) as server:
+                async with AsyncClient("token", base_url=server.url()) as c:
+                    async with c.stream(timeout=10) as s:
+                        messages = [msg async for msg in s]
+                    return messages, s.last_position_token
+
+        messages, token = asyncio.run(run())
+        assert [m.key for m in messages] == ["target", "position_token"]
+        assert token == "the=token=="
+
+    def test_stream_hard_timeout_silent_stream(self):
+        """
+        test_stream_hard_timeout_silent_stream tests that the hard timeout fires even when no messages arrive
+        """
+
+        async def run():
+            lines = ['{"position_token":"the=token=="}']
+            async with StreamServer(lines, hang=True) as server:
+                async with AsyncClient("token", base_url=server.url()) as c:
+                    start = time.perf_counter()
+                    s = c.stream(timeout=0.5, graceful_timeout=False)
+                    messages = [msg async for msg in s]
+                    return messages, await s.aclose(), time.perf_counter() - start
+
+        messages, token, elapsed = asyncio.run(run())
+        assert len(messages) == 1
+        assert token == "the=token=="
+        assert elapsed < 5
+
+    def test_stream_cancellation(self):
+        """
+        test_stream_cancellation tests that cancelling the consuming task releases the connection and keeps the last
+        position token
+        """
+
+        async def run():
+            lines = ['{"position_token":"the=token=="}']
+            async with StreamServer(lines, hang=True) as server:
+                async with AsyncClient("token", base_url=server.url()) as c:
+                    s = c.stream()
+
+                    async def consume():
+                        async for _ in s:
+                            pass
+
+                    task = asyncio.ensure_future(consume())
+                    await asyncio.sleep(0.2)
+                    task.cancel()
+                    try:
+                        await task
+                    except asyncio.CancelledError:
+                        pass
+                    return s._response.closed, await s.aclose()
+
+        closed, token = asyncio.run(run())
+        assert closed
+        assert token == "the=token=="
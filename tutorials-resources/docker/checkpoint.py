@@ -0,0 +1,312 @@
+"""
+checkpoint keeps the last position token of a stream, so that a restarted consumer continues where the previous one
+stopped. A CheckpointStore is the position_token_callback of Client.stream:
+
+    store = FileCheckpointStore(path.join(HOME, "position_tokens"))
+    token = store.load()
+    ...
+    c.stream_forever(on_target, position_token_callback=store, config=cfg)
+    store.close()
+
+Tokens are written by a background thread, so that a slow disk or bucket never holds up the stream. Tokens that
+arrive while a write is in flight, or within min_interval seconds of the previous write, are coalesced: only the
+latest one is written. flush() and close() write the latest token right away.
+"""
+
+import logging
+import os
+import threading
+import time
+from abc import ABC as _ABC, abstractmethod as _abstractmethod
+from glob import glob
+from os import path
+from typing import Optional, Dict, List
+
+_DEFAULT_MIN_INTERVAL = 1.0
+_TOKEN_FILE = "token.txt"
+# _LEGACY_PATTERN matches the timestamped token files that earlier versions of main.py wrote
+_LEGACY_PATTERN = "token.*.txt"
+
+
+class CheckpointStore(_ABC):
+    """
+    CheckpointStore reads and writes the last position token of a stream. Backends implement read() and write(),
+    which are called synchronously; save() (or calling the store) hands a token to the background writer and returns
+    right away. It is thread-safe, so that concurrent streams can share it.
+    """
+
+    def __init__(self, min_interval: float = _DEFAULT_MIN_INTERVAL, logger: Optional[logging.Logger] = None):
+        """
+
+        :param min_interval: The minimum number of seconds between two writes, the tokens in between are coalesced
+        :param logger: The logger that write errors are logged to
+        """
+        self.min_interval: float = min_interval
+        self.logger: logging.Logger = logger if logger is not None else logging.getLogger()
+        self.saves: int = 0
+        self.writes: int = 0
+        self.errors: int = 0
+        self.last_written: Optional[str] = None
+        self._cond = threading.Condition()
+        self._pending: Optional[str] = None
+        self._writing: bool = False
+        self._urgent: bool = False
+        self._closed: bool = False
+        self._last_write: float = -float("inf")
+        self._writer: Optional[threading.Thread] = None
+
+    @_abstractmethod
+    def read(self) -> Optional[str]:
+        """
+        read returns the stored position token, or None if there is none
+        """
+        pass
+
+    @_abstractmethod
+    def write(self, token: str):
+        """
+        write stores a position token, durably once it returns
+        """
+        pass
+
+    def load(self) -> Optional[str]:
+        """
+        load reads the stored position token. If the previous disconnect was not right after the transmission of the
+        stored position_token duplicate delivery of some target updates is likely.
+        :return: The position token as a string, or None if no token was found or it could not be read
+        """
+        try:
+            token = self.read()
+        except Exception as e:
+            self.logger.warning("could not get last position_token: {}".format(e))
+            return None
+        if token is None:
+            self.logger.warning("could not get last position_token: no position token found")
+        return token
+
+    def save(self, token: Optional[str]):
+        """
+        save hands a position token to the background writer. It does not wait for the write, and replaces a token
+        that has not been written yet. None is ignored, e.g. the result of a stream that received no token.
+        """
+        if token is None:
+            return
+        with self._cond:
+            if self._closed:
+                raise ValueError("checkpoint store is closed")
+            self._pending = token
+            self.saves += 1
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+                self._writer.start()
+            self._cond.notify_all()
+
+    __call__ = save
+
+    def _next(self) -> Optional[str]:
+        """
+        _next waits for the next token to write, or returns None once the store is closed and all tokens are written
+        """
+        with self._cond:
+            while True:
+                if self._pending is None:
+                    if self._closed:
+                        return None
+                    self._cond.wait()
+                    continue
+                delay = self._last_write + self.min_interval - time.monotonic()
+                if delay > 0 and not (self._urgent or self._closed):
+                    self._cond.wait(delay)
+                    continue
+                token, self._pending = self._pending, None
+                self._writing = True
+                return token
+
+    def _run(self):
+        while True:
+            token = self._next()
+            if token is None:
+                return
+            error = None
+            try:
+                self.write(token)
+            except Exception as e:
+                # the token is not retried, the next one is written at the next interval
+                error = e
+                self.logger.error("might not have succeeded writing last position_token: {}".format(e))
+            with self._cond:
+                self._writing = False
+                self._last_write = time.monotonic()
+                if error is None:
+                    self.writes += 1
+                    self.last_written = token
+                    self.logger.debug("updated last position_token to {}".format(token))
+                else:
+                    self.errors += 1
+                self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        flush writes the latest token right away, and waits for the write
+        :param timeout: The maximum number of seconds to wait, forever if None
+        :return: flush returns False if the write did not complete within the timeout
+        """
+        with self._cond:
+            self._urgent = True
+            self._cond.notify_all()
+            done = self._cond.wait_for(lambda: self._pending is None and not self._writing, timeout)
+            self._urgent = False
+            return done
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        close writes the latest token and stops the background writer, e.g. before the process or function exits.
+        It is safe to call close multiple times.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            writer = self._writer
+        if writer is not None:
+            writer.join(timeout)
+
+    def __enter__(self) -> "CheckpointStore":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class MemoryCheckpointStore(CheckpointStore):
+    """
+    MemoryCheckpointStore keeps the token in memory, e.g. for tests, or for streams that need not survive a restart
+    """
+
+    def __init__(self, token: Optional[str] = None, min_interval: float = _DEFAULT_MIN_INTERVAL,
+                 logger: Optional[logging.Logger] = None):
+        super().__init__(min_interval, logger)
+        self.token: Optional[str] = token
+        # tokens lists every written token, in order
+        self.tokens: List[str] = []
+
+    def read(self) -> Optional[str]:
+        return self.token
+
+    def write(self, token: str):
+        self.token = token
+        self.tokens.append(token)
+
+
+class FileCheckpointStore(CheckpointStore):
+    """
+    FileCheckpointStore keeps the token in a file in a directory. The token is written to a temporary file, which is
+    synced and renamed over the previous token, so that an interrupted write leaves the previous token in place.
+    The timestamped token files of earlier versions of main.py are read if there is no token file yet.
+    """
+
+    def __init__(self, directory: str, min_interval: float = _DEFAULT_MIN_INTERVAL,
+                 logger: Optional[logging.Logger] = None):
+        """
+
+        :param directory: The directory of the token file, created if it does not exist
+        """
+        super().__init__(min_interval, logger)
+        self.directory: str = directory
+        self.path: str = path.join(directory, _TOKEN_FILE)
+        os.makedirs(directory, exist_ok=True)
+
+    def read(self) -> Optional[str]:
+        try:
+            with open(self.path, "r") as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+        legacy = [p for p in glob(path.join(self.directory, _LEGACY_PATTERN)) if p != self.path]
+        if not legacy:
+            return None
+        with open(max(legacy, key=_legacy_time), "r") as f:
+            return f.read()
+
+    def write(self, token: str):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(token)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        _fsync_directory(self.directory)
+
+
+def _legacy_time(token_file: str) -> float:
+    try:
+        return float(path.basename(token_file)[len("token."):-len(".txt")])
+    except ValueError:
+        return -1.0
+
+
+def _fsync_directory(directory: str):
+    """
+    _fsync_directory makes a rename in the directory durable, where directories can be synced
+    """
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class S3CheckpointStore(CheckpointStore):
+    """
+    S3CheckpointStore keeps the token in an S3 object. A put is atomic: a reader gets the previous or the new token.
+    """
+
+    def __init__(self, s3, bucket: str, key: str, min_interval: float = _DEFAULT_MIN_INTERVAL,
+                 logger: Optional[logging.Logger] = None):
+        """
+
+        :param s3: The S3 client, e.g. boto3.client('s3')
+        :param bucket: The bucket of the token object
+        :param key: The key of the token object
+        """
+        super().__init__(min_interval, logger)
+        self.s3 = s3
+        self.bucket: str = bucket
+        self.key: str = key
+
+    def read(self) -> Optional[str]:
+        response: Dict = self.s3.get_object(Bucket=self.bucket, Key=self.key)
+        return response['Body'].read().decode('UTF-8')
+
+    def write(self, token: str):
+        self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=token, ContentType="text/plain")
+
+
+class GCSCheckpointStore(CheckpointStore):
+    """
+    GCSCheckpointStore keeps the token in a Google Cloud Storage blob. An upload is atomic: a reader gets the previous
+    or the new token.
+    """
+
+    def __init__(self, storage_client, bucket: str, key: str, min_interval: float = _DEFAULT_MIN_INTERVAL,
+                 logger: Optional[logging.Logger] = None):
+        """
+
+        :param storage_client: The Cloud Storage client, e.g. google.cloud.storage.Client()
+        :param bucket: The bucket of the token blob
+        :param key: The name of the token blob
+        """
+        super().__init__(min_interval, logger)
+        self.storage_client = storage_client
+        self.bucket: str = bucket
+        self.key: str = key
+
+    def read(self) -> Optional[str]:
+        blob = self.storage_client.bucket(self.bucket).get_blob(self.key)
+        if blob is None:
+            return None
+        return blob.download_as_string().decode("UTF-8")
+
+    def write(self, token: str):
+        self.storage_client.bucket(self.bucket).blob(self.key).upload_from_string(token, content_type="text/plain")
@@ -0,0 +1,179 @@
+import io
+import os
+import tempfile
+import threading
+import time
+from enum import Enum
+
+from checkpoint import CheckpointStore, MemoryCheckpointStore, FileCheckpointStore, S3CheckpointStore, \
+    GCSCheckpointStore
+
+
+class T(Enum):
+    args = 0
+    want = 1
+    err = 2
+
+
+class S3(object):
+    """
+    S3 is a stand-in for the get_object and put_object calls of a boto3 S3 client
+    """
+
+    def __init__(self):
+        self.objects = {}
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise KeyError(Key)
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)].encode())}
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        self.objects[(Bucket, Key)] = Body
+
+
+class Storage(object):
+    """
+    Storage is a stand-in for the bucket and blob calls of a google.cloud.storage client
+    """
+
+    class Blob(object):
+        def __init__(self, blobs, name):
+            self.blobs = blobs
+            self.name = name
+
+        def download_as_string(self) -> bytes:
+            return self.blobs[self.name].encode()
+
+        def upload_from_string(self, data, content_type):
+            self.blobs[self.name] = data
+
+    class Bucket(object):
+        def __init__(self, blobs):
+            self.blobs = blobs
+
+        def blob(self, name):
+            return Storage.Blob(self.blobs, name)
+
+        def get_blob(self, name):
+            return Storage.Blob(self.blobs, name) if name in self.blobs else None
+
+    def __init__(self):
+        self.buckets = {}
+
+    def bucket(self, name):
+        return Storage.Bucket(self.buckets.setdefault(name, {}))
+
+
+class Blocking(MemoryCheckpointStore):
+    """
+    Blocking is a store whose writes wait until they are released, or fail if fail is set
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.release = threading.Event()
+        self.fail = False
+
+    def write(self, token: str):
+        self.release.wait()
+        if self.fail:
+            raise OSError("disk full")
+        super().write(token)
+
+
+class TestCheckpointStore(object):
+
+    def test_backends(self):
+        """
+        test_backends tests that every backend reads back the latest saved token, and nothing before the first
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            s3, storage = S3(), Storage()
+            tests = [
+                {
+                    T.args: lambda: MemoryCheckpointStore(),
+                }, {
+                    T.args: lambda: FileCheckpointStore(os.path.join(directory, "tokens")),
+                }, {
+                    T.args: lambda: S3CheckpointStore(s3, "bucket", "last_position_token"),
+                }, {
+                    T.args: lambda: GCSCheckpointStore(storage, "bucket", "last_position_token"),
+                }
+            ]
+
+            for test in tests:
+                store = test[T.args]()
+                assert store.load() is None
+                for token in ["token1", "token2", "token3"]:
+                    store.save(token)
+                store.close()
+                assert store.read() == "token3"
+                if not isinstance(store, MemoryCheckpointStore):
+                    assert test[T.args]().load() == "token3"
+
+            assert os.listdir(os.path.join(directory, "tokens")) == ["token.txt"]
+
+    def test_file_legacy(self):
+        """
+        test_file_legacy tests that the newest timestamped token of earlier versions is read until a token is saved
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            for name, token in [("token.9.5.txt", "old"), ("token.10.25.txt", "newest"), ("token.0.txt", "partial")]:
+                with open(os.path.join(directory, name), "w") as f:
+                    f.write(token)
+
+            store = FileCheckpointStore(directory)
+            assert store.load() == "newest"
+            store.save("token1")
+            store.close()
+            assert store.load() == "token1"
+
+    def test_coalesce(self):
+        """
+        test_coalesce tests that tokens within min_interval of the last write are coalesced into one write of the
+        latest token, and that flush and close write right away
+        """
+        store = MemoryCheckpointStore(min_interval=60)
+        store.save("token1")
+        assert store.flush(5)
+        for token in ["token2", "token3", "token4"]:
+            store(token)
+        time.sleep(0.05)
+        assert store.tokens == ["token1"]
+        assert store.flush(5)
+        store.save("token5")
+        store.save(None)
+        store.close()
+
+        assert store.tokens == ["token1", "token4", "token5"]
+        assert (store.saves, store.writes, store.last_written) == (5, 3, "token5")
+        try:
+            store.save("token6")
+            assert False  # expected behavior is not to arrive here
+        except ValueError:
+            pass
+
+    def test_nonblocking(self):
+        """
+        test_nonblocking tests that save does not wait for a slow write, and that a failed write is counted and
+        followed by the next token
+        """
+        store = Blocking(min_interval=0)
+        store.save("token0")
+        assert not store.flush(0.05)  # the write of token0 is in flight
+        start = time.perf_counter()
+        for i in range(1, 1000):
+            store.save("token{}".format(i))
+        assert time.perf_counter() - start < 1
+
+        store.fail = True
+        store.release.set()
+        assert store.flush(5)
+        assert store.errors == 2 and store.tokens == []  # token0, and token999 for all the others
+
+        store.fail = False
+        store.save("token1000")
+        store.close()
+        assert store.tokens == ["token1000"]
+        assert isinstance(store, CheckpointStore)
@@ -0,0 +1,200 @@
+"""
+columnar builds columnar batches of target updates, so that vectorized consumers (NumPy, pandas, Arrow) do not
+need to convert lists of dicts with pd.DataFrame(data).
+
+ColumnarBuilder appends target updates into preallocated per-column buffers following a fixed schema, and converts
+every column with a single NumPy call once the batch is complete. It plugs into the batching of Client.stream:
+
+    def on_batch(batch: ColumnarBatch):
+        df = batch.to_pandas()  # or batch.to_arrow(), or batch.columns["latitude"]
+
+    c.stream(None, target_batch_callback=on_batch, batch_builder=ColumnarBuilder, batch_size=10000)
+
+pandas is only needed for to_pandas(), and pyarrow only for to_arrow().
+"""
+
+from enum import Enum
+from typing import Dict, List, Tuple, Any, Sequence
+
+import numpy as np
+
+from client import BatchBuilder
+
+try:
+    import pyarrow as _pa
+except ImportError:
+    _pa = None
+
+
+class ColumnType(Enum):
+    """
+    ColumnType is the type of a column of a ColumnarBatch. Missing values are NaN (FLOAT), None (STRING), NaT
+    (TIMESTAMP) and False (BOOL), and are marked in ColumnarBatch.valid for all types.
+    """
+    FLOAT = "float"  # float64
+    BOOL = "bool"  # bool
+    STRING = "string"  # object array of str
+    TIMESTAMP = "timestamp"  # datetime64[ms], UTC
+
+
+# AIRSAFE_SCHEMA describes the fields of target updates, in the order of the API documentation
+AIRSAFE_SCHEMA: Tuple[Tuple[str, ColumnType], ...] = (
+    ("icao_address", ColumnType.STRING),
+    ("timestamp", ColumnType.TIMESTAMP),
+    ("latitude", ColumnType.FLOAT),
+    ("longitude", ColumnType.FLOAT),
+    ("altitude_baro", ColumnType.FLOAT),
+    ("heading", ColumnType.FLOAT),
+    ("vertical_rate", ColumnType.FLOAT),
+    ("on_ground", ColumnType.BOOL),
+    ("callsign", ColumnType.STRING),
+    ("tail_number", ColumnType.STRING),
+    ("collection_type", ColumnType.STRING),
+    ("flight_number", ColumnType.STRING),
+    ("ingestion_time", ColumnType.TIMESTAMP),
+    ("speed", ColumnType.FLOAT),
+    ("squawk", ColumnType.STRING),
+    ("aircraft_type_icao", ColumnType.STRING),
+    ("aircraft_type_name", ColumnType.STRING),
+    ("airline_iata", ColumnType.STRING),
+    ("airline_name", ColumnType.STRING),
+    ("departure_utc_offset", ColumnType.STRING),
+    ("departure_airport_icao", ColumnType.STRING),
+    ("departure_airport_iata", ColumnType.STRING),
+    ("departure_scheduled_time", ColumnType.TIMESTAMP),
+    ("departure_estimated_time", ColumnType.TIMESTAMP),
+    ("arrival_utc_offset", ColumnType.STRING),
+    ("arrival_airport_icao", ColumnType.STRING),
+    ("arrival_airport_iata", ColumnType.STRING),
+    ("arrival_scheduled_time", ColumnType.TIMESTAMP),
+    ("arrival_estimated_time", ColumnType.TIMESTAMP),
+    ("takeoff_time", ColumnType.TIMESTAMP),
+    ("landing_time", ColumnType.TIMESTAMP),
+    ("source", ColumnType.STRING),
+)
+
+
+def _to_array(values: List, column_type: ColumnType) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    _to_array converts the values of a column buffer
+    :return: the column and its validity mask
+    """
+    if column_type == ColumnType.FLOAT:
+        column = np.array(values, dtype=np.float64)  # None becomes NaN
+        return column, ~np.isnan(column)
+    raw = np.empty(len(values), dtype=object)
+    raw[:] = values
+    valid = np.not_equal(raw, None)
+    if column_type == ColumnType.BOOL:
+        return raw.astype(bool), valid
+    if column_type == ColumnType.TIMESTAMP:
+        # NumPy does not parse the trailing Z of the UTC timestamps of the API, and is slow to parse None
+        column = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[ms]")
+        column[valid] = np.array([v[:-1] if v.endswith("Z") else v for v in values if v is not None],
+                                 dtype="datetime64[ms]")
+        return column, valid
+    return raw, valid
+
+
+class ColumnarBatch(object):
+    """
+    ColumnarBatch is a batch of target updates stored column by column. columns maps the field names of the schema to
+    NumPy arrays of equal length, valid maps them to boolean masks that are False where a target update did not
+    contain the field.
+    """
+
+    def __init__(self, schema: Sequence[Tuple[str, ColumnType]], columns: Dict[str, np.ndarray],
+                 valid: Dict[str, np.ndarray]):
+        self.schema = tuple(schema)
+        self.columns = columns
+        self.valid = valid
+
+    def __len__(self) -> int:
+        if not self.schema:
+            return 0
+        return len(self.columns[self.schema[0][0]])
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def select(self, mask: np.ndarray) -> "ColumnarBatch":
+        """
+        select returns a batch of the target updates where mask is True
+        """
+        return ColumnarBatch(self.schema, {name: column[mask] for name, column in self.columns.items()},
+                             {name: valid[mask] for name, valid in self.valid.items()})
+
+    def to_pandas(self):
+        """
+        to_pandas converts the batch into a pandas DataFrame. Timestamps become timezone aware (UTC), missing
+        booleans become pd.NA.
+        """
+        import pandas as pd
+
+        data = {}
+        for name, column_type in self.schema:
+            column = self.columns[name]
+            if column_type == ColumnType.BOOL:
+                column = pd.arrays.BooleanArray(column, ~self.valid[name])
+            elif column_type == ColumnType.TIMESTAMP:
+                column = pd.DatetimeIndex(column).tz_localize("UTC")
+            data[name] = column
+        return pd.DataFrame(data, columns=[name for name, _ in self.schema])
+
+    def to_arrow(self):
+        """
+        to_arrow converts the batch into a pyarrow RecordBatch, with nulls for missing values
+        """
+        if _pa is None:
+            raise ImportError("to_arrow requires pyarrow")
+        arrow_types = {
+            ColumnType.FLOAT: _pa.float64(),
+            ColumnType.BOOL: _pa.bool_(),
+            ColumnType.STRING: _pa.string(),
+            ColumnType.TIMESTAMP: _pa.timestamp("ms", tz="UTC"),
+        }
+        arrays = [_pa.array(self.columns[name], type=arrow_types[column_type], mask=~self.valid[name])
+                  for name, column_type in self.schema]
+        return _pa.RecordBatch.from_arrays(arrays, names=[name for name, _ in self.schema])
+
+
+class ColumnarBuilder(BatchBuilder):
+    """
+    ColumnarBuilder builds ColumnarBatch objects from target updates (dicts or target.Target records). Fields that
+    are not part of the schema are ignored.
+    """
+
+    def __init__(self, capacity: int = 500, schema: Sequence[Tuple[str, ColumnType]] = AIRSAFE_SCHEMA):
+        """
+
+        :param capacity: The number of target updates the buffers are preallocated for, they grow if needed
+        :param schema: The (field name, ColumnType) pairs of the columns
+        """
+        self._schema = tuple(schema)
+        self._capacity = max(capacity, 1)
+        self._buffers: List[List[Any]] = [[None] * self._capacity for _ in self._schema]
+        self._fields = [(name, buf) for (name, _), buf in zip(self._schema, self._buffers)]
+        self._n = 0
+
+    def append(self, target_update):
+        i = self._n
+        if i == self._capacity:
+            for buf in self._buffers:
+                buf.extend([None] * self._capacity)
+            self._capacity *= 2
+        get = target_update.get
+        for name, buf in self._fields:
+            buf[i] = get(name)
+        self._n = i + 1
+
+    def __len__(self) -> int:
+        return self._n
+
+    def build(self) -> ColumnarBatch:
+        columns = {}
+        valid = {}
+        for (name, column_type), buf in zip(self._schema, self._buffers):
+            columns[name], valid[name] = _to_array(buf[:self._n], column_type)
+            buf[:self._n] = [None] * self._n  # do not hold on to the values of delivered batches
+        self._n = 0
+        return ColumnarBatch(self._schema, columns, valid)
@@ -0,0 +1,157 @@
+from enum import Enum
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import responses
+
+from client import Client, ErrServerDisconnected, _STREAM_V2_URL
+from columnar import ColumnarBuilder, ColumnarBatch, ColumnType, AIRSAFE_SCHEMA
+from target import Target
+
+
+class T(Enum):
+    args = 0
+    want = 1
+    err = 2
+
+
+_SCHEMA = (("icao_address", ColumnType.STRING),
+           ("timestamp", ColumnType.TIMESTAMP),
+           ("latitude", ColumnType.FLOAT),
+           ("on_ground", ColumnType.BOOL))
+
+_TARGETS = [{"icao_address": "780A3F", "timestamp": "2021-03-20T12:00:09.753Z", "latitude": 31.19,
+             "on_ground": True, "airline_iata": "MU"},
+            {"icao_address": "ADB984", "latitude": 33},
+            {"icao_address": "780A40", "timestamp": "2021-03-20T12:00:08Z", "on_ground": False}]
+
+
+class TestColumnarBuilder(object):
+
+    def test_build(self):
+        """
+        test_build tests that target updates are converted into typed columns with validity masks, also when the
+        buffers have to grow
+        """
+        for capacity in [1, 3, 100]:
+            b = ColumnarBuilder(capacity, schema=_SCHEMA)
+            for t in _TARGETS:
+                b.append(t)
+            assert len(b) == 3
+
+            batch = b.build()
+            assert len(b) == 0
+            assert len(batch) == 3
+            assert list(batch.columns["icao_address"]) == ["780A3F", "ADB984", "780A40"]
+            assert batch["timestamp"].dtype == np.dtype("datetime64[ms]")
+            assert batch["timestamp"][0] == np.datetime64("2021-03-20T12:00:09.753")
+            assert np.isnat(batch["timestamp"][1])
+            assert batch["latitude"].dtype == np.float64
+            assert list(batch.valid["latitude"]) == [True, True, False]
+            assert list(batch["on_ground"]) == [True, False, False]
+            assert list(batch.valid["on_ground"]) == [True, False, True]
+
+    def test_timestamps(self):
+        """
+        test_timestamps tests that timestamps are parsed with and without the trailing Z
+        """
+        tests = [
+            {
+                T.args: "2021-03-20T12:00:09.753Z",
+                T.want: np.datetime64("2021-03-20T12:00:09.753")
+            }, {
+                T.args: "2021-03-20T12:00:09.753",
+                T.want: np.datetime64("2021-03-20T12:00:09.753")
+            }, {
+                T.args: "2021-03-20T12:00:08",
+                T.want: np.datetime64("2021-03-20T12:00:08.000")
+            }
+        ]
+
+        for test in tests:
+            b = ColumnarBuilder(1, schema=_SCHEMA)
+            b.append({"timestamp": test[T.args]})
+            assert b.build()["timestamp"][0] == test[T.want]
+
+    def test_build_empty_and_reuse(self):
+        """
+        test_build_empty_and_reuse tests that a builder starts over after build
+        """
+        b = ColumnarBuilder(2)
+        assert len(b.build()) == 0
+
+        for t in _TARGETS:
+            b.append(t)
+        b.build()
+        b.append({"icao_address": "ADB985"})
+        batch = b.build()
+
+        assert list(batch["icao_address"]) == ["ADB985"]
+        assert not batch.valid["latitude"][0]
+        assert [name for name, _ in batch.schema] == [name for name, _ in AIRSAFE_SCHEMA]
+
+    def test_targets(self):
+        """
+        test_targets tests that target.Target records are accepted as well as dicts
+        """
+        b = ColumnarBuilder(schema=_SCHEMA)
+        for t in _TARGETS:
+            b.append(Target.from_dict(t))
+        batch = b.build()
+
+        assert list(batch["icao_address"]) == ["780A3F", "ADB984", "780A40"]
+        assert list(batch.valid["on_ground"]) == [True, False, True]
+
+    def test_to_pandas(self):
+        """
+        test_to_pandas tests the conversion into a DataFrame
+        """
+        b = ColumnarBuilder(schema=_SCHEMA)
+        for t in _TARGETS:
+            b.append(t)
+        df = b.build().to_pandas()
+
+        assert list(df.columns) == ["icao_address", "timestamp", "latitude", "on_ground"]
+        assert df["timestamp"][0] == pd.Timestamp("2021-03-20T12:00:09.753Z")
+        assert pd.isna(df["timestamp"][1])
+        assert pd.isna(df["latitude"][2])
+        assert df["on_ground"][0] and pd.isna(df["on_ground"][1])
+
+    def test_to_arrow(self):
+        """
+        test_to_arrow tests the conversion into a RecordBatch with nulls for missing values
+        """
+        b = ColumnarBuilder(schema=_SCHEMA)
+        for t in _TARGETS:
+            b.append(t)
+        rb = b.build().to_arrow()
+
+        assert isinstance(rb, pa.RecordBatch)
+        assert rb.schema.field("timestamp").type == pa.timestamp("ms", tz="UTC")
+        assert rb.column(0).to_pylist() == ["780A3F", "ADB984", "780A40"]
+        assert rb.column(2).to_pylist() == [31.19, 33.0, None]
+        assert rb.column(3).to_pylist() == [True, None, False]
+
+    @responses.activate
+    def test_stream(self):
+        """
+        test_stream tests that Client.stream delivers ColumnarBatch objects with the batch_builder option
+        """
+        responses.add(responses.GET, _STREAM_V2_URL,
+                      body="""{"target":{"icao_address": "ADB981", "latitude": 1.5}}
+{"target":{"icao_address": "ADB982"}}
+{"position_token":"the=token=="}
+{"target":{"icao_address": "ADB983"}}""",
+                      status=200)
+
+        batches = []
+        try:
+            Client("token").stream(None, target_batch_callback=batches.append, batch_builder=ColumnarBuilder)
+            assert False  # expected behavior is not to arrive here
+        except ErrServerDisconnected:
+            pass
+
+        assert all(isinstance(batch, ColumnarBatch) for batch in batches)
+        assert [list(batch["icao_address"]) for batch in batches] == [["ADB981", "ADB982"], ["ADB983"]]
+        assert list(batches[0].valid["latitude"]) == [True, False]
@@ -0,0 +1,123 @@
+import csv
+import gzip
+import io
+import os
+import tempfile
+from datetime import datetime, timedelta
+from enum import Enum
+
+import csv_sink
+from csv_sink import CSVSink
+
+
+class T(Enum):
+    args = 0
+    want = 1
+    err = 2
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = datetime(2021, 5, 21, 12, 0, 0)
+
+    def __call__(self) -> datetime:
+        return self.now
+
+
+def _read(file_path: str):
+    opener = gzip.open if file_path.endswith(".gz") else open
+    with opener(file_path, "rt", newline="") as f:
+        return list(csv.reader(f))
+
+
+class TestCSVSink(object):
+
+    def test_union(self):
+        """
+        test_union tests that the header is the union of the fields in the order they were first seen, and that the
+        rows written before a field appeared are padded, also across the padding chunks
+        """
+        tests = [
+            {
+                T.args: [{"icao_address": "A", "latitude": 1.5}, {"icao_address": "B", "latitude": 2.5}],
+                T.want: [["icao_address", "latitude"], ["A", "1.5"], ["B", "2.5"]]
+            }, {
+                T.args: [{"icao_address": "A"}, {"latitude": 1.5, "icao_address": "B"},
+                         {"icao_address": "C", "callsign": 'quoted, "and"\nmultiline'}, {"icao_address": "D"}],
+                T.want: [["icao_address", "latitude", "callsign"], ["A", "", ""], ["B", "1.5", ""],
+                         ["C", "", 'quoted, "and"\nmultiline'], ["D", "", ""]]
+            }, {
+                T.args: [{"icao_address": str(i)} for i in range(10)] + [{"icao_address": "X", "latitude": 0}],
+                T.want: [["icao_address", "latitude"]] + [[str(i), ""] for i in range(10)] + [["X", "0"]]
+            }
+        ]
+
+        copy_rows = csv_sink._COPY_ROWS
+        csv_sink._COPY_ROWS = 3
+        try:
+            for compress in [False, True]:
+                for test in tests:
+                    with tempfile.TemporaryDirectory() as directory:
+                        with CSVSink(directory, compress=compress) as sink:
+                            sink.write_all(test[T.args])
+                        assert len(sink.files) == 1
+                        assert _read(sink.files[0]) == test[T.want]
+                        assert os.listdir(directory) == [os.path.basename(sink.files[0])]
+        finally:
+            csv_sink._COPY_ROWS = copy_rows
+
+    def test_rotate(self):
+        """
+        test_rotate tests that files are rotated by size, by age and on request, and that every file has its own
+        header
+        """
+        clock = Clock()
+        with tempfile.TemporaryDirectory() as directory:
+            sink = CSVSink(directory, name_format="data_{sequence}_{start}_{end}.csv", max_bytes=1000,
+                           max_seconds=600, clock=clock)
+            # the size is checked after 256 rows, of 6 bytes each
+            sink.write_all({"icao_address": "{:04d}".format(i)} for i in range(256))
+            assert len(sink.files) == 1
+            clock.now += timedelta(seconds=30)
+            sink.write({"icao_address": "A", "latitude": 1.5})
+            assert sink.rotate().endswith("data_1_05_21_2021_12_00_30_05_21_2021_12_00_30.csv")
+            assert sink.rotate() is None
+            # the age is checked after the next 255 rows
+            sink.write_all({"callsign": "C"} for _ in range(254))
+            clock.now += timedelta(seconds=600)
+            sink.write({"callsign": "C"})
+            assert len(sink.files) == 3
+            sink.write({"callsign": "D"})
+            sink.close()
+
+            assert [os.path.basename(f) for f in sink.files] == [
+                "data_0_05_21_2021_12_00_00_05_21_2021_12_00_00.csv",
+                "data_1_05_21_2021_12_00_30_05_21_2021_12_00_30.csv",
+                "data_2_05_21_2021_12_00_30_05_21_2021_12_10_30.csv",
+                "data_3_05_21_2021_12_10_30_05_21_2021_12_10_30.csv",
+            ]
+            assert [len(_read(f)) for f in sink.files] == [257, 2, 256, 2]
+
+            # files with the same name are numbered
+            sink.name_format = "data.csv"
+            for _ in range(2):
+                sink.write({"callsign": "E"})
+                sink.rotate()
+            assert [os.path.basename(f) for f in sink.files[4:]] == ["data.csv", "data-5.csv"]
+            assert _read(sink.files[1]) == [["icao_address", "latitude"], ["A", "1.5"]]
+            assert _read(sink.files[3]) == [["callsign"], ["D"]]
+            assert sink.rows == 256 + 1 + 255 + 1 + 2
+            assert sorted(os.listdir(directory)) == sorted(os.path.basename(f) for f in sink.files)
+
+    def test_memory(self):
+        """
+        test_memory tests that rows are written to disk as they arrive
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            with CSVSink(directory) as sink:
+                for i in range(1000):
+                    sink.write({"icao_address": "{:06d}".format(i)})
+                sink._part.flush()
+                assert os.path.getsize(sink._part_path) == 1000 * len("000000\r\n")
+            with io.open(sink.files[0], newline="") as f:
+                assert f.readline() == "icao_address\r\n"
@@ -0,0 +1,336 @@
+"""
+geofence assigns target updates to the zones (GeoJSON polygons, e.g. airspaces or airports) that contain them.
+
+The zones are rasterized once into a sparse grid. Cells that lie entirely inside a zone answer lookups directly, only
+cells crossed by a zone's boundary need a point-in-polygon test, and that test only visits the edges that cross the
+cell's row. Lookups are available for single positions (zones_at) and for arrays of positions (assign, with numpy).
+
+The bounding box of all zones can be sent to the API to pre-filter target updates on the server side:
+
+    fence = Geofence.from_file("zone.geojson")
+    box = fence.bounding_box()
+    cfg.add(FilterLatitude(box.south, box.north))
+    cfg.add(FilterLongitude(box.west, box.east))
+    c.stream(on_target, config=cfg, predicate=fence)
+
+Coordinates are (longitude, latitude) pairs as in GeoJSON. Polygons that cross the antimeridian must be split into
+parts on either side, as RFC 7946 recommends.
+"""
+
+import json
+import math
+from typing import Optional, Dict, List, Tuple, Any, NamedTuple, Sequence
+
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
+
+# _MAX_CELLS bounds the number of grid cells that the zones may cover, the automatic cell size grows until they fit
+_MAX_CELLS = 250000
+# _CELLS_PER_ZONE is the number of cells across a typical zone with the automatic cell size
+_CELLS_PER_ZONE = 16
+_EPSILON = 1e-9
+
+Ring = List[Tuple[float, float]]
+# _Edge is (x0, y0, y1, dx/dy) of an edge that is not horizontal
+_Edge = Tuple[float, float, float, float]
+
+
+class BoundingBox(NamedTuple):
+    """
+    BoundingBox is the smallest latitude/longitude box around a set of zones. west is greater than east if the box
+    crosses the antimeridian, as for FilterLongitude.
+    """
+    south: float
+    north: float
+    west: float
+    east: float
+
+    def params(self) -> Dict[str, str]:
+        """
+        params returns the box as query parameters of the stream and history APIs
+        """
+        return {"latitude_between": "{},{}".format(self.south, self.north),
+                "longitude_between": "{},{}".format(self.west, self.east)}
+
+
+class Zone(object):
+    """
+    Zone is a named area made of one or more polygons, each given as rings of (longitude, latitude) pairs: the outer
+    ring first, followed by its holes.
+    """
+
+    def __init__(self, name: str, polygons: Sequence[Sequence[Ring]], properties: Optional[Dict[str, Any]] = None):
+        self.name: str = name
+        self.polygons: List[List[Ring]] = [[[(float(x), float(y)) for x, y in ring] for ring in polygon]
+                                           for polygon in polygons]
+        self.properties: Dict[str, Any] = properties if properties is not None else {}
+        points = [p for polygon in self.polygons for ring in polygon for p in ring]
+        if not points:
+            raise ValueError("zone {} has no coordinates".format(name))
+        self.west = min(x for x, _ in points)
+        self.east = max(x for x, _ in points)
+        self.south = min(y for _, y in points)
+        self.north = max(y for _, y in points)
+
+    def edges(self) -> List[Tuple[float, float, float, float]]:
+        """
+        edges returns the edges of all rings as (x0, y0, x1, y1). Inside is where a ray crosses an odd number of them.
+        """
+        edges = []
+        for polygon in self.polygons:
+            for ring in polygon:
+                for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1]):
+                    if (x0, y0) != (x1, y1):
+                        edges.append((x0, y0, x1, y1))
+        return edges
+
+    def __repr__(self) -> str:
+        return "Zone({!r})".format(self.name)
+
+
+def _inside(x: float, y: float, inside: bool, edges: Sequence[_Edge]) -> bool:
+    for x0, y0, y1, dxdy in edges:
+        if (y0 > y) != (y1 > y) and x < x0 + (y - y0) * dxdy:
+            inside = not inside
+    return inside
+
+
+def _inside_array(x, y, inside: bool, edges: Sequence[_Edge]):
+    inside = _np.full(len(x), inside)
+    for x0, y0, y1, dxdy in edges:
+        inside ^= ((y0 > y) != (y1 > y)) & (x < x0 + (y - y0) * dxdy)
+    return inside
+
+
+class Geofence(object):
+    """
+    Geofence is a spatial index of zones. Calling it with a target update returns whether the target update is in
+    any zone, so that it can be used as the predicate of Client.stream.
+    """
+
+    def __init__(self, zones: Sequence[Zone], cell_size: Optional[float] = None):
+        """
+
+        :param zones: The zones to index
+        :param cell_size: The size of the grid cells in degrees, chosen from the size of the zones if None
+        """
+        self.zones: List[Zone] = list(zones)
+        self.cell_size: float = cell_size if cell_size is not None else self._auto_cell_size()
+        self._columns = int(math.ceil(360 / self.cell_size)) + 1
+        # cells are numbered from (-90, -180), so that int() truncates to the cell: lookups and the grid must use the
+        # same arithmetic to agree on positions on cell borders
+        self._scale = 1 / self.cell_size
+        self._names: Tuple[str, ...] = tuple(z.name for z in self.zones)
+        # a cell is (indexes of the zones containing it, their names, (zone index, parity, edges) of the zones crossing
+        # it), see _cell_edges
+        self._cells: Dict[int, Tuple[Tuple[int, ...], Tuple[str, ...],
+                                     Tuple[Tuple[int, bool, Tuple[_Edge, ...]], ...]]] = {}
+        self._build()
+
+    @classmethod
+    def from_geojson(cls, geojson: Dict[str, Any], name_property: str = "name",
+                     cell_size: Optional[float] = None) -> "Geofence":
+        """
+        from_geojson indexes the Polygon and MultiPolygon features of a GeoJSON FeatureCollection or Feature
+        :param geojson: The parsed GeoJSON
+        :param name_property: The feature property that names zones, features without it are named by their index
+        :param cell_size: see Geofence
+        """
+        features = geojson.get("features", [geojson]) if geojson.get("type") != "Feature" else [geojson]
+        zones = []
+        for i, feature in enumerate(features):
+            geometry = feature.get("geometry") or {}
+            properties = feature.get("properties") or {}
+            if geometry.get("type") == "Polygon":
+                polygons = [geometry["coordinates"]]
+            elif geometry.get("type") == "MultiPolygon":
+                polygons = geometry["coordinates"]
+            else:
+                continue
+            zones.append(Zone(str(properties.get(name_property, feature.get("id", i))), polygons, properties))
+        return cls(zones, cell_size)
+
+    @classmethod
+    def from_file(cls, path: str, name_property: str = "name", cell_size: Optional[float] = None) -> "Geofence":
+        """
+        from_file indexes the zones of a GeoJSON file, see from_geojson
+        """
+        with open(path) as f:
+            return cls.from_geojson(json.load(f), name_property, cell_size)
+
+    def _auto_cell_size(self) -> float:
+        if not self.zones:
+            return 1.0
+        extents = sorted(max(z.east - z.west, z.north - z.south) for z in self.zones)
+        cell_size = max(extents[len(extents) // 2] / _CELLS_PER_ZONE, 1e-4)
+        while sum((math.floor(z.east / cell_size) - math.floor(z.west / cell_size) + 1) *
+                  (math.floor(z.north / cell_size) - math.floor(z.south / cell_size) + 1)
+                  for z in self.zones) > _MAX_CELLS:
+            cell_size *= 2
+        return cell_size
+
+    def _column(self, longitude: float) -> int:
+        return int(math.floor((longitude + 180) * self._scale))
+
+    def _row(self, latitude: float) -> int:
+        return int(math.floor((latitude + 90) * self._scale))
+
+    def _build(self):
+        cells: Dict[int, Tuple[List[int], List[Tuple[int, bool, Tuple[_Edge, ...]]]]] = {}
+        cs = self.cell_size
+        for zone_index, zone in enumerate(self.zones):
+            rows: Dict[int, List[Tuple[float, float, float, float]]] = {}
+            boundary: Dict[int, set] = {}
+            for x0, y0, x1, y1 in zone.edges():
+                first_row = self._row(min(y0, y1) - _EPSILON)
+                last_row = self._row(max(y0, y1) + _EPSILON)
+                for row in range(first_row, last_row + 1):
+                    if y0 != y1:
+                        rows.setdefault(row, []).append((x0, y0, x1, y1))
+                    # the part of the edge within the row band marks the cells it passes as boundary cells
+                    band_south, band_north = row * cs - 90, (row + 1) * cs - 90
+                    if y0 == y1:
+                        xs = (x0, x1)
+                    else:
+                        t0 = min(max((band_south - y0) / (y1 - y0), 0.0), 1.0)
+                        t1 = min(max((band_north - y0) / (y1 - y0), 0.0), 1.0)
+                        xs = (x0 + t0 * (x1 - x0), x0 + t1 * (x1 - x0))
+                    boundary.setdefault(row, set()).update(
+                        range(self._column(min(xs) - _EPSILON), self._column(max(xs) + _EPSILON) + 1))
+
+            for row, row_edges in rows.items():
+                row_boundary = boundary.get(row, set())
+                # cells that no edge passes are either inside or outside as a whole, the centre decides
+                center_y = (row + 0.5) * cs - 90
+                crossings = sorted(x0 + (center_y - y0) * (x1 - x0) / (y1 - y0) for x0, y0, x1, y1 in row_edges
+                                   if (y0 > center_y) != (y1 > center_y))
+                for west, east in zip(crossings[::2], crossings[1::2]):
+                    first_column = int(math.ceil((west + 180) / cs - 0.5))
+                    last_column = int(math.floor((east + 180) / cs - 0.5))
+                    for column in range(first_column, last_column + 1):
+                        if column not in row_boundary:
+                            inside, _ = cells.setdefault(row * self._columns + column, ([], []))
+                            inside.append(zone_index)
+                for column in row_boundary:
+                    _, crossing = cells.setdefault(row * self._columns + column, ([], []))
+                    crossing.append((zone_index,) + self._cell_edges(row, column, row_edges))
+
+        self._cells = {key: (tuple(inside), tuple(self._names[i] for i in inside), tuple(crossing))
+                       for key, (inside, crossing) in cells.items()}
+
+    def _cell_edges(self, row: int, column: int,
+                    row_edges: List[Tuple[float, float, float, float]]) -> Tuple[bool, Tuple[_Edge, ...]]:
+        """
+        _cell_edges prepares the point-in-polygon test of a boundary cell. A ray from a position in the cell to the
+        east never crosses edges west of the cell, and crosses every edge east of the cell that spans the whole row
+        band: those are reduced to a parity, only the remaining edges are tested per position.
+        :return: the parity and the remaining edges
+        """
+        cs = self.cell_size
+        cell_west, cell_east = column * cs - 180 - _EPSILON, (column + 1) * cs - 180 + _EPSILON
+        band_south, band_north = row * cs - 90 - _EPSILON, (row + 1) * cs - 90 + _EPSILON
+        parity = False
+        edges = []
+        for x0, y0, x1, y1 in row_edges:
+            if max(x0, x1) < cell_west:
+                continue
+            if min(x0, x1) > cell_east and min(y0, y1) < band_south and max(y0, y1) > band_north:
+                parity = not parity
+                continue
+            edges.append((x0, y0, y1, (x1 - x0) / (y1 - y0)))
+        return parity, tuple(edges)
+
+    def zones_at(self, latitude: float, longitude: float) -> Tuple[str, ...]:
+        """
+        zones_at returns the names of the zones that contain a position, in the order of the zones
+        """
+        cell = self._cells.get(int((latitude + 90) * self._scale) * self._columns +
+                               int((longitude + 180) * self._scale))
+        if cell is None:
+            return ()
+        inside, names, crossing = cell
+        if not crossing:
+            return names
+        hits = [i for i, parity, edges in crossing if _inside(longitude, latitude, parity, edges)]
+        if not hits:
+            return names
+        if inside:
+            hits = sorted(inside + tuple(hits))
+        return tuple([self._names[i] for i in hits])
+
+    def contains(self, latitude: float, longitude: float) -> bool:
+        """
+        contains returns whether any zone contains a position
+        """
+        cell = self._cells.get(int((latitude + 90) * self._scale) * self._columns +
+                               int((longitude + 180) * self._scale))
+        if cell is None:
+            return False
+        inside, _, crossing = cell
+        return bool(inside) or any(_inside(longitude, latitude, parity, edges) for _, parity, edges in crossing)
+
+    def __call__(self, target_update) -> bool:
+        latitude = target_update.get("latitude")
+        longitude = target_update.get("longitude")
+        if latitude is None or longitude is None:
+            return False
+        return self.contains(latitude, longitude)
+
+    def assign(self, latitudes, longitudes):
+        """
+        assign assigns arrays of positions to zones, e.g. the latitude and longitude columns of a history batch
+        :return: a boolean numpy array with a row per position and a column per zone, True where the zone contains
+        the position. Missing (NaN) positions are in no zone.
+        """
+        if _np is None:
+            raise ImportError("assign requires numpy")
+        latitudes = _np.asarray(latitudes, dtype=_np.float64)
+        longitudes = _np.asarray(longitudes, dtype=_np.float64)
+        result = _np.zeros((len(latitudes), len(self.zones)), dtype=bool)
+        known = _np.flatnonzero(~(_np.isnan(latitudes) | _np.isnan(longitudes)))
+        if len(known) == 0:
+            return result
+        keys = (_np.floor((latitudes[known] + 90) * self._scale).astype(_np.int64) * self._columns +
+                _np.floor((longitudes[known] + 180) * self._scale).astype(_np.int64))
+
+        # positions are grouped by cell, so that every cell is looked up once
+        order = _np.argsort(keys, kind="stable")
+        unique_keys, starts = _np.unique(keys[order], return_index=True)
+        ends = _np.append(starts[1:], len(order))
+        for key, start, end in zip(unique_keys.tolist(), starts, ends):
+            cell = self._cells.get(key)
+            if cell is None:
+                continue
+            inside, _, crossing = cell
+            positions = known[order[start:end]]
+            if inside:
+                result[positions[:, None], inside] = True
+            for zone_index, parity, edges in crossing:
+                result[positions, zone_index] |= _inside_array(longitudes[positions], latitudes[positions], parity,
+                                                               edges)
+        return result
+
+    def bounding_box(self) -> Optional[BoundingBox]:
+        """
+        bounding_box returns the smallest box around all zones, crossing the antimeridian if that is smaller
+        :return: the box, or None if there are no zones
+        """
+        if not self.zones:
+            return None
+        intervals = sorted((z.west, z.east) for z in self.zones)
+        merged = [list(intervals[0])]
+        for west, east in intervals[1:]:
+            if west <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], east)
+            else:
+                merged.append([west, east])
+        # the box leaves out the largest gap between the zones' longitudes, going around the antimeridian or not
+        west, east = merged[0][0], merged[-1][1]
+        largest_gap = 360 - (east - west)
+        for (_, gap_west), (gap_east, _) in zip(merged, merged[1:]):
+            if gap_east - gap_west > largest_gap:
+                largest_gap = gap_east - gap_west
+                west, east = gap_east, gap_west
+        return BoundingBox(min(z.south for z in self.zones), max(z.north for z in self.zones), west, east)
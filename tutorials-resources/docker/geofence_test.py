@@ -0,0 +1,158 @@
+from enum import Enum
+
+import numpy as np
+import responses
+
+from client import Client, ErrServerDisconnected, _STREAM_V2_URL
+from geofence import Geofence, Zone, BoundingBox
+
+
+class T(Enum):
+    args = 0
+    want = 1
+    err = 2
+
+
+def _square(west, south, east, north):
+    return [(west, south), (east, south), (east, north), (west, north), (west, south)]
+
+
+_GEOJSON = {
+    "type": "FeatureCollection",
+    "features": [
+        {
+            "type": "Feature",
+            "properties": {"name": "ring"},
+            "geometry": {"type": "Polygon", "coordinates": [_square(0, 0, 10, 10), _square(4, 4, 6, 6)]}
+        }, {
+            "type": "Feature",
+            "properties": {"name": "islands"},
+            "geometry": {"type": "MultiPolygon", "coordinates": [[_square(5, 5, 12, 7)], [[(20, 0), (25, 5), (20, 5)]]]}
+        }, {
+            "type": "Feature",
+            "properties": {},
+            "geometry": {"type": "Point", "coordinates": [1, 1]}
+        }
+    ]
+}
+
+
+class TestGeofence(object):
+
+    def test_zones_at(self):
+        """
+        test_zones_at tests that positions are assigned to the zones that contain them, with holes, multipolygons and
+        overlapping zones, and with the automatic and explicit cell sizes
+        """
+        tests = [
+            {
+                T.args: (1, 1),
+                T.want: ("ring",)
+            }, {
+                T.args: (5, 5.5),
+                T.want: ("islands",)
+            }, {
+                T.args: (6.5, 8),
+                T.want: ("ring", "islands")
+            }, {
+                T.args: (6.5, 11),
+                T.want: ("islands",)
+            }, {
+                T.args: (4, 22),
+                T.want: ("islands",)
+            }, {
+                T.args: (1, 22),
+                T.want: ()
+            }, {
+                T.args: (-1, 1),
+                T.want: ()
+            }, {
+                T.args: (-45, -170),
+                T.want: ()
+            }
+        ]
+
+        for cell_size in [None, 0.25, 1, 7]:
+            fence = Geofence.from_geojson(_GEOJSON, cell_size=cell_size)
+            assert [z.name for z in fence.zones] == ["ring", "islands"]
+            for test in tests:
+                assert fence.zones_at(*test[T.args]) == test[T.want], (cell_size, test[T.args])
+                assert fence.contains(*test[T.args]) == bool(test[T.want]), (cell_size, test[T.args])
+                latitude, longitude = test[T.args]
+                assert fence({"latitude": latitude, "longitude": longitude}) == bool(test[T.want])
+        assert not Geofence.from_geojson(_GEOJSON)({"icao_address": "780A3F"})
+
+    def test_assign(self):
+        """
+        test_assign tests that arrays of positions are assigned to the same zones as single positions, and missing
+        positions to none
+        """
+        rng = np.random.default_rng(1)
+        latitudes = np.append(rng.uniform(-2, 12, 2000), [np.nan, 3])
+        longitudes = np.append(rng.uniform(-2, 27, 2000), [3, np.nan])
+        fence = Geofence.from_geojson(_GEOJSON)
+
+        result = fence.assign(latitudes, longitudes)
+
+        assert result.shape == (2002, 2)
+        for i in range(2000):
+            want = fence.zones_at(latitudes[i], longitudes[i])
+            assert tuple(z.name for z, hit in zip(fence.zones, result[i]) if hit) == want, i
+        assert not result[2000:].any()
+        assert result.any(axis=0).all()
+
+    def test_bounding_box(self):
+        """
+        test_bounding_box tests that the bounding box is the smallest box around the zones, across the antimeridian
+        if that is smaller
+        """
+        tests = [
+            {
+                T.args: [Zone("a", [[_square(0, 0, 10, 10)]]), Zone("b", [[_square(20, -5, 30, 5)]])],
+                T.want: BoundingBox(-5, 10, 0, 30)
+            }, {
+                T.args: [Zone("a", [[_square(170, 0, 180, 10)]]), Zone("b", [[_square(-180, 0, -175, 5)]])],
+                T.want: BoundingBox(0, 10, 170, -175)
+            }, {
+                T.args: [Zone("a", [[_square(-170, 0, 170, 10)]])],
+                T.want: BoundingBox(0, 10, -170, 170)
+            }, {
+                T.args: [],
+                T.want: None
+            }
+        ]
+
+        for test in tests:
+            assert Geofence(test[T.args]).bounding_box() == test[T.want]
+        assert BoundingBox(0.5, 10, 170, -175).params() == {"latitude_between": "0.5,10",
+                                                              "longitude_between": "170,-175"}
+
+    def test_invalid(self):
+        """
+        test_invalid tests that zones without coordinates are rejected
+        """
+        try:
+            Zone("empty", [[]])
+            assert False  # expected behavior is not to arrive here
+        except ValueError:
+            pass
+
+    @responses.activate
+    def test_stream(self):
+        """
+        test_stream tests that a geofence drops the target updates outside its zones in Client.stream
+        """
+        responses.add(responses.GET, _STREAM_V2_URL,
+                      body="""{"target":{"icao_address": "ADB981", "latitude": 1, "longitude": 1}}
+{"target":{"icao_address": "ADB982", "latitude": 5, "longitude": 4.5}}
+{"target":{"icao_address": "ADB983"}}""",
+                      status=200)
+
+        targets = []
+        try:
+            Client("token").stream(targets.append, predicate=Geofence.from_geojson(_GEOJSON))
+            assert False  # expected behavior is not to arrive here
+        except ErrServerDisconnected:
+            pass
+
+        assert targets == [{"icao_address": "ADB981", "latitude": 1, "longitude": 1}]
@@ -0,0 +1,256 @@
+"""
+history is a client of api.airsafe.spire.com/v2/targets/history for long time windows. A single request is bound by
+one connection; the client splits the window into time slices instead, downloads them concurrently over a bounded
+number of connections, and returns the lines of all slices in timestamp order, as a stream:
+
+    with HistoryClient(token, connections=8) as c:
+        for line in c.lines("2021-05-01T00:00:00Z", "2021-05-08T00:00:00Z", params={"icao_address": "780A4F"}):
+            target_update = json.loads(line)["target"]
+
+Each slice is written to a temporary file as it arrives, and read back once the slices before it have been read, so
+that memory does not grow with the window. A slice that fails is downloaded again on its own, up to retries times,
+while the other slices go on.
+"""
+
+import collections
+import io
+import logging
+import math
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime, timedelta
+from typing import Optional, Dict, List, Tuple, Iterator, Deque
+
+import requests
+import requests.adapters
+
+_HISTORY_V2_URL = "https://api.airsafe.spire.com/v2/targets/history"
+
+_DEFAULT_CONNECTIONS = 4
+_DEFAULT_RETRIES = 3
+_DEFAULT_TIMEOUT = 60
+_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+_TIMESTAMP_PREFIX = b'"timestamp":"'
+# _AHEAD is the number of slices per connection that are downloaded ahead of the slice that is read
+_AHEAD = 2
+
+
+class ErrInvalidToken(Exception):
+    """
+    ErrInvalidToken is raised when the client token is rejected by the history API (status 401)
+    """
+    pass
+
+
+class ErrSliceFailed(Exception):
+    """
+    ErrSliceFailed is raised when a slice could not be downloaded after all retries
+    """
+    pass
+
+
+def _parse_time(timestamp: str) -> datetime:
+    # the fractional seconds are dropped, the slices are aligned on whole seconds
+    return datetime.strptime(timestamp.rstrip("Z").split(".")[0], _TIME_FORMAT)
+
+
+def time_slices(start: str, end: str, slices: int) -> List[Tuple[str, str]]:
+    """
+    time_slices splits the window from start to end (ISO 8601 timestamps in UTC) into up to slices windows of the
+    same number of whole seconds. Consecutive windows share their boundary, as the API includes both start and end;
+    the target updates at a boundary belong to the later window (see HistoryClient.lines).
+    """
+    first, last = _parse_time(start), _parse_time(end)
+    seconds = max(1, math.ceil((last - first).total_seconds() / max(1, slices)))
+    boundaries = [start]
+    boundary = first + timedelta(seconds=seconds)
+    while boundary < last:
+        boundaries.append(boundary.strftime(_TIME_FORMAT) + "Z")
+        boundary += timedelta(seconds=seconds)
+    boundaries.append(end)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _timestamp_key(line: bytes) -> Optional[bytes]:
+    # the timestamp of a line, without parsing it; ISO 8601 timestamps in UTC sort as strings without the "Z"
+    start = line.find(_TIMESTAMP_PREFIX)
+    if start < 0:
+        return None
+    start += len(_TIMESTAMP_PREFIX)
+    return line[start:line.find(b'"', start)].rstrip(b"Z")
+
+
+class HistoryMetrics(object):
+    """
+    HistoryMetrics counts the downloaded slices, their lines and bytes, and the retries of failed slices
+    """
+
+    def __init__(self):
+        self.slices: int = 0
+        self.lines: int = 0
+        self.bytes: int = 0
+        self.retries: int = 0
+        self._lock = threading.Lock()
+
+    def _add(self, lines: int, size: int):
+        with self._lock:
+            self.slices += 1
+            self.lines += lines
+            self.bytes += size
+
+    def _retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def __str__(self):
+        return "slices: {}, lines: {}, bytes: {}, retries: {}".format(self.slices, self.lines, self.bytes,
+                                                                     self.retries)
+
+
+class HistoryClient(object):
+    """
+    HistoryClient downloads time windows of the history API in concurrent time slices, see the module documentation
+    """
+
+    def __init__(self, token: str, logger: Optional[logging.Logger] = None, base_url: str = _HISTORY_V2_URL,
+                 session: Optional[requests.Session] = None, connections: int = _DEFAULT_CONNECTIONS,
+                 retries: int = _DEFAULT_RETRIES, backoff: float = 1.0, timeout: float = _DEFAULT_TIMEOUT):
+        """
+
+        :param token: The customer token, issued by the Spire sales team
+        :param logger: The custom logger that retries and failures are logged to
+        :param base_url: The url of the history endpoint
+        :param session: A requests session to use instead of the client's own; it is not closed by close()
+        :param connections: The number of slices that are downloaded concurrently
+        :param retries: The number of times a failed slice is downloaded again
+        :param backoff: The number of seconds before the first retry of a slice, doubled with every retry
+        :param timeout: The number of seconds without data after which a download fails
+        """
+        self.token: str = token
+        self.logger: logging.Logger = logger if logger is not None else logging.getLogger()
+        self.base_url: str = base_url
+        self.connections: int = max(1, connections)
+        self.retries: int = retries
+        self.backoff: float = backoff
+        self.timeout: float = timeout
+        self._owns_session = session is None
+        self.session: requests.Session = session
+        if session is None:
+            self.session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=self.connections,
+                                                    pool_maxsize=self.connections)
+            self.session.mount("https://", adapter)
+            self.session.mount("http://", adapter)
+        self.metrics: HistoryMetrics = HistoryMetrics()
+
+    def __enter__(self) -> "HistoryClient":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        close closes the connections of the client's own session
+        """
+        if self._owns_session:
+            self.session.close()
+
+    def lines(self, start: str, end: str, params: Optional[Dict[str, str]] = None,
+              slices: Optional[int] = None) -> Iterator[str]:
+        """
+        lines downloads the target updates from start to end in slices, and yields the lines of the responses in
+        timestamp order. The lines of a slice are yielded once it is complete and all slices before it were yielded.
+        Closing the generator stops the downloads.
+        :param start: The start of the window, an ISO 8601 timestamp in UTC
+        :param end: The end of the window, an ISO 8601 timestamp in UTC
+        :param params: The other query parameters of the requests, e.g. the filters
+        :param slices: The number of slices, defaults to the number of connections
+        :raises ErrInvalidToken: The token was rejected
+        :raises ErrSliceFailed: A slice failed after all retries
+        """
+        windows = time_slices(start, end, slices if slices is not None else self.connections)
+        stop = threading.Event()
+        pending: Deque[Future] = collections.deque()
+        executor = ThreadPoolExecutor(max_workers=self.connections, thread_name_prefix="history")
+        submitted = 0
+        try:
+            while pending or submitted < len(windows):
+                while submitted < len(windows) and len(pending) < _AHEAD * self.connections:
+                    window_start, window_end = windows[submitted]
+                    # the target updates at the end of a window are those of the next window
+                    limit = None
+                    if submitted + 1 < len(windows):
+                        limit = window_end.rstrip("Z").encode()
+                    pending.append(executor.submit(self._download, dict(params or {}, start=window_start,
+                                                                        end=window_end), limit, stop))
+                    submitted += 1
+                with io.TextIOWrapper(pending.popleft().result(), encoding="utf-8", newline="\n") as text:
+                    for line in text:
+                        yield line[:-1]
+        finally:
+            stop.set()
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+            for future in pending:
+                if not future.cancelled() and future.exception() is None:
+                    future.result().close()
+
+    def _download(self, params: Dict[str, str], limit: Optional[bytes], stop: threading.Event):
+        """
+        _download writes the lines of a slice to a temporary file, leaving out the target updates at or after limit,
+        and retries the whole slice if it fails
+        :return: _download returns the file, at its start
+        """
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                self.metrics._retry()
+                self.logger.warning("retrying slice {} to {} after: {}".format(params["start"], params["end"], error))
+                if stop.wait(self.backoff * 2 ** (attempt - 1)):
+                    break
+            f = tempfile.TemporaryFile()
+            try:
+                lines = self._write_slice(f, params, limit, stop)
+                self.metrics._add(lines, f.tell())
+                f.seek(0)
+                return f
+            except (requests.RequestException, OSError) as e:
+                f.close()
+                error = e
+                if isinstance(e, requests.HTTPError) and e.response is not None and \
+                        400 <= e.response.status_code < 500 and e.response.status_code != 429:
+                    # the request is rejected, it would be rejected again
+                    break
+            except BaseException:
+                f.close()
+                raise
+        raise ErrSliceFailed("slice {} to {} failed: {}".format(params["start"], params["end"], error)) from error
+
+    def _write_slice(self, f, params: Dict[str, str], limit: Optional[bytes], stop: threading.Event) -> int:
+        lines = 0
+        with self.session.get(self.base_url, params=params, headers={"Authorization": "Bearer {}".format(self.token)},
+                              stream=True, timeout=self.timeout) as response:
+            if response.status_code == 401:
+                raise ErrInvalidToken()
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if stop.is_set():
+                    raise ErrSliceFailed("stopped")
+                if not line:
+                    continue
+                if limit is not None:
+                    key = _timestamp_key(line)
+                    if key is not None and key >= limit:
+                        continue
+                f.write(line)
+                f.write(b"\n")
+                lines += 1
+            # urllib3 before 2.0 does not raise when the connection closes before the end of the body
+            length = response.headers.get("Content-Length")
+            if length is not None and response.raw.tell() < int(length):
+                raise requests.ConnectionError("slice cut off after {} of {} bytes".format(response.raw.tell(), length))
+        return lines
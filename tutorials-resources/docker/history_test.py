@@ -0,0 +1,192 @@
+import http.server
+import json
+import threading
+from enum import Enum
+from urllib.parse import urlparse, parse_qs
+
+from history import HistoryClient, ErrInvalidToken, ErrSliceFailed, time_slices
+
+
+class T(Enum):
+    args = 0
+    want = 1
+    err = 2
+
+
+# _TARGETS are target updates every 7.5 seconds over an hour, with one at every slice boundary of the tests
+_TARGETS = [{"icao_address": "A{:04d}".format(i),
+             "timestamp": "2021-05-21T12:{:02d}:{:02d}{}Z".format(i * 15 // 120, i * 15 // 2 % 60,
+                                                                  ".5" if i % 2 else "")} for i in range(480)]
+
+
+def _lines(targets):
+    return [json.dumps({"target": t}, separators=(",", ":")) for t in targets]
+
+
+class _History(object):
+    """
+    _History serves the target updates of _TARGETS between start and end, both included, like the history API. The
+    requests for the windows in fail are answered with status 503, or cut off after one line if cut is True, as many
+    times as their count in fail.
+    """
+
+    def __init__(self, fail=None, cut=False):
+        self.fail = dict(fail or {})
+        self.cut = cut
+        self.requests = []
+        history = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                history.requests.append(params)
+                if self.headers.get("Authorization") != "Bearer token":
+                    self.send_error(401)
+                    return
+                start, end = params["start"].rstrip("Z"), params["end"].rstrip("Z")
+                body = "".join(line + "\n" for line, t in zip(_lines(_TARGETS), _TARGETS)
+                               if start <= t["timestamp"].rstrip("Z") <= end).encode()
+                window = (params["start"], params["end"])
+                if history.fail.get(window, 0) > 0:
+                    history.fail[window] -= 1
+                    if not history.cut:
+                        self.send_error(503)
+                        return
+                    self.send_response(200)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body[:body.index(b"\n") + 1])
+                    self.close_connection = True
+                    return
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://{}:{}/v2/targets/history".format(*self.server.server_address)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestHistoryClient(object):
+
+    def test_time_slices(self):
+        """
+        test_time_slices tests that windows are split into slices of whole seconds that share their boundaries
+        """
+        tests = [
+            {
+                T.args: ("2021-05-21T12:00:00Z", "2021-05-21T13:00:00Z", 4),
+                T.want: [("2021-05-21T12:00:00Z", "2021-05-21T12:15:00Z"),
+                         ("2021-05-21T12:15:00Z", "2021-05-21T12:30:00Z"),
+                         ("2021-05-21T12:30:00Z", "2021-05-21T12:45:00Z"),
+                         ("2021-05-21T12:45:00Z", "2021-05-21T13:00:00Z")]
+            }, {
+                T.args: ("2021-05-21T12:00:00.5Z", "2021-05-21T12:00:02.5Z", 10),
+                T.want: [("2021-05-21T12:00:00.5Z", "2021-05-21T12:00:01Z"),
+                         ("2021-05-21T12:00:01Z", "2021-05-21T12:00:02.5Z")]
+            }, {
+                T.args: ("2021-05-21T12:00:00Z", "2021-05-21T12:00:10Z", 3),
+                T.want: [("2021-05-21T12:00:00Z", "2021-05-21T12:00:04Z"),
+                         ("2021-05-21T12:00:04Z", "2021-05-21T12:00:08Z"),
+                         ("2021-05-21T12:00:08Z", "2021-05-21T12:00:10Z")]
+            }, {
+                T.args: ("2021-05-21T12:00:00Z", "2021-05-21T12:00:00Z", 3),
+                T.want: [("2021-05-21T12:00:00Z", "2021-05-21T12:00:00Z")]
+            }
+        ]
+
+        for test in tests:
+            assert time_slices(*test[T.args]) == test[T.want]
+
+    def test_lines(self):
+        """
+        test_lines tests that the lines of all slices are returned once, in timestamp order, whatever the number of
+        slices and connections
+        """
+        history = _History()
+        try:
+            tests = [
+                {
+                    T.args: (1, 1),
+                }, {
+                    T.args: (3, 7),
+                }, {
+                    T.args: (4, 24),
+                }
+            ]
+
+            for test in tests:
+                connections, slices = test[T.args]
+                with HistoryClient("token", base_url=history.url, connections=connections) as c:
+                    lines = list(c.lines("2021-05-21T12:00:00Z", "2021-05-21T12:59:59Z", slices=slices,
+                                         params={"icao_address": "A0001"}))
+                assert lines == _lines(_TARGETS)
+                assert (c.metrics.slices, c.metrics.lines, c.metrics.retries) == (slices, 480, 0)
+                assert history.requests[-1]["icao_address"] == "A0001"
+        finally:
+            history.close()
+
+    def test_retry(self):
+        """
+        test_retry tests that failed and cut off slices are downloaded again on their own, and that slices that keep
+        failing and rejected tokens raise
+        """
+        window = ("2021-05-21T12:15:00Z", "2021-05-21T12:30:00Z")
+        tests = [
+            {
+                T.args: (_History(fail={window: 2}), "token"),
+                T.want: 2
+            }, {
+                T.args: (_History(fail={window: 1}, cut=True), "token"),
+                T.want: 1
+            }, {
+                T.args: (_History(fail={window: 3}), "token"),
+                T.err: ErrSliceFailed
+            }, {
+                T.args: (_History(), "invalid"),
+                T.err: ErrInvalidToken
+            }
+        ]
+
+        for test in tests:
+            history, token = test[T.args]
+            try:
+                with HistoryClient(token, base_url=history.url, connections=2, retries=2, backoff=0.01) as c:
+                    lines = c.lines("2021-05-21T12:00:00Z", "2021-05-21T12:59:59Z", slices=4)
+                    if T.err in test:
+                        try:
+                            list(lines)
+                            assert False  # expected behavior is not to arrive here
+                        except test[T.err]:
+                            pass
+                        continue
+                    assert list(lines) == _lines(_TARGETS)
+                    assert c.metrics.retries == test[T.want]
+                    assert [(r["start"], r["end"]) for r in history.requests].count(window) == test[T.want] + 1
+            finally:
+                history.close()
+
+    def test_stop(self):
+        """
+        test_stop tests that closing the lines early stops the downloads
+        """
+        history = _History()
+        try:
+            with HistoryClient("token", base_url=history.url, connections=2) as c:
+                lines = c.lines("2021-05-21T12:00:00Z", "2021-05-21T12:59:59Z", slices=60)
+                assert next(lines) == _lines(_TARGETS)[0]
+                lines.close()
+            # the first slice, and up to 2 slices ahead per connection
+            assert len(history.requests) <= 5
+        finally:
+            history.close()
@@ -2,13 +2,13 @@
 
 import logging
 import os
-import time
-from glob import glob
 from os import path
-from typing import Optional
 
+from checkpoint import FileCheckpointStore
 from client import Client, StreamConfig, ContinueFromPositionToken
 from client import FilterLongitude, FilterLatitude
+from metrics import Registry, PrometheusStreamMetrics, serve
+from recorder import Recorder
 
 
 def must_getenv(key) -> str:
@@ -24,6 +24,12 @@ def must_getenv(key) -> str:
 
 
 LAST_POSITION_TOKEN_LOCATION = path.join(must_getenv("HOME"), "position_tokens")
+# CHECKPOINT_INTERVAL is the minimum number of seconds between two writes of the last position token
+CHECKPOINT_INTERVAL = float(os.environ.get("CHECKPOINT_INTERVAL", "1"))
+# METRICS_PORT is the port that serves the metrics of the stream at /metrics, in the Prometheus text format
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9100"))
+# RECORD_DIRECTORY is the directory the raw stream is recorded to, see recorder.Recorder; not recorded if not set
+RECORD_DIRECTORY = os.environ.get("RECORD_DIRECTORY", "")
 
 
 class TargetProcessor(object):
@@ -31,6 +37,8 @@ class TargetProcessor(object):
     TargetProcessor contains all logic to forward, write or process the incoming target updates.
     No heavy processing should be done in this place though, since that might lead this /stream consumer
     to fall back in the data stream, which can lead to the server disconnecting.
+    If heavier processing is needed, run the stream with workers (see Client.stream), so that the connection is read
+    independently of the callbacks; the callback then needs to be thread-safe.
     """
 
     def __init__(self, logger):
@@ -46,68 +54,13 @@ class TargetProcessor(object):
         self.n_messages += 1
 
 
-class PositionTokenProcessor(object):
-    """
-    PositionTokenProcessor contains the logic to read and write position tokens, necessary to allow reconnecting
-    to /stream the respective point, as to not miss any target updates.
-    """
-
-    def __init__(self, logger: logging.Logger):
-        self.logger = logger
-
-    def read_last_position_token(self) -> Optional[str]:
-        """
-        read_last_position_token reads the last successfully written position_token. This function is relevant when
-        reconnecting to /stream. If the previous disconnect was not right after the transmission of the read
-        position_token duplicate delivery of some target updates is likely.
-        :return: The position token as a string, or None if no token was found
-        """
-        try:
-            tokens = glob(path.join(LAST_POSITION_TOKEN_LOCATION, "token.*.txt"))
-            tokens = sorted(tokens)
-            if len(tokens) == 0:
-                raise Exception("no position tokens found")
-            with open(tokens[-1], "r") as f:
-                token = f.read()
-            return token
-        except Exception as e:
-            self.logger.warning("could not get last position_token: {}".format(e))
-            return None
-
-    def write_last_position_token(self, token):
-        """
-        write_last_position_token writes the token to a directory of timestamped tokens, and trims old tokens
-        from that directory.
-        In case writing the token fails or is incomplete the previous token will be picked up by
-        `read_last_position_token`, since the newly written token will be prepended to the files, and renamed
-        (an atomic operation) when the write was successful.
-
-        :param token: The token to be written to the directory of tokens
-        """
-        new_token_file_path = path.join(LAST_POSITION_TOKEN_LOCATION, "token.0.txt")
-        try:
-            with open(new_token_file_path, "w") as f:
-                f.write(token)
-            os.rename(new_token_file_path,
-                      path.join(LAST_POSITION_TOKEN_LOCATION, "token." + str(time.time()) + ".txt"))
-            tokens = glob(path.join(LAST_POSITION_TOKEN_LOCATION, "token.*.txt"))
-            tokens = sorted(tokens)
-
-            # Remove old tokens
-            if len(tokens) > 5:
-                for t in tokens[:-5]:
-                    os.remove(t)
-
-            self.logger.debug("updated last position_token to " + token)
-        except Exception as e:
-            self.logger.error("might not have succeeded writing last position_token: {}".format(e))
-
-
 def main():
     """
     main reads the AirSafe 2 /stream token from the environment, creates a client and s StreamConfig to apply
     a filter around Atlanta Airport, reads the last position token in case of a restart, and starts the stream,
-    passing in a TargetProcessor that logs all incoming target updates.
+    passing in a TargetProcessor that logs all incoming target updates. The stream reconnects on its own after
+    server disconnects and network errors. Its metrics are served on METRICS_PORT, and the raw stream is recorded to
+    RECORD_DIRECTORY if set.
     """
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
@@ -115,7 +68,10 @@ def main():
     # Retrieve the AirSafe2 token, and create a client
     AIRSAFE2_TOKEN = must_getenv("AIRSAFE2_TOKEN")
 
-    c = Client(AIRSAFE2_TOKEN, logger=logger)
+    registry = Registry()
+    c = Client(AIRSAFE2_TOKEN, logger=logger, metrics=PrometheusStreamMetrics(registry))
+    serve(registry, METRICS_PORT)
+    logger.info("serving metrics on port {}".format(METRICS_PORT))
 
     # Filter for planes that depart or arrive in Atlanta
     cfg = StreamConfig()
@@ -124,19 +80,28 @@ def main():
     cfg.add(FilterLongitude(*atlanta_lon))
     cfg.add(FilterLatitude(*atlanta_lat))
 
-    # Restart the stream from it's last position, if this position is known
-    ptp = PositionTokenProcessor(logger)
-    last_position_token = ptp.read_last_position_token()
+    # Restart the stream from it's last position, if this position is known. Position tokens are written in the
+    # background, so that the stream is not held up by the disk
+    checkpoints = FileCheckpointStore(LAST_POSITION_TOKEN_LOCATION, min_interval=CHECKPOINT_INTERVAL, logger=logger)
+    last_position_token = checkpoints.load()
 
     if last_position_token is not None:
         logger.info("starting from position_token: {}".format(last_position_token))
         cfg.add(ContinueFromPositionToken(last_position_token))
 
-    # Create the callback class and start the stream
+    # Create the callback class and start the stream, reconnecting from the last position token whenever the
+    # connection is interrupted
     tp = TargetProcessor(logger)
-    c.stream(tp.callback,
-             position_token_callback=ptp.write_last_position_token,
-             config=cfg)
+    recorder = Recorder(RECORD_DIRECTORY) if RECORD_DIRECTORY else None
+    try:
+        c.stream_forever(tp.callback,
+                         position_token_callback=checkpoints,
+                         config=cfg,
+                         line_callback=recorder)
+    finally:
+        checkpoints.close()
+        if recorder is not None:
+            recorder.close()
 
     return 0
 
@@ -0,0 +1,363 @@
+"""
+metrics collects counters, gauges and histograms, exports them in the Prometheus text format, and measures the stream
+loop of the client with PrometheusStreamMetrics:
+
+    registry = Registry()
+    c = Client(token, metrics=PrometheusStreamMetrics(registry))
+    serve(registry, 9100)  # http://localhost:9100/metrics
+    c.stream_forever(on_target)
+
+Metrics are only updated under a lock per metric, and rendered when they are scraped.
+"""
+
+import bisect
+import calendar
+import http.server
+import math
+import threading
+import time
+from abc import ABC as _ABC, abstractmethod as _abstractmethod
+from typing import Optional, Dict, List, Tuple, Callable, Sequence
+
+from client import StreamMetrics
+
+# _LATENCY_BUCKETS are the default histogram buckets, in seconds, from 1us to 10s
+_LATENCY_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2,
+                    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# _LAG_BUCKETS are the buckets of the end-to-end lag, in seconds
+_LAG_BUCKETS = (0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if value != value:
+        return "NaN"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for v in values)
+    return "{" + ",".join('{}="{}"'.format(n, v) for n, v in zip(names, escaped)) + "}"
+
+
+class _Metric(_ABC):
+    """
+    _Metric is a metric family: the labelled children of a metric, created on first use by labels()
+    """
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name: str = name
+        self.documentation: str = documentation
+        self.label_names: Tuple[str, ...] = tuple(label_names)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+
+    def labels(self, *values: str) -> "_Metric":
+        """
+        labels returns the child of the metric for the given label values
+        """
+        if len(values) != len(self.label_names):
+            raise ValueError("{} expects labels {}".format(self.name, self.label_names))
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def _child(self) -> "_Metric":
+        return type(self)(self.name, self.documentation)
+
+    def _defined_as(self, documentation: str, label_names: Sequence[str] = ()) -> bool:
+        """
+        _defined_as tells whether the metric was created with the given arguments, apart from its documentation
+        """
+        return self.label_names == tuple(label_names)
+
+    @_abstractmethod
+    def _samples(self) -> List[Tuple[str, Sequence[str], Sequence[str], float]]:
+        """
+        _samples returns the samples of an unlabelled metric as (suffix, label names, label values, value)
+        """
+        pass
+
+    def render(self) -> List[str]:
+        lines = ["# HELP {} {}".format(self.name, self.documentation), "# TYPE {} {}".format(self.name, self.kind)]
+        if self.label_names:
+            children = sorted(self._children.items())
+        else:
+            children = [((), self)]
+        for values, child in children:
+            for suffix, names, extra_values, value in child._samples():
+                lines.append("{}{}{} {}".format(self.name, suffix,
+                                                _format_labels(self.label_names + tuple(names),
+                                                               tuple(values) + tuple(extra_values)),
+                                                _format_value(value)))
+        return lines
+
+
+class Counter(_Metric):
+    """
+    Counter is a value that only goes up, e.g. the number of messages
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def _samples(self):
+        return [("", (), (), self._value)]
+
+
+class Gauge(_Metric):
+    """
+    Gauge is a value that goes up and down. It is either set, or computed by a function when it is rendered.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self._value = value
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def set_function(self, function: Callable[[], float]):
+        """
+        set_function makes the gauge report the result of function
+        """
+        self._function = function
+
+    @property
+    def value(self) -> float:
+        return self._function() if self._function is not None else self._value
+
+    def _samples(self):
+        return [("", (), (), self.value)]
+
+
+class Histogram(_Metric):
+    """
+    Histogram counts observations, e.g. durations, in cumulative buckets, and keeps their count and sum
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = _LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+
+    def _child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def _defined_as(self, documentation: str, label_names: Sequence[str] = (),
+                    buckets: Sequence[float] = _LATENCY_BUCKETS) -> bool:
+        return super()._defined_as(documentation, label_names) and self.buckets == tuple(sorted(buckets))
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def _samples(self):
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            samples.append(("_bucket", ("le",), (_format_value(bound),), cumulative))
+        samples.append(("_count", (), (), cumulative))
+        samples.append(("_sum", (), (), total))
+        return samples
+
+
+class Registry(object):
+    """
+    Registry holds metrics by name. Metrics are created once, and returned again when they are requested again with
+    the same type, labels and buckets.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _get(self, cls, name: str, *args, **kwargs) -> _Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError("metric {} is a {}".format(name, metric.kind))
+            elif not metric._defined_as(*args, **kwargs):
+                raise ValueError("metric {} is defined with other labels or buckets".format(name))
+            return metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._get(Counter, name, documentation, label_names)
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self._get(Gauge, name, documentation, label_names)
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = _LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, documentation, label_names, buckets)
+
+    def to_prometheus(self) -> str:
+        """
+        to_prometheus renders all metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        return "".join(line + "\n" for _, metric in metrics for line in metric.render())
+
+
+def serve(registry: Registry, port: int, host: str = "") -> http.server.ThreadingHTTPServer:
+    """
+    serve serves the metrics of a registry at /metrics, on a daemon thread
+    :return: the server, which is stopped with shutdown()
+    """
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", _CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+class _EpochParser(object):
+    """
+    _EpochParser converts the UTC timestamps of the API, e.g. 2021-03-20T12:00:09.753Z, to seconds since the epoch.
+    Only the date is parsed with strptime, once per day, the time of day is read from its fixed positions.
+    """
+
+    def __init__(self):
+        self._days: Dict[str, int] = {}
+
+    def __call__(self, timestamp: str) -> float:
+        date = timestamp[:10]
+        day = self._days.get(date)
+        if day is None:
+            if len(self._days) > 1000:
+                self._days.clear()
+            day = self._days[date] = calendar.timegm(time.strptime(date, "%Y-%m-%d"))
+        if timestamp[10:11] != "T":
+            raise ValueError("invalid timestamp {}".format(timestamp))
+        seconds = day + int(timestamp[11:13]) * 3600 + int(timestamp[14:16]) * 60 + int(timestamp[17:19])
+        fraction = timestamp[19:].rstrip("Z")
+        return seconds + float(fraction) if fraction else seconds
+
+
+class PrometheusStreamMetrics(StreamMetrics):
+    """
+    PrometheusStreamMetrics records the measurements of the stream loop of a Client in a Registry:
+    - airsafe_stream_messages_total and airsafe_stream_bytes_total count messages by type and bytes read;
+    - airsafe_stream_decode_seconds and airsafe_stream_callback_seconds are the time spent decoding messages and in \
+    their callbacks;
+    - airsafe_stream_lag_seconds is the age of target updates on arrival, against the local clock, measured from \
+    their timestamp and from their ingestion_time;
+    - airsafe_stream_reconnects_total counts reconnects, airsafe_stream_position_token_age_seconds is the time since \
+    the last position token.
+    """
+
+    def __init__(self, registry: Registry, clock: Callable[[], float] = time.time):
+        """
+
+        :param registry: The registry that holds the metrics
+        :param clock: The local clock that lag is measured against, in seconds since the epoch
+        """
+        self._clock = clock
+        messages = registry.counter("airsafe_stream_messages_total", "Messages received, by type.", ["type"])
+        self._messages = {key: messages.labels(key) for key in ("target", "position_token", "status")}
+        self._unknown = messages.labels("unknown")
+        self._bytes = registry.counter("airsafe_stream_bytes_total", "Bytes read from the stream connection.")
+        self._decode = registry.histogram("airsafe_stream_decode_seconds", "Time spent decoding a message.")
+        callbacks = registry.histogram("airsafe_stream_callback_seconds", "Time spent in the callbacks of a message, "
+                                                                          "by type.", ["type"])
+        self._callbacks = {key: callbacks.labels(key) for key in ("target", "position_token", "status")}
+        lag = registry.histogram("airsafe_stream_lag_seconds", "Age of target updates on arrival, by reference "
+                                                               "field.", ["reference"], _LAG_BUCKETS)
+        self._lag_timestamp = lag.labels("timestamp")
+        self._lag_ingestion_time = lag.labels("ingestion_time")
+        self._reconnects = registry.counter("airsafe_stream_reconnects_total", "Reconnects of stream_forever.")
+        self._last_position_token: Optional[float] = None
+        registry.gauge("airsafe_stream_position_token_age_seconds",
+                       "Seconds since the last position token, NaN before the first.").set_function(
+            lambda: self._clock() - self._last_position_token if self._last_position_token is not None else math.nan)
+        self._epoch = _EpochParser()
+
+    def read(self, n_bytes: int):
+        self._bytes.inc(n_bytes)
+
+    def decoded(self, key: Optional[str], seconds: float):
+        self._messages.get(key, self._unknown).inc()
+        self._decode.observe(seconds)
+
+    def handled(self, key: str, seconds: float):
+        callbacks = self._callbacks.get(key)
+        if callbacks is not None:
+            callbacks.observe(seconds)
+
+    def target(self, target_update):
+        now = self._clock()
+        try:
+            timestamp = target_update.get("timestamp")
+            if timestamp:
+                self._lag_timestamp.observe(now - self._epoch(timestamp))
+            ingestion_time = target_update.get("ingestion_time")
+            if ingestion_time:
+                self._lag_ingestion_time.observe(now - self._epoch(ingestion_time))
+        except ValueError:
+            pass  # malformed timestamps are not measured
+
+    def position_token(self):
+        self._last_position_token = self._clock()
+
+    def reconnect(self):
+        self._reconnects.inc()
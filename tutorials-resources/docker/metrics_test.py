@@ -0,0 +1,123 @@
+import urllib.request
+from enum import Enum
+
+import responses
+
+from client import Client, ErrServerDisconnected, _STREAM_V2_URL
+from metrics import Registry, PrometheusStreamMetrics, serve, _LAG_BUCKETS
+
+
+class T(Enum):
+    args = 0
+    want = 1
+    err = 2
+
+
+class TestRegistry(object):
+
+    def test_to_prometheus(self):
+        """
+        test_to_prometheus tests that metrics are rendered in the Prometheus text format
+        """
+        r = Registry()
+        r.counter("requests_total", "Requests.", ["code"]).labels("200").inc()
+        r.counter("requests_total", "Requests.", ["code"]).labels("200").inc(2)
+        r.counter("requests_total", "Requests.", ["code"]).labels('a"b').inc()
+        r.gauge("temperature", "Temperature.").set(-1.5)
+        r.gauge("answer", "Answer.").set_function(lambda: 42)
+        h = r.histogram("latency_seconds", "Latency.", buckets=[0.1, 1])
+        for v in [0.05, 0.1, 0.5, 3]:
+            h.observe(v)
+
+        assert r.to_prometheus() == """# HELP answer Answer.
+# TYPE answer gauge
+answer 42
+# HELP latency_seconds Latency.
+# TYPE latency_seconds histogram
+latency_seconds_bucket{le="0.1"} 2
+latency_seconds_bucket{le="1"} 3
+latency_seconds_bucket{le="+Inf"} 4
+latency_seconds_count 4
+latency_seconds_sum 3.65
+# HELP requests_total Requests.
+# TYPE requests_total counter
+requests_total{code="200"} 3
+requests_total{code="a\\"b"} 1
+# HELP temperature Temperature.
+# TYPE temperature gauge
+temperature -1.5
+"""
+
+    def test_invalid(self):
+        """
+        test_invalid tests that metrics are not redefined with another type, other labels or other buckets, nor used
+        with the wrong labels
+        """
+        r = Registry()
+        r.counter("requests_total", "Requests.", ["code"])
+        r.histogram("latency_seconds", "Latency.", buckets=[0.1, 1])
+        tests = [
+            lambda: r.gauge("requests_total", "Requests."),
+            lambda: r.counter("requests_total", "Requests."),
+            lambda: r.counter("requests_total", "Requests.", ["method"]),
+            lambda: r.histogram("latency_seconds", "Latency."),
+            lambda: r.histogram("latency_seconds", "Latency.", ["code"], buckets=[0.1, 1]),
+            lambda: r.counter("requests_total", "Requests.", ["code"]).labels(),
+            lambda: r.counter("requests_total", "Requests.", ["code"]).labels("200", "GET"),
+        ]
+
+        for test in tests:
+            try:
+                test()
+                assert False  # expected behavior is not to arrive here
+            except ValueError:
+                pass
+
+    def test_serve(self):
+        """
+        test_serve tests that metrics are served at /metrics
+        """
+        r = Registry()
+        r.counter("requests_total", "Requests.").inc()
+        server = serve(r, 0, "127.0.0.1")
+        try:
+            url = "http://127.0.0.1:{}/metrics".format(server.server_address[1])
+            with urllib.request.urlopen(url) as response:
+                assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+                assert response.read().decode() == r.to_prometheus()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class TestPrometheusStreamMetrics(object):
+
+    @responses.activate
+    def test_stream(self):
+        """
+        test_stream tests that the stream loop reports messages, bytes, durations, lag and position tokens
+        """
+        body = """{"target":{"icao_address": "A", "timestamp": "2021-05-21T12:00:00.5Z", "ingestion_time": "2021-05-21T12:00:02Z"}}
+{"position_token":"token1"}
+{"status":{"level":"INFO","message":"keep-alive","timestamp":"2021-05-21T12:00:03Z"}}
+{"unknown":{}}"""
+        responses.add(responses.GET, _STREAM_V2_URL, body=body, status=200)
+        r = Registry()
+        now = 1621598405.0  # 2021-05-21T12:00:05Z
+        metrics = PrometheusStreamMetrics(r, clock=lambda: now)
+
+        try:
+            Client("token", metrics=metrics).stream(lambda _: None)
+            assert False  # expected behavior is not to arrive here
+        except ErrServerDisconnected:
+            pass
+
+        assert [r.counter("airsafe_stream_messages_total", "", ["type"]).labels(key).value
+                for key in ("target", "position_token", "status", "unknown")] == [1, 1, 1, 1]
+        assert r.counter("airsafe_stream_bytes_total", "").value == len(body)
+        assert r.histogram("airsafe_stream_decode_seconds", "").count == 4
+        assert r.histogram("airsafe_stream_callback_seconds", "", ["type"]).labels("target").count == 1
+        lag = r.histogram("airsafe_stream_lag_seconds", "", ["reference"], _LAG_BUCKETS)
+        assert (lag.labels("timestamp").sum, lag.labels("ingestion_time").sum) == (4.5, 3.0)
+        assert r.gauge("airsafe_stream_position_token_age_seconds", "").value == 0
+        assert "airsafe_stream_reconnects_total 0\n" in r.to_prometheus()
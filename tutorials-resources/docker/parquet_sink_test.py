@@ -0,0 +1,153 @@
+import os
+import tempfile
+from datetime import datetime, timezone
+from enum import Enum
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from columnar import AIRSAFE_SCHEMA
+from parquet_sink import ParquetSink, AIRSAFE_FIELDS, airsafe_arrow_schema
+
+
+class T(Enum):
+    args = 0
+    want = 1
+    err = 2
+
+
+def _files(directory: str):
+    return sorted(os.path.dirname(os.path.relpath(path, directory))
+                  for path in ds.dataset(directory, partitioning="hive").files)
+
+
+class TestParquetSink(object):
+
+    def test_schema(self):
+        """
+        test_schema tests that the fields and types are those of columnar.AIRSAFE_SCHEMA
+        """
+        assert [(name, column_type.value) for name, column_type in AIRSAFE_SCHEMA] == list(AIRSAFE_FIELDS)
+        schema = airsafe_arrow_schema()
+        assert schema.field("timestamp").type == pa.timestamp("ms", tz="UTC")
+        assert schema.field("on_ground").type == pa.bool_()
+
+    def test_partitions(self):
+        """
+        test_partitions tests that target updates are partitioned by date, hour and cell, and read back typed
+        """
+        target_updates = [
+            {"icao_address": "A", "timestamp": "2021-05-21T12:59:59Z", "latitude": 33.6, "longitude": -84.4,
+             "on_ground": False},
+            {"icao_address": "B", "timestamp": "2021-05-21T13:00:00.5Z", "latitude": 33.6, "longitude": -84.4},
+            {"icao_address": "C", "timestamp": "2021-05-21T12:00:00Z", "latitude": -0.5, "longitude": 0.5},
+            {"icao_address": "D", "latitude": 1.0},
+        ]
+        tests = [
+            {
+                T.args: None,
+                T.want: ["date=2021-05-21/hour=12", "date=2021-05-21/hour=13",
+                         "date=unknown/hour=unknown"]
+            }, {
+                T.args: 10,
+                T.want: ["date=2021-05-21/hour=12/cell=-10_0", "date=2021-05-21/hour=12/cell=30_-90",
+                         "date=2021-05-21/hour=13/cell=30_-90", "date=unknown/hour=unknown/cell=unknown"]
+            }
+        ]
+
+        for test in tests:
+            with tempfile.TemporaryDirectory() as directory:
+                with ParquetSink(directory, cell_degrees=test[T.args]) as sink:
+                    sink.write_all(target_updates)
+                assert _files(directory) == test[T.want]
+
+                table = ds.dataset(directory, partitioning="hive").to_table().sort_by("icao_address")
+                assert table.column("icao_address").to_pylist() == ["A", "B", "C", "D"]
+                assert table.column("timestamp").to_pylist()[:2] == [
+                    datetime(2021, 5, 21, 12, 59, 59, tzinfo=timezone.utc),
+                    datetime(2021, 5, 21, 13, 0, 0, 500000, tzinfo=timezone.utc)]
+                assert table.column("on_ground").to_pylist() == [False, None, None, None]
+                assert table.schema.field("latitude").type == pa.float64()
+
+    def test_timestamps(self):
+        """
+        test_timestamps tests that timestamps with any number of fractional digits are truncated to milliseconds
+        """
+        tests = [
+            {
+                T.args: "2021-05-21T12:00:00Z",
+                T.want: datetime(2021, 5, 21, 12, 0, 0, tzinfo=timezone.utc)
+            }, {
+                T.args: "2021-05-21T12:00:00.5Z",
+                T.want: datetime(2021, 5, 21, 12, 0, 0, 500000, tzinfo=timezone.utc)
+            }, {
+                T.args: "2021-05-21T12:00:00.123456Z",
+                T.want: datetime(2021, 5, 21, 12, 0, 0, 123000, tzinfo=timezone.utc)
+            }, {
+                T.args: "2021-05-21T12:00:00.987654321Z",
+                T.want: datetime(2021, 5, 21, 12, 0, 0, 987000, tzinfo=timezone.utc)
+            }, {
+                T.args: "2021-05-21T12:00:00.98765432109Z",
+                T.want: datetime(2021, 5, 21, 12, 0, 0, 987000, tzinfo=timezone.utc)
+            }
+        ]
+
+        for batch in [tests, tests[2:3]]:
+            with tempfile.TemporaryDirectory() as directory:
+                with ParquetSink(directory) as sink:
+                    sink.write_all({"icao_address": str(i), "timestamp": test[T.args]} for i, test in enumerate(batch))
+                table = ds.dataset(directory, partitioning="hive").to_table().sort_by("icao_address")
+                assert table.column("timestamp").to_pylist() == [test[T.want] for test in batch]
+                assert sink.invalid_values == 0
+
+    def test_row_groups(self):
+        """
+        test_row_groups tests that row groups are written when a partition holds row_group_size target updates, or
+        when max_buffered_rows are buffered, and that files are completed above max_open_files and on rotation
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            sink = ParquetSink(directory, row_group_size=4, max_buffered_rows=6, max_open_files=2)
+            for i in range(10):
+                sink.write({"icao_address": str(i), "timestamp": "2021-05-21T12:00:00Z"})
+            assert (sink.row_groups, sink.files) == (2, [])
+            for i in range(3):
+                sink.write({"icao_address": str(i), "timestamp": "2021-05-21T13:00:00Z"})
+            # 2 + 3 + 1 target updates are buffered, the 3 of hour 13 are written
+            sink.write({"icao_address": "0", "timestamp": "2021-05-21T14:00:00Z"})
+            assert (sink.row_groups, sink.files) == (3, [])
+            sink.write({"icao_address": "0", "timestamp": "2021-05-21T15:00:00Z"})
+
+            # hour 14 and 15 complete the least recently written files (hour 13, then 12)
+            completed = sink.rotate()
+            assert sink.row_groups == 6 and sink.files == completed
+            assert [os.path.basename(os.path.dirname(f)) for f in completed] == ["hour=13", "hour=12", "hour=14",
+                                                                               "hour=15"]
+            assert sink.rotate() == []
+
+            assert [pq.ParquetFile(f).metadata.num_row_groups for f in sink.files] == [1, 3, 1, 1]
+            assert [pq.ParquetFile(f).metadata.num_rows for f in sink.files] == [3, 10, 1, 1]
+            assert not [f for _, _, files in os.walk(directory) for f in files if f.startswith(".")]
+
+    def test_schema_evolution(self):
+        """
+        test_schema_evolution tests that new fields are added as string columns in the next file, and that values
+        that do not fit their column become nulls
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            sink = ParquetSink(directory, row_group_size=1)
+            sink.write({"icao_address": "A", "timestamp": "2021-05-21T12:00:00Z", "speed": 250})
+            sink.write({"icao_address": "B", "timestamp": "2021-05-21T12:00:01Z", "speed": "fast",
+                        "new_field": {"nested": 1}})
+            sink.write({"icao_address": "C", "timestamp": "not a timestamp", "new_field": "x", "other": 1.5})
+            sink.close()
+
+            assert len(sink.files) == 3
+            assert sink.invalid_values == 2
+            table = ds.dataset(directory, partitioning="hive",
+                               schema=pa.unify_schemas([pq.read_schema(f) for f in sink.files])).to_table()
+            table = table.sort_by("icao_address")
+            assert table.column("speed").to_pylist() == [250.0, None, None]
+            assert table.column("new_field").to_pylist() == [None, '{"nested": 1}', "x"]
+            assert table.column("other").to_pylist() == [None, None, "1.5"]
+            assert table.column("timestamp").to_pylist()[2] is None
@@ -0,0 +1,441 @@
+"""
+predicate filters target updates on the client side, for conditions that the server-side Filter* parameters do not
+cover. A Predicate is a declarative expression over the fields of target updates, e.g.
+
+    Predicate("speed > 300 and collection_type == 'satellite' and aircraft_type_icao.startswith(('A3', 'B7'))")
+    Predicate("changed(on_ground) and airline_iata in ('MU', 'FM')")
+
+The expression is compiled once: into a Python function that evaluates single target updates, and into NumPy
+operations that evaluate whole columnar.ColumnarBatch objects. Either way, every top-level "and" term counts how many
+target updates it was evaluated on and how many it let through, see stats().
+
+The expression language is a subset of Python expressions:
+- field names of target updates, fields that were not sent are None (NaN in columnar batches);
+- literals: numbers, strings, True, False, None, and tuples/lists of them;
+- comparisons ==, !=, <, <=, >, >= (also chained), in and not in;
+- and, or, not;
+- field.startswith(prefix) and field.endswith(suffix), where prefix or suffix may be a tuple; and
+- changed(field), which is True if the field differs from the last target update of the same aircraft (the first \
+target update of an aircraft is not a change).
+
+Ordering comparisons with missing fields are False. The stream API delivers target updates of an aircraft in order,
+so changed() needs to see all of them: predicates that use changed() should not be used with workers.
+
+Use it with Client.stream to drop unwanted target updates before they reach the callbacks and batches:
+
+    c.stream(on_target, predicate=Predicate("speed > 300"))
+"""
+
+import ast
+import operator
+from typing import Optional, Dict, List, Any, Callable
+
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
+
+_FUNCTIONS = ("changed",)
+_STRING_METHODS = ("startswith", "endswith")
+
+_COMPARE_OPERATORS = {
+    ast.Eq: "==",
+    ast.NotEq: "!=",
+    ast.Lt: "<",
+    ast.LtE: "<=",
+    ast.Gt: ">",
+    ast.GtE: ">=",
+    ast.In: "in",
+    ast.NotIn: "not in",
+}
+
+_ORDERING_OPERATORS = ("<", "<=", ">", ">=")
+
+_VECTOR_OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+class ErrInvalidExpression(Exception):
+    """
+    ErrInvalidExpression is raised when a Predicate expression is not valid
+    """
+    pass
+
+
+class TermStats(object):
+    """
+    TermStats describes how selective a top-level "and" term of a Predicate is.
+    evaluated counts the target updates the term was evaluated on (those that passed all terms before it), passed
+    counts those it let through.
+    """
+
+    def __init__(self, expression: str, evaluated: int, passed: int):
+        self.expression: str = expression
+        self.evaluated: int = evaluated
+        self.passed: int = passed
+
+    @property
+    def selectivity(self) -> Optional[float]:
+        """
+        selectivity is the fraction of target updates the term let through, None if it was not evaluated yet
+        """
+        if self.evaluated == 0:
+            return None
+        return self.passed / self.evaluated
+
+    def __repr__(self) -> str:
+        return "TermStats({!r}, evaluated={}, passed={})".format(self.expression, self.evaluated, self.passed)
+
+
+class _Literal(object):
+    """
+    _Literal wraps the value of a literal, which may be None
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+
+class _Compiler(object):
+    """
+    _Compiler validates an expression and renders its terms as text, as Python code on a single target update t, and
+    as Python code on the columns of a batch.
+    """
+
+    def __init__(self, expression: str):
+        try:
+            tree = ast.parse(expression.strip(), mode="eval")
+        except SyntaxError as e:
+            raise ErrInvalidExpression("invalid expression {!r}: {}".format(expression, e.msg))
+        body = tree.body
+        self.terms = body.values if isinstance(body, ast.BoolOp) and isinstance(body.op, ast.And) else [body]
+        self.constants: Dict[str, Any] = {}
+        self.changed_fields: List[str] = []
+
+    def constant(self, value) -> str:
+        name = "_c{}".format(len(self.constants))
+        self.constants[name] = value
+        return name
+
+    @staticmethod
+    def literal(node: ast.AST) -> Optional[_Literal]:
+        try:
+            return _Literal(ast.literal_eval(node))
+        except ValueError:
+            return None
+
+    def field(self, node: ast.AST) -> str:
+        if not isinstance(node, ast.Name):
+            raise ErrInvalidExpression("expected a field name, got {}".format(type(node).__name__))
+        return node.id
+
+    def render(self, node: ast.AST, mode: str, ordered: bool = False) -> str:
+        """
+        render renders node for mode "text", "message" or "vector"
+        :param ordered: If True, node is an operand of an ordering comparison, where missing fields are NaN
+        """
+        literal = self.literal(node)
+        if literal is not None:
+            if mode == "text":
+                return repr(literal.value)
+            value = literal.value
+            if isinstance(value, (list, tuple, set, frozenset)):
+                value = frozenset(value) if mode == "message" else tuple(value)
+            return self.constant(value)
+
+        if isinstance(node, ast.Name):
+            if node.id in _FUNCTIONS:
+                raise ErrInvalidExpression("{} must be called".format(node.id))
+            if mode == "text":
+                return node.id
+            if mode == "message":
+                return "get({!r}, _nan)".format(node.id) if ordered else "get({!r})".format(node.id)
+            return "_column(columns, valid, {!r}, n)".format(node.id)
+
+        if isinstance(node, ast.BoolOp):
+            op = "and" if isinstance(node.op, ast.And) else "or"
+            if mode == "vector":
+                return "({})".format(" {} ".format("&" if op == "and" else "|").join(
+                    "_as_bool({}, n)".format(self.render(v, mode)) for v in node.values))
+            return "({})".format(" {} ".format(op).join(self.render(v, mode) for v in node.values))
+
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            if mode == "vector":
+                return "(~_as_bool({}, n))".format(self.render(node.operand, mode))
+            return "(not {})".format(self.render(node.operand, mode))
+
+        if isinstance(node, ast.Compare):
+            return self.render_compare(node, mode)
+
+        if isinstance(node, ast.Call):
+            return self.render_call(node, mode)
+
+        raise ErrInvalidExpression("unsupported expression: {}".format(type(node).__name__))
+
+    def render_compare(self, node: ast.Compare, mode: str) -> str:
+        ops = []
+        for op in node.ops:
+            if type(op) not in _COMPARE_OPERATORS:
+                raise ErrInvalidExpression("unsupported comparison: {}".format(type(op).__name__))
+            ops.append(_COMPARE_OPERATORS[type(op)])
+        ordered = any(op in _ORDERING_OPERATORS for op in ops)
+        operands = [self.render(v, mode, ordered) for v in [node.left] + node.comparators]
+        if mode != "vector":
+            rendered = operands[0]
+            for op, operand in zip(ops, operands[1:]):
+                rendered += " {} {}".format(op, operand)
+            return "({})".format(rendered)
+
+        pairs = []
+        for i, op in enumerate(ops):
+            if op in ("in", "not in"):
+                pairs.append("{}_isin({}, {}, n)".format("~" if op == "not in" else "", operands[i], operands[i + 1]))
+            else:
+                pairs.append("_compare({}, {!r}, {}, n)".format(operands[i], op, operands[i + 1]))
+        return "({})".format(" & ".join(pairs))
+
+    def render_call(self, node: ast.Call, mode: str) -> str:
+        if node.keywords:
+            raise ErrInvalidExpression("keyword arguments are not supported")
+
+        if isinstance(node.func, ast.Name) and node.func.id == "changed":
+            if len(node.args) != 1:
+                raise ErrInvalidExpression("changed takes one field")
+            name = self.field(node.args[0])
+            if mode == "text":
+                return "changed({})".format(name)
+            if name not in self.changed_fields:
+                self.changed_fields.append(name)
+            i = self.changed_fields.index(name)
+            return "changed{}".format(i) if mode == "message" else "_changed[{}](columns, valid, n)".format(i)
+
+        if isinstance(node.func, ast.Attribute) and node.func.attr in _STRING_METHODS:
+            name = self.field(node.func.value)
+            literal = self.literal(node.args[0]) if len(node.args) == 1 else None
+            if literal is None or not isinstance(literal.value, (str, tuple)) or \
+                    (isinstance(literal.value, tuple) and not all(isinstance(v, str) for v in literal.value)):
+                raise ErrInvalidExpression("{} takes a string or a tuple of strings".format(node.func.attr))
+            if mode == "text":
+                return "{}.{}({!r})".format(name, node.func.attr, literal.value)
+            c = self.constant(literal.value)
+            if mode == "message":
+                return "(get({!r}) or '').{}({})".format(name, node.func.attr, c)
+            return "_string_method(_column(columns, valid, {!r}, n), {!r}, {})".format(name, node.func.attr, c)
+
+        raise ErrInvalidExpression("unsupported call, only changed(field), field.startswith(...) and "
+                                   "field.endswith(...) are supported")
+
+
+class _ChangeTracker(object):
+    """
+    _ChangeTracker remembers the last value of a field per aircraft
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self._last: Dict[Any, Any] = {}
+
+    def update(self, icao_address, value) -> bool:
+        """
+        update records the value of the field of a target update, missing values are ignored
+        :return: True if the value differs from the last one of the aircraft
+        """
+        if value is None or value != value:  # missing, or NaN in columnar batches
+            return False
+        last = self._last
+        previous = last.get(icao_address, value)
+        last[icao_address] = value
+        return previous != value
+
+    def update_columns(self, columns: Dict, valid: Dict, n: int):
+        icao_addresses = _column(columns, valid, "icao_address", n)
+        values = _column(columns, valid, self.field, n)
+        update = self.update
+        return _np.fromiter((update(a, v) for a, v in zip(icao_addresses, values)), dtype=bool, count=n)
+
+
+def _column(columns: Dict, valid: Dict, name: str, n: int):
+    """
+    _column returns the column of a field, with None for missing values unless they are NaN (FLOAT) or NaT (TIMESTAMP)
+    """
+    if name not in columns:
+        return _np.full(n, None, dtype=object)
+    column = columns[name]
+    if column.dtype == bool and not valid[name].all():
+        column = column.astype(object)
+        column[~valid[name]] = None
+    return column
+
+
+def _as_bool(value, n: int):
+    if isinstance(value, _np.ndarray):
+        if value.dtype == bool:
+            return value
+        if value.dtype.kind == "f":
+            return _np.nan_to_num(value) != 0
+        return _np.fromiter((bool(v) for v in value), dtype=bool, count=n)
+    return _np.full(n, bool(value))
+
+
+def _is_missing(value, n: int):
+    if not isinstance(value, _np.ndarray):
+        return _np.full(n, value is None)
+    if value.dtype.kind == "f":
+        return _np.isnan(value)
+    if value.dtype.kind == "M":
+        return _np.isnat(value)
+    return _np.equal(value, None)
+
+
+def _compare(a, op: str, b, n: int):
+    if a is None or b is None:
+        # comparisons with None test for missing values, as for single target updates
+        if op in ("==", "!="):
+            missing = _is_missing(b if a is None else a, n)
+            return missing if op == "==" else ~missing
+        return _np.zeros(n, dtype=bool)
+    fn = _VECTOR_OPERATORS[op]
+    try:
+        result = fn(a, b)
+        if isinstance(result, _np.ndarray) and result.dtype == bool:
+            return result
+    except TypeError:
+        pass
+    # object columns with missing values, compared element by element like single target updates
+    a = a if isinstance(a, _np.ndarray) else [a] * n
+    b = b if isinstance(b, _np.ndarray) else [b] * n
+    return _np.fromiter((_safe_compare(fn, x, y) for x, y in zip(a, b)), dtype=bool, count=n)
+
+
+def _safe_compare(fn, x, y) -> bool:
+    try:
+        return bool(fn(x, y))
+    except TypeError:
+        return False
+
+
+def _isin(a, values, n: int):
+    if not isinstance(a, _np.ndarray):
+        return _np.full(n, a in values)
+    if a.dtype.kind == "f":
+        return _np.isin(a, [v for v in values if isinstance(v, (int, float))])
+    values = frozenset(values)
+    return _np.fromiter((v in values for v in a), dtype=bool, count=n)
+
+
+def _string_method(a, method: str, arg):
+    return _np.fromiter((isinstance(v, str) and getattr(v, method)(arg) for v in a), dtype=bool, count=len(a))
+
+
+def _unwrap(text: str) -> str:
+    if text.startswith("(") and text.endswith(")"):
+        depth = 0
+        for i, c in enumerate(text):
+            depth += {"(": 1, ")": -1}.get(c, 0)
+            if depth == 0 and i < len(text) - 1:
+                return text  # e.g. (a) or (b)
+        return text[1:-1]
+    return text
+
+
+class Predicate(object):
+    """
+    Predicate is a compiled filter expression. Calling it with a target update (a dict or target.Target) returns
+    whether the target update matches, filter() and mask() evaluate batches.
+    Evaluation is not synchronized: with workers, stats() are approximate.
+    """
+
+    def __init__(self, expression: str):
+        """
+
+        :param expression: The filter expression, see the module documentation
+        """
+        self.expression: str = expression
+        compiler = _Compiler(expression)
+        self._texts = [_unwrap(compiler.render(term, "text")) for term in compiler.terms]
+        message_terms = [compiler.render(term, "message") for term in compiler.terms]
+        vector_terms = [compiler.render(term, "vector") for term in compiler.terms]
+        self._trackers = [_ChangeTracker(name) for name in compiler.changed_fields]
+
+        # counts[0] counts the evaluated target updates, counts[i + 1] those rejected by term i
+        self._counts = [0] * (len(message_terms) + 1)
+        self._evaluate = self._compile_message(message_terms, compiler.constants)
+        self._vector_terms = [self._compile_vector(term, compiler.constants) for term in vector_terms]
+
+    def _compile_message(self, terms: List[str], constants: Dict[str, Any]) -> Callable[[Any], bool]:
+        lines = ["def _evaluate(t):",
+                 "    get = t.get",
+                 "    _counts[0] += 1"]
+        for i, tracker in enumerate(self._trackers):
+            lines.append("    changed{} = _update{}(get('icao_address'), get({!r}))".format(i, i, tracker.field))
+        for i, term in enumerate(terms):
+            lines += ["    try:",
+                      "        if not {}:".format(term),
+                      "            _counts[{}] += 1".format(i + 1),
+                      "            return False",
+                      "    except TypeError:",
+                      "        _counts[{}] += 1".format(i + 1),
+                      "        return False"]
+        lines.append("    return True")
+
+        namespace = dict(constants, _counts=self._counts, _nan=float("nan"))
+        for i, tracker in enumerate(self._trackers):
+            namespace["_update{}".format(i)] = tracker.update
+        exec(compile("\n".join(lines), "<predicate {!r}>".format(self.expression), "exec"), namespace)
+        return namespace["_evaluate"]
+
+    def _compile_vector(self, term: str, constants: Dict[str, Any]) -> Callable:
+        namespace = dict(constants, _column=_column, _as_bool=_as_bool, _compare=_compare, _isin=_isin,
+                         _string_method=_string_method, _changed=[t.update_columns for t in self._trackers])
+        source = "def _term(columns, valid, n):\n    return _as_bool({}, n)".format(term)
+        exec(compile(source, "<predicate {!r}>".format(self.expression), "exec"), namespace)
+        return namespace["_term"]
+
+    def __call__(self, target_update) -> bool:
+        return self._evaluate(target_update)
+
+    def mask(self, batch) -> "_np.ndarray":
+        """
+        mask evaluates the predicate on a columnar.ColumnarBatch
+        :return: a boolean NumPy array that is True for the target updates that match
+        """
+        if _np is None:
+            raise ImportError("mask requires numpy")
+        n = len(batch)
+        self._counts[0] += n
+        alive = _np.ones(n, dtype=bool)
+        for i, term in enumerate(self._vector_terms):
+            before = int(alive.sum())
+            alive &= term(batch.columns, batch.valid, n)
+            self._counts[i + 1] += before - int(alive.sum())
+        return alive
+
+    def filter(self, batch):
+        """
+        filter returns the target updates of a batch that match, as a list for lists of target updates and as a
+        columnar.ColumnarBatch for columnar batches
+        """
+        if isinstance(batch, list):
+            evaluate = self._evaluate
+            return [t for t in batch if evaluate(t)]
+        return batch.select(self.mask(batch))
+
+    def stats(self) -> List[TermStats]:
+        """
+        stats returns how selective each top-level "and" term was so far, in the order of evaluation
+        """
+        stats = []
+        evaluated = self._counts[0]
+        for i, text in enumerate(self._texts):
+            stats.append(TermStats(text, evaluated, evaluated - self._counts[i + 1]))
+            evaluated -= self._counts[i + 1]
+        return stats
+
+    def __repr__(self) -> str:
+        return "Predicate({!r})".format(self.expression)
@@ -0,0 +1,146 @@
+from enum import Enum
+
+import numpy as np
+import responses
+
+from client import Client, ErrServerDisconnected, _STREAM_V2_URL
+from columnar import ColumnarBuilder, ColumnarBatch
+from predicate import Predicate, ErrInvalidExpression
+from target import Target
+
+
+class T(Enum):
+    args = 0
+    want = 1
+    err = 2
+
+
+_TARGETS = [
+    {"icao_address": "780A3F", "speed": 450.0, "on_ground": False, "collection_type": "satellite",
+     "aircraft_type_icao": "A333", "airline_iata": "MU", "callsign": "CES5163"},
+    {"icao_address": "780A3F", "speed": 120.0, "on_ground": True, "collection_type": "terrestrial",
+     "aircraft_type_icao": "A333", "airline_iata": "MU", "callsign": "CES5163"},
+    {"icao_address": "ADB984", "speed": 310.0, "collection_type": "terrestrial", "aircraft_type_icao": "B738"},
+    {"icao_address": "780A3F", "speed": 0.0, "on_ground": True, "collection_type": "terrestrial"},
+    {"icao_address": "ADB985", "on_ground": False, "airline_iata": "FM"},
+]
+
+
+def _batch(targets) -> ColumnarBatch:
+    b = ColumnarBuilder()
+    for t in targets:
+        b.append(t)
+    return b.build()
+
+
+class TestPredicate(object):
+
+    def test_evaluate(self):
+        """
+        test_evaluate tests that single target updates and columnar batches are evaluated identically
+        :return:
+        """
+        tests = [
+            {
+                T.args: "speed > 300",
+                T.want: [True, False, True, False, False]
+            }, {
+                T.args: "100 < speed <= 310 and collection_type == 'terrestrial'",
+                T.want: [False, True, True, False, False]
+            }, {
+                T.args: "not speed > 300",
+                T.want: [False, True, False, True, True]
+            }, {
+                T.args: "aircraft_type_icao.startswith(('A3', 'B7')) or callsign.endswith('63')",
+                T.want: [True, True, True, False, False]
+            }, {
+                T.args: "airline_iata in ('MU', 'FM')",
+                T.want: [True, True, False, False, True]
+            }, {
+                T.args: "airline_iata not in ['MU'] and on_ground == False",
+                T.want: [False, False, False, False, True]
+            }, {
+                T.args: "on_ground",
+                T.want: [False, True, False, True, False]
+            }, {
+                T.args: "changed(on_ground)",
+                T.want: [False, True, False, False, False]
+            }, {
+                T.args: "changed(collection_type) or changed(on_ground)",
+                T.want: [False, True, False, False, False]
+            }, {
+                T.args: "squawk == None and speed != None",
+                T.want: [True, True, True, True, False]
+            }
+        ]
+
+        for test in tests:
+            p = Predicate(test[T.args])
+            assert [p(t) for t in _TARGETS] == test[T.want], test[T.args]
+            assert list(Predicate(test[T.args]).mask(_batch(_TARGETS))) == test[T.want], test[T.args]
+            p = Predicate(test[T.args])
+            assert [p(Target.from_dict(t)) for t in _TARGETS] == test[T.want], test[T.args]
+
+    def test_invalid(self):
+        """
+        test_invalid tests that unsupported expressions are rejected when the predicate is compiled
+        """
+        tests = ["speed >", "speed + 1 > 2", "__import__('os')", "speed.__class__", "changed", "changed(1)",
+                 "callsign.startswith(1)", "callsign.lower() == 'x'", "speed is None", "[t for t in speed]"]
+
+        for test in tests:
+            try:
+                Predicate(test)
+                assert False, test  # expected behavior is not to arrive here
+            except ErrInvalidExpression:
+                pass
+
+    def test_stats(self):
+        """
+        test_stats tests that every top-level "and" term counts the target updates it saw and let through
+        """
+        p = Predicate("collection_type == 'terrestrial' and (speed > 100 or on_ground) and airline_iata == 'MU'")
+        for t in _TARGETS:
+            p(t)
+        p.mask(_batch(_TARGETS))
+
+        stats = [(s.expression, s.evaluated, s.passed) for s in p.stats()]
+        assert stats == [("collection_type == 'terrestrial'", 10, 6),
+                         ("(speed > 100) or on_ground", 6, 6),
+                         ("airline_iata == 'MU'", 6, 2)]
+        assert p.stats()[2].selectivity == 2 / 6
+        assert Predicate("speed > 1").stats()[0].selectivity is None
+
+    def test_filter(self):
+        """
+        test_filter tests that lists and columnar batches are filtered
+        """
+        p = Predicate("speed > 300")
+
+        assert p.filter(_TARGETS) == [_TARGETS[0], _TARGETS[2]]
+        batch = p.filter(_batch(_TARGETS))
+        assert isinstance(batch, ColumnarBatch)
+        assert list(batch["icao_address"]) == ["780A3F", "ADB984"]
+        assert np.array_equal(batch["speed"], [450.0, 310.0])
+
+    @responses.activate
+    def test_stream(self):
+        """
+        test_stream tests that Client.stream drops the target updates that do not match
+        """
+        responses.add(responses.GET, _STREAM_V2_URL,
+                      body="""{"target":{"icao_address": "ADB981", "speed": 310}}
+{"target":{"icao_address": "ADB982", "speed": 120}}
+{"target":{"icao_address": "ADB983"}}""",
+                      status=200)
+
+        targets = []
+        p = Predicate("speed > 300")
+        try:
+            Client("token").stream(targets.append, predicate=p)
+            assert False  # expected behavior is not to arrive here
+        except ErrServerDisconnected:
+            pass
+
+        assert targets == [{"icao_address": "ADB981", "speed": 310}]
+        assert p.stats()[0].evaluated == 3
@@ -0,0 +1,321 @@
+"""
+recorder records the raw lines of /stream to gzip compressed NDJSON segments, and replays them, to reproduce the exact
+message sequence of a stream, or to reprocess and load-test without calling the API.
+
+    with Recorder("recording") as recorder:
+        c.stream(on_target, line_callback=recorder)
+
+    c.replay(Replayer("recording").lines(), on_target)               # as fast as possible
+    c.replay(Replayer("recording", speed=10).lines(), on_target)     # 10 times faster than recorded
+
+A new segment is started when a segment holds max_bytes of (uncompressed) lines or is max_seconds old. Next to every
+segment, an index lists the position tokens of the segment and their line numbers, so that a replay can start after
+a position token without decompressing the segments before it.
+"""
+
+import calendar
+import gzip
+import json
+import os
+import queue
+import re
+import threading
+import time
+from glob import glob
+from os import path
+from typing import Optional, Dict, List, Any, Callable, Iterator, Tuple
+
+_DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+_DEFAULT_MAX_SECONDS = 3600.0
+# _BUFFER_SIZE is the number of bytes of lines that are compressed at once
+_BUFFER_SIZE = 64 * 1024
+# _PENDING_BUFFERS is the number of buffers that wait for the writer before record() blocks
+_PENDING_BUFFERS = 64
+_SEGMENT_PATTERN = "segment-*.ndjson.gz"
+_INDEX_SUFFIX = ".index.json"
+_POSITION_TOKEN = b'"position_token"'
+_TIMESTAMP = re.compile(rb'"timestamp"\s*:\s*"([^"]+)"')
+
+
+class Recorder(object):
+    """
+    Recorder writes raw /stream lines to rotated segments in a directory. It is the line_callback of Client.stream,
+    and is thread-safe, so that the shards of Client.stream_sharded can share it.
+    Lines are buffered, and compressed and written by a writer thread, so that the stream is not held up by the
+    compression. An error of the writer is raised by the next call to record() or close().
+    """
+
+    def __init__(self, directory: str, max_bytes: int = _DEFAULT_MAX_BYTES, max_seconds: float = _DEFAULT_MAX_SECONDS,
+                 compresslevel: int = 1, clock: Callable[[], float] = time.time):
+        """
+
+        :param directory: The directory of the segments, created if it does not exist
+        :param max_bytes: The number of uncompressed bytes after which a new segment is started
+        :param max_seconds: The age in seconds after which a new segment is started
+        :param compresslevel: The gzip compression level, from 1 (fastest) to 9 (smallest). At 1, recordings of the \
+        stream take about 8% of their raw size, at 6 about 6% for twice the CPU time
+        :param clock: The clock that max_seconds refers to, and that names the segments, in seconds since the epoch
+        """
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes
+        self.max_seconds: float = max_seconds
+        self.compresslevel: int = compresslevel
+        self._clock = clock
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        existing = segments(directory)
+        self._sequence: int = _sequence(existing[-1]) + 1 if existing else 0
+        self._file: Optional[gzip.GzipFile] = None
+        self._path: Optional[str] = None
+        self._started: float = 0.0
+        self._buffer: List[bytes] = []
+        self._buffered: int = 0
+        self._bytes: int = 0
+        self._lines: int = 0
+        self._position_tokens: List[Tuple[int, str]] = []
+        self._pending: "queue.Queue[Optional[Callable[[], None]]]" = queue.Queue(_PENDING_BUFFERS)
+        self._writer: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+        self.segments: int = 0
+
+    def _write(self):
+        while True:
+            task = self._pending.get()
+            if task is None:
+                return
+            if self._error is None:
+                try:
+                    task()
+                except BaseException as e:
+                    self._error = e
+
+    def _submit(self, task: Optional[Callable[[], None]]):
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write, name="recorder-writer", daemon=True)
+            self._writer.start()
+        self._pending.put(task)
+
+    def _raise(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _open(self, now: float):
+        self._path = path.join(self.directory, "segment-{:06d}-{}.ndjson.gz".format(
+            self._sequence, time.strftime("%Y%m%dT%H%M%SZ", time.gmtime(now))))
+        self._sequence += 1
+        self._file = gzip.open(self._path, "wb", compresslevel=self.compresslevel)
+        self._started = now
+        self._bytes = 0
+        self._lines = 0
+        self._position_tokens = []
+        self.segments += 1
+
+    def _flush(self):
+        if self._buffer:
+            data = b"".join(self._buffer)
+            write = self._file.write
+            self._submit(lambda: write(data))
+            self._buffer = []
+            self._buffered = 0
+
+    def _close(self):
+        """
+        _close completes the current segment and writes its index
+        """
+        if self._file is None:
+            return
+        self._flush()
+        f = self._file
+        index = {"segment": path.basename(self._path), "lines": self._lines, "bytes": self._bytes,
+                 "position_tokens": self._position_tokens}
+        index_path = self._path + _INDEX_SUFFIX
+        self._file = None
+
+        def complete():
+            f.close()
+            # the index is renamed into place, so that an index always describes a complete segment
+            with open(index_path + ".tmp", "w") as index_file:
+                json.dump(index, index_file)
+            os.replace(index_path + ".tmp", index_path)
+
+        self._submit(complete)
+
+    def record(self, line: bytes):
+        """
+        record appends a raw line, without its newline, to the current segment
+        """
+        size = len(line) + 1
+        with self._lock:
+            self._raise()
+            now = self._clock()
+            if self._file is not None and ((self._bytes + size > self.max_bytes and self._lines > 0) or
+                                           now - self._started >= self.max_seconds):
+                self._close()
+            if self._file is None:
+                self._open(now)
+            if _POSITION_TOKEN in line:
+                token = json.loads(line).get("position_token")
+                if token is not None:
+                    self._position_tokens.append((self._lines, token))
+            self._buffer.append(line + b"\n")
+            self._buffered += size
+            self._bytes += size
+            self._lines += 1
+            if self._buffered >= _BUFFER_SIZE:
+                self._flush()
+
+    __call__ = record
+
+    def rotate(self):
+        """
+        rotate completes the current segment, the next line starts a new one
+        """
+        with self._lock:
+            self._close()
+
+    def close(self):
+        """
+        close completes the current segment and waits for the writer, e.g. before the process exits
+        """
+        with self._lock:
+            self._close()
+            if self._writer is not None:
+                self._submit(None)
+                self._writer.join()
+                self._writer = None
+            self._raise()
+
+    def __enter__(self) -> "Recorder":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _sequence(segment: str) -> int:
+    return int(path.basename(segment).split("-")[1])
+
+
+def segments(directory: str) -> List[str]:
+    """
+    segments returns the paths of the segments of a recording, oldest first
+    """
+    return sorted(glob(path.join(directory, _SEGMENT_PATTERN)), key=_sequence)
+
+
+def read_index(segment: str) -> Optional[Dict[str, Any]]:
+    """
+    read_index returns the index of a segment, or None if the segment is incomplete (e.g. still being recorded)
+    """
+    try:
+        with open(segment + _INDEX_SUFFIX) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _epoch(timestamp: bytes, minutes: Dict[bytes, int]) -> float:
+    # ISO 8601 timestamps in UTC are parsed once per minute, the seconds are added to the start of the minute
+    minute = timestamp[:16]
+    start = minutes.get(minute)
+    if start is None:
+        start = minutes[minute] = calendar.timegm(time.strptime(minute.decode(), "%Y-%m-%dT%H:%M"))
+    return start + float(timestamp[17:].rstrip(b"Z") or 0)
+
+
+class Replayer(object):
+    """
+    Replayer reads the lines of a recording back, for Client.replay. Lines are handed over as fast as possible, or
+    paced by the timestamps of their messages, as recorded or faster. Lines without timestamp (position tokens) are
+    handed over right after the line before them, and timestamps that are older than an earlier one (late target
+    updates) do not hold the replay up.
+    """
+
+    def __init__(self, directory: str, speed: Optional[float] = None, position_token: Optional[str] = None,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        """
+
+        :param directory: The directory of the recording
+        :param speed: The speed-up over the recorded pace, e.g. 10 to replay an hour in 6 minutes; None for as fast \
+        as possible
+        :param position_token: The recorded position token after which the replay starts, from the beginning if None
+        :param clock: The clock that paces the replay, in seconds
+        :param sleep: The function that waits for a number of seconds
+        """
+        if speed is not None and speed <= 0:
+            raise ValueError("speed must be positive, got {}".format(speed))
+        self.directory: str = directory
+        self.speed: Optional[float] = speed
+        self.position_token: Optional[str] = position_token
+        self._clock = clock
+        self._sleep = sleep
+
+    def _start(self, paths: List[str]) -> Tuple[int, int]:
+        """
+        _start finds the segment and the line after the position token to start from
+        """
+        if self.position_token is None:
+            return 0, 0
+        for i, segment in enumerate(paths):
+            index = read_index(segment)
+            if index is None:
+                # the last segment of an interrupted recording has no index, it is searched line by line
+                for n, line in enumerate(self._read(segment)):
+                    if _POSITION_TOKEN in line and json.loads(line).get("position_token") == self.position_token:
+                        return i, n + 1
+                continue
+            for n, token in index["position_tokens"]:
+                if token == self.position_token:
+                    return i, n + 1
+        raise ValueError("position token {} is not in the recording".format(self.position_token))
+
+    @staticmethod
+    def _read(segment: str) -> Iterator[bytes]:
+        try:
+            with gzip.open(segment, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        return
+                    yield line[:-1]
+        except EOFError:
+            # the segment of an interrupted recording ends with an incomplete gzip member and maybe an incomplete line
+            return
+
+    def _all_lines(self) -> Iterator[bytes]:
+        paths = segments(self.directory)
+        first, skip = self._start(paths)
+        for segment in paths[first:]:
+            for line in self._read(segment):
+                if skip:
+                    skip -= 1
+                    continue
+                yield line
+
+    def lines(self) -> Iterator[bytes]:
+        """
+        lines returns the recorded lines, without newlines, paced if speed is set
+        """
+        if self.speed is None:
+            return self._all_lines()
+        return self._paced(self._all_lines())
+
+    def _paced(self, lines: Iterator[bytes]) -> Iterator[bytes]:
+        minutes: Dict[bytes, int] = {}
+        search = _TIMESTAMP.search
+        clock, sleep, speed = self._clock, self._sleep, self.speed
+        first: Optional[float] = None
+        latest = -float("inf")
+        started = 0.0
+        for line in lines:
+            match = search(line)
+            if match is not None:
+                timestamp = _epoch(match.group(1), minutes)
+                if first is None:
+                    first, started = timestamp, clock()
+                elif timestamp > latest:
+                    delay = started + (timestamp - first) / speed - clock()
+                    if delay > 0:
+                        sleep(delay)
+                latest = max(latest, timestamp)
+            yield line
@@ -0,0 +1,163 @@
+import gzip
+import os
+import tempfile
+from enum import Enum
+
+import responses
+
+from client import Client, ErrServerDisconnected, _STREAM_V2_URL
+from recorder import Recorder, Replayer, segments, read_index
+
+
+class T(Enum):
+    args = 0
+    want = 1
+    err = 2
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+_LINES = [
+    b'{"target":{"icao_address":"A","timestamp":"2021-05-21T12:00:00Z"}}',
+    b'{"target":{"icao_address":"B","timestamp":"2021-05-21T12:00:10.5Z"}}',
+    b'{"position_token":"token1"}',
+    b'{"status":{"level":"INFO","message":"keep-alive","timestamp":"2021-05-21T12:00:30Z"}}',
+    b'{"target":{"icao_address":"C","timestamp":"2021-05-21T12:00:05Z"}}',
+    b'{"target":{"icao_address":"D","timestamp":"2021-05-21T12:01:00Z"}}',
+    b'{"position_token":"token2"}',
+    b'{"target":{"icao_address":"E","timestamp":"2021-05-21T12:01:01Z"}}',
+]
+
+
+def _record(directory: str, lines, **kwargs) -> Recorder:
+    recorder = Recorder(directory, **kwargs)
+    for line in lines:
+        recorder(line)
+    return recorder
+
+
+class TestRecorder(object):
+
+    def test_rotate(self):
+        """
+        test_rotate tests that segments are rotated by size and by age, and indexed with their position tokens
+        """
+        clock = Clock()
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = Recorder(directory, max_bytes=200, max_seconds=25, clock=clock)
+            for i, line in enumerate(_LINES):
+                clock.now = 10 * i
+                recorder(line)
+            recorder.close()
+
+            paths = segments(directory)
+            assert [os.path.basename(p) for p in paths] == [
+                "segment-000000-19700101T000000Z.ndjson.gz",
+                "segment-000001-19700101T000030Z.ndjson.gz",
+                "segment-000002-19700101T000050Z.ndjson.gz",
+            ]
+            with gzip.open(paths[1]) as f:
+                assert f.read() == _LINES[3] + b"\n" + _LINES[4] + b"\n"
+            assert [read_index(p)["lines"] for p in paths] == [3, 2, 3]
+            assert [read_index(p)["position_tokens"] for p in paths] == [[[2, "token1"]], [], [[1, "token2"]]]
+
+            # a new recorder continues the sequence of the segments
+            _record(directory, _LINES[:1], clock=clock).close()
+            assert os.path.basename(segments(directory)[-1]).startswith("segment-000003-")
+
+
+class TestReplayer(object):
+
+    def test_lines(self):
+        """
+        test_lines tests that lines are replayed from the beginning or after a position token, also from an \
+        interrupted recording
+        """
+        tests = [
+            {
+                T.args: None,
+                T.want: _LINES
+            }, {
+                T.args: "token1",
+                T.want: _LINES[3:]
+            }, {
+                T.args: "token2",
+                T.want: _LINES[7:]
+            }, {
+                T.args: "token3",
+                T.err: ValueError
+            }
+        ]
+
+        for interrupted in [False, True]:
+            with tempfile.TemporaryDirectory() as directory:
+                _record(directory, _LINES[:4]).close()
+                recorder = _record(directory, _LINES[4:])
+                if interrupted:
+                    # the last segment is neither indexed nor complete, its last line is cut off
+                    path = segments(directory)[-1]
+                    with open(path, "wb") as f:
+                        f.write(gzip.compress(b"".join(line + b"\n" for line in _LINES[4:]) + b'{"target"')[:-8])
+                else:
+                    recorder.close()
+
+                for test in tests:
+                    try:
+                        got = list(Replayer(directory, position_token=test[T.args]).lines())
+                        if T.err in test:
+                            assert False  # expected behavior is not to arrive here
+                        assert got == test[T.want], (interrupted, test[T.args])
+                    except ValueError:
+                        assert test.get(T.err) is ValueError
+
+    def test_paced(self):
+        """
+        test_paced tests that lines are paced by their timestamps at the given speed, and that late target updates \
+        and position tokens do not hold the replay up
+        """
+        clock = Clock()
+        with tempfile.TemporaryDirectory() as directory:
+            _record(directory, _LINES).close()
+            replayed = []
+            for line in Replayer(directory, speed=2, clock=clock, sleep=clock.sleep).lines():
+                replayed.append(clock.now)
+
+        assert replayed == [0, 5.25, 5.25, 15, 15, 30, 30, 30.5]
+
+    @responses.activate
+    def test_replay(self):
+        """
+        test_replay tests that a recorded stream replays to the same callbacks, batches and position tokens
+        """
+        responses.add(responses.GET, _STREAM_V2_URL, body=b"\n".join(_LINES) + b"\n", status=200)
+
+        def run(start):
+            targets, batches, tokens = [], [], []
+            token = start(dict(target_callback=lambda t: targets.append(t["icao_address"]),
+                               position_token_callback=tokens.append,
+                               target_batch_callback=lambda b: batches.append(len(b)),
+                               predicate=lambda t: t["icao_address"] != "C"))
+            return targets, batches, tokens, token
+
+        with tempfile.TemporaryDirectory() as directory:
+            with Recorder(directory) as recorder:
+                def stream(kwargs):
+                    try:
+                        Client("token").stream(line_callback=recorder, **kwargs)
+                        assert False  # expected behavior is not to arrive here
+                    except ErrServerDisconnected:
+                        return "token2"
+
+                streamed = run(stream)
+            replayed = run(lambda kwargs: Client("token").replay(Replayer(directory).lines(), **kwargs))
+
+        assert streamed == replayed == (["A", "B", "D", "E"], [2, 1, 1], ["token1", "token2"], "token2")
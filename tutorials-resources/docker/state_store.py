@@ -0,0 +1,223 @@
+"""
+state_store keeps the latest target update of every aircraft, to answer "where is aircraft X now" and "what is in
+this area now" while streaming.
+
+    store = AircraftStateStore(ttl=300)
+    c.stream(store.wrap(on_target))
+    store.get("780A3F")
+    store.in_box(30.5, 32.0, 120.5, 122.5)
+    store.by_airline("MU")
+
+Aircraft are kept in the order of their last update, so that the ones that have not been updated for ttl seconds are
+evicted from the front in O(1) per aircraft. Positions are indexed in a grid of cell_size degrees, and airlines in a
+dict, so that area and airline queries only visit matching aircraft.
+"""
+
+import collections
+import math
+import threading
+import time
+from typing import Optional, Dict, List, Tuple, Any, Callable, Set
+
+from client import _timestamp_key
+
+_DEFAULT_TTL = 300.0
+_DEFAULT_CELL_SIZE = 1.0
+
+_Cell = Tuple[int, int]
+
+
+class _Entry(object):
+    __slots__ = ("target_update", "timestamp", "updated_at", "cell", "airline")
+
+    def __init__(self, target_update, timestamp: str, updated_at: float, cell: Optional[_Cell],
+                 airline: Optional[str]):
+        self.target_update = target_update
+        self.timestamp = timestamp
+        self.updated_at = updated_at
+        self.cell = cell
+        self.airline = airline
+
+
+class AircraftStateStore(object):
+    """
+    AircraftStateStore holds the latest target update per icao_address. Updates that are older (by timestamp) than
+    the stored one are ignored, and aircraft without an update for ttl seconds are evicted. It is thread-safe, so
+    that it can be updated by the workers of Client.stream.
+    """
+
+    def __init__(self, ttl: float = _DEFAULT_TTL, cell_size: float = _DEFAULT_CELL_SIZE,
+                 airline_field: str = "airline_iata", clock: Callable[[], float] = time.monotonic):
+        """
+
+        :param ttl: The number of seconds without an update after which an aircraft is evicted
+        :param cell_size: The size in degrees of the grid cells that index positions
+        :param airline_field: The field of the target updates that by_airline queries
+        :param clock: The clock that ttl refers to, in seconds
+        """
+        self.ttl: float = ttl
+        self.cell_size: float = cell_size
+        self.airline_field: str = airline_field
+        self._clock = clock
+        self._lock = threading.Lock()
+        # _entries is ordered by the time of the last update, the stalest aircraft first
+        self._entries: "collections.OrderedDict[str, _Entry]" = collections.OrderedDict()
+        self._cells: Dict[_Cell, Set[str]] = {}
+        self._airlines: Dict[str, Set[str]] = {}
+        self.updates: int = 0
+        self.out_of_order: int = 0
+        self.evicted: int = 0
+
+    def _cell(self, target_update) -> Optional[_Cell]:
+        latitude = target_update.get("latitude")
+        longitude = target_update.get("longitude")
+        if latitude is None or longitude is None:
+            return None
+        return int(math.floor(latitude / self.cell_size)), int(math.floor(longitude / self.cell_size))
+
+    def update(self, target_update) -> bool:
+        """
+        update stores a target update if it is newer than the stored one of the same aircraft
+        :return: whether the target update was stored
+        """
+        icao_address = target_update.get("icao_address")
+        if icao_address is None:
+            return False
+        timestamp = _timestamp_key(target_update)
+        with self._lock:
+            now = self._clock()
+            self._evict(now)
+            self.updates += 1
+            entry = self._entries.get(icao_address)
+            if entry is not None and timestamp < entry.timestamp:
+                self.out_of_order += 1
+                return False
+
+            cell = self._cell(target_update)
+            airline = target_update.get(self.airline_field)
+            if entry is None:
+                entry = _Entry(target_update, timestamp, now, None, None)
+                self._entries[icao_address] = entry
+            else:
+                entry.target_update, entry.timestamp, entry.updated_at = target_update, timestamp, now
+                self._entries.move_to_end(icao_address)
+            if cell != entry.cell:
+                self._unindex(self._cells, entry.cell, icao_address)
+                self._index(self._cells, cell, icao_address)
+                entry.cell = cell
+            if airline != entry.airline:
+                self._unindex(self._airlines, entry.airline, icao_address)
+                self._index(self._airlines, airline, icao_address)
+                entry.airline = airline
+        return True
+
+    __call__ = update
+
+    def wrap(self, callback: Optional[Callable[[Any], None]] = None) -> Callable[[Any], None]:
+        """
+        wrap returns a target callback for Client.stream that updates the store before calling callback
+        :param callback: The target callback to call after the update, may be None
+        """
+        update = self.update
+        if callback is None:
+            return update
+
+        def wrapped(target_update):
+            update(target_update)
+            callback(target_update)
+
+        return wrapped
+
+    @staticmethod
+    def _index(index: Dict, key, icao_address: str):
+        if key is not None:
+            index.setdefault(key, set()).add(icao_address)
+
+    @staticmethod
+    def _unindex(index: Dict, key, icao_address: str):
+        if key is not None:
+            aircraft = index[key]
+            aircraft.discard(icao_address)
+            if not aircraft:
+                del index[key]
+
+    def _evict(self, now: float):
+        deadline = now - self.ttl
+        entries = self._entries
+        while entries:
+            icao_address, entry = next(iter(entries.items()))
+            if entry.updated_at > deadline:
+                return
+            del entries[icao_address]
+            self._unindex(self._cells, entry.cell, icao_address)
+            self._unindex(self._airlines, entry.airline, icao_address)
+            self.evicted += 1
+
+    def evict(self):
+        """
+        evict evicts the aircraft that have not been updated for ttl seconds. Updates and queries do that as well.
+        """
+        with self._lock:
+            self._evict(self._clock())
+
+    def get(self, icao_address: str):
+        """
+        get returns the latest target update of an aircraft, or None
+        """
+        with self._lock:
+            self._evict(self._clock())
+            entry = self._entries.get(icao_address)
+            return entry.target_update if entry is not None else None
+
+    def in_box(self, south: float, north: float, west: float, east: float) -> List:
+        """
+        in_box returns the latest target updates of the aircraft within a box, which crosses the antimeridian if
+        west is greater than east (as for FilterLongitude)
+        """
+        s = self.cell_size
+        rows = range(int(math.floor(south / s)), int(math.floor(north / s)) + 1)
+        if west <= east:
+            columns = list(range(int(math.floor(west / s)), int(math.floor(east / s)) + 1))
+        else:
+            columns = list(range(int(math.floor(west / s)), int(math.floor(180 / s)) + 1)) + \
+                      list(range(int(math.floor(-180 / s)), int(math.floor(east / s)) + 1))
+
+        def inside(t) -> bool:
+            latitude, longitude = t.get("latitude"), t.get("longitude")
+            return south <= latitude <= north and \
+                ((west <= longitude <= east) if west <= east else (longitude >= west or longitude <= east))
+
+        with self._lock:
+            self._evict(self._clock())
+            if len(rows) * len(columns) > len(self._cells):
+                # large boxes visit the occupied cells instead
+                column_set = set(columns)
+                cells = [aircraft for (row, column), aircraft in self._cells.items()
+                         if rows.start <= row < rows.stop and column in column_set]
+            else:
+                cells = [self._cells[(row, column)] for row in rows for column in columns
+                         if (row, column) in self._cells]
+            targets = [self._entries[icao_address].target_update for aircraft in cells for icao_address in aircraft]
+        return [t for t in targets if inside(t)]
+
+    def by_airline(self, airline: str) -> List:
+        """
+        by_airline returns the latest target updates of the aircraft of an airline, see airline_field
+        """
+        with self._lock:
+            self._evict(self._clock())
+            return [self._entries[icao_address].target_update for icao_address in self._airlines.get(airline, ())]
+
+    def snapshot(self) -> List:
+        """
+        snapshot returns the latest target updates of all aircraft, the least recently updated first
+        """
+        with self._lock:
+            self._evict(self._clock())
+            return [entry.target_update for entry in self._entries.values()]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, icao_address: str) -> bool:
+        return self.get(icao_address) is not None
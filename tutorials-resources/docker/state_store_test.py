@@ -0,0 +1,134 @@
+from enum import Enum
+
+import responses
+
+from client import Client, ErrServerDisconnected, _STREAM_V2_URL
+from state_store import AircraftStateStore
+from target import Target
+
+
+class T(Enum):
+    args = 0
+    want = 1
+    err = 2
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+_TARGETS = [
+    {"icao_address": "780A3F", "timestamp": "2021-05-21T12:00:00Z", "latitude": 31.1, "longitude": 121.8,
+     "airline_iata": "MU"},
+    {"icao_address": "ADB984", "timestamp": "2021-05-21T12:00:01Z", "latitude": 31.9, "longitude": 121.1,
+     "airline_iata": "FM"},
+    {"icao_address": "A1B2C3", "timestamp": "2021-05-21T12:00:01Z", "latitude": 10.0, "longitude": 179.5,
+     "airline_iata": "MU"},
+    {"icao_address": "D4E5F6", "timestamp": "2021-05-21T12:00:02Z", "latitude": 10.5, "longitude": -179.5},
+    {"icao_address": "000001", "timestamp": "2021-05-21T12:00:02Z"},
+]
+
+
+def _icao_addresses(targets):
+    return sorted(t["icao_address"] for t in targets)
+
+
+class TestAircraftStateStore(object):
+
+    def test_update(self):
+        """
+        test_update tests that the newest target update per aircraft is kept, and older ones are ignored
+        """
+        store = AircraftStateStore()
+        for t in _TARGETS:
+            assert store.update(t)
+
+        moved = dict(_TARGETS[0], timestamp="2021-05-21T12:00:00.5Z", latitude=40.0, airline_iata="CA")
+        assert store.update(moved)
+        assert not store.update(dict(_TARGETS[0], timestamp="2021-05-21T12:00:00.25Z"))
+        assert not store.update({"latitude": 1.0})
+
+        assert len(store) == 5
+        assert store.get("780A3F") is moved
+        assert store.get("FFFFFF") is None
+        assert "ADB984" in store
+        assert (store.updates, store.out_of_order) == (7, 1)
+        assert _icao_addresses(store.by_airline("MU")) == ["A1B2C3"]
+        assert _icao_addresses(store.by_airline("CA")) == ["780A3F"]
+
+    def test_in_box(self):
+        """
+        test_in_box tests that box queries return the aircraft within the box, across the antimeridian as well
+        """
+        tests = [
+            {
+                T.args: (30.5, 32.0, 120.5, 122.5),
+                T.want: ["780A3F", "ADB984"]
+            }, {
+                T.args: (31.0, 31.5, 121.5, 122.0),
+                T.want: ["780A3F"]
+            }, {
+                T.args: (5.0, 15.0, 170.0, -170.0),
+                T.want: ["A1B2C3", "D4E5F6"]
+            }, {
+                T.args: (-90.0, 90.0, -180.0, 180.0),
+                T.want: ["780A3F", "A1B2C3", "ADB984", "D4E5F6"]
+            }, {
+                T.args: (0.0, 1.0, 0.0, 1.0),
+                T.want: []
+            }
+        ]
+
+        for cell_size in [0.1, 1.0, 45.0]:
+            store = AircraftStateStore(cell_size=cell_size)
+            for t in _TARGETS:
+                store.update(Target.from_dict(t))
+            for test in tests:
+                assert _icao_addresses(store.in_box(*test[T.args])) == test[T.want], (cell_size, test[T.args])
+
+    def test_evict(self):
+        """
+        test_evict tests that aircraft without an update for ttl seconds are evicted, and removed from the indexes
+        """
+        clock = Clock()
+        store = AircraftStateStore(ttl=10, clock=clock)
+        store.update(_TARGETS[0])
+        clock.now = 5
+        store.update(_TARGETS[1])
+        clock.now = 8
+        store.update(dict(_TARGETS[0], timestamp="2021-05-21T12:00:05Z"))
+
+        clock.now = 16
+        assert _icao_addresses(store.snapshot()) == ["780A3F"]
+        assert store.by_airline("FM") == []
+        assert _icao_addresses(store.in_box(30.5, 32.0, 120.5, 122.5)) == ["780A3F"]
+        clock.now = 18
+        store.evict()
+        assert len(store) == 0
+        assert store.evicted == 2
+        assert store._cells == {} and store._airlines == {}
+
+    @responses.activate
+    def test_stream(self):
+        """
+        test_stream tests that a wrapped target callback updates the store before it is called
+        """
+        responses.add(responses.GET, _STREAM_V2_URL,
+                      body="""{"target":{"icao_address": "ADB981", "timestamp": "2021-05-21T12:00:01Z"}}
+{"target":{"icao_address": "ADB981", "timestamp": "2021-05-21T12:00:00Z"}}""",
+                      status=200)
+
+        store = AircraftStateStore()
+        seen = []
+        try:
+            Client("token").stream(store.wrap(lambda t: seen.append(store.get(t["icao_address"]))))
+            assert False  # expected behavior is not to arrive here
+        except ErrServerDisconnected:
+            pass
+
+        assert seen == [{"icao_address": "ADB981", "timestamp": "2021-05-21T12:00:01Z"}] * 2
+        assert store.out_of_order == 1
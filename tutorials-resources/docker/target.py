@@ -0,0 +1,155 @@
+"""
+target offers Target, a compact alternative to the dicts that represent target updates.
+
+Target updates carry 30+ fields, most of which are only read occasionally. Target keeps the frequently used fields \
+in typed slots, and the rarely used ones in a single tuple from which they are looked up on access. Repeated strings \
+such as airline names, airport codes or aircraft types are interned, so that buffered target updates share them.
+
+The rare fields are copied into the tuple when the Target is built, not extracted lazily on first access: the decoder \
+hands over a parsed dict, and keeping it around until a rare field is read would keep all of its values alive, which \
+is the memory that Target saves. Construction costs one tuple of the rare fields per target update.
+
+Use it via the Decoder of the client:
+
+    c = Client(token, decoder=JSONDecoder(target_factory=Target.from_dict))
+"""
+
+import sys
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, Tuple
+
+# _CORE_FIELDS are kept in typed slots
+_CORE_FIELDS = ("icao_address", "timestamp", "latitude", "longitude", "altitude_baro", "heading", "speed",
+                "vertical_rate", "on_ground", "callsign", "collection_type")
+
+# _RARE_FIELDS are kept in a tuple, the bool marks fields whose values repeat across target updates and are interned
+_RARE_FIELDS = (("tail_number", True), ("flight_number", True), ("ingestion_time", False), ("squawk", True),
+                ("aircraft_type_icao", True), ("aircraft_type_name", True), ("airline_iata", True),
+                ("airline_name", True), ("departure_utc_offset", True), ("departure_airport_icao", True),
+                ("departure_airport_iata", True), ("departure_scheduled_time", True),
+                ("departure_estimated_time", True), ("arrival_utc_offset", True), ("arrival_airport_icao", True),
+                ("arrival_airport_iata", True), ("arrival_scheduled_time", True), ("arrival_estimated_time", True),
+                ("takeoff_time", True), ("landing_time", True), ("source", True))
+
+_RARE_INDEX = {name: i for i, (name, _) in enumerate(_RARE_FIELDS)}
+_KNOWN_FIELDS = frozenset(_CORE_FIELDS) | frozenset(_RARE_INDEX)
+_TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+_TIMESTAMP_FORMAT_NO_FRACTION = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def _intern(value):
+    if type(value) is str:
+        return sys.intern(value)
+    return value
+
+
+def parse_timestamp(value: str) -> datetime:
+    """
+    parse_timestamp parses the UTC timestamps of the API, e.g. 2021-03-20T12:00:09.753Z or 2021-03-20T12:00:08Z
+    """
+    fmt = _TIMESTAMP_FORMAT if "." in value else _TIMESTAMP_FORMAT_NO_FRACTION
+    return datetime.strptime(value, fmt).replace(tzinfo=timezone.utc)
+
+
+class Target(object):
+    """
+    Target is a target update. Fields are available as attributes, fields that were not sent are None.
+    It also supports the read-only part of the dict interface (get, [] and in), so that it can be used in place of
+    the target update dicts, and converts back with to_dict().
+    """
+
+    __slots__ = _CORE_FIELDS + ("_rare", "_extra")
+
+    icao_address: Optional[str]
+    timestamp: Optional[str]
+    latitude: Optional[float]
+    longitude: Optional[float]
+    altitude_baro: Optional[float]
+    heading: Optional[float]
+    speed: Optional[float]
+    vertical_rate: Optional[float]
+    on_ground: Optional[bool]
+    callsign: Optional[str]
+    collection_type: Optional[str]
+
+    _rare: Tuple
+    _extra: Optional[Dict[str, Any]]
+
+    @classmethod
+    def from_dict(cls, target_update: Dict[str, Any]) -> "Target":
+        """
+        from_dict converts a target update dict as sent by the API. Fields that are unknown to Target are kept, too.
+        The rare fields are copied eagerly, and the dict is not referenced afterwards.
+        """
+        t = cls.__new__(cls)
+        get = target_update.get
+        t.icao_address = _intern(get("icao_address"))
+        t.timestamp = get("timestamp")
+        t.latitude = get("latitude")
+        t.longitude = get("longitude")
+        t.altitude_baro = get("altitude_baro")
+        t.heading = get("heading")
+        t.speed = get("speed")
+        t.vertical_rate = get("vertical_rate")
+        t.on_ground = get("on_ground")
+        t.callsign = _intern(get("callsign"))
+        t.collection_type = _intern(get("collection_type"))
+        t._rare = tuple([_intern(get(name)) if interned else get(name) for name, interned in _RARE_FIELDS])
+
+        t._extra = None
+        if len(target_update) > len(_CORE_FIELDS) + len(_RARE_FIELDS) or \
+                any(key not in _KNOWN_FIELDS for key in target_update):
+            t._extra = {k: v for k, v in target_update.items() if k not in _KNOWN_FIELDS}
+        return t
+
+    def __getattr__(self, name: str):
+        # only called for names that are not slots, i.e. rarely used and unknown fields
+        i = _RARE_INDEX.get(name)
+        if i is not None:
+            return self._rare[i]
+        extra = object.__getattribute__(self, "_extra")
+        if extra is not None and name in extra:
+            return extra[name]
+        raise AttributeError("'Target' object has no attribute '{}'".format(name))
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        get returns the value of a field, or default if the field was not sent
+        """
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+    def __getitem__(self, key: str) -> Any:
+        value = getattr(self, key, None)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        return getattr(self, key, None) is not None
+
+    @property
+    def time(self) -> Optional[datetime]:
+        """
+        time is the timestamp of the target update, parsed on access
+        """
+        return parse_timestamp(self.timestamp) if self.timestamp is not None else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        to_dict converts the target update back into the dict sent by the API. Fields that the API sent as null are
+        left out, like fields that were not sent: Target does not tell them apart (see get).
+        """
+        d = {name: getattr(self, name) for name in _CORE_FIELDS}
+        d.update(zip((name for name, _ in _RARE_FIELDS), self._rare))
+        if self._extra is not None:
+            d.update(self._extra)
+        return {k: v for k, v in d.items() if v is not None}
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Target):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        return "Target({})".format(self.to_dict())
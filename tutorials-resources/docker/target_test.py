@@ -0,0 +1,119 @@
+import pickle
+from datetime import datetime, timezone
+from enum import Enum
+
+from client import JSONDecoder
+from target import Target, parse_timestamp
+
+
+class T(Enum):
+    args = 0
+    want = 1
+    err = 2
+
+
+_TARGET_UPDATE = {"icao_address": "780A3F", "timestamp": "2021-03-20T12:00:09.753Z", "latitude": 31.19,
+                  "longitude": 121.33, "altitude_baro": 1175, "heading": 349.0, "speed": 161.0, "vertical_rate": 896,
+                  "on_ground": False, "callsign": "CES5163", "collection_type": "terrestrial",
+                  "tail_number": "B-1234", "airline_name": "China Eastern Airlines", "airline_iata": "MU",
+                  "departure_airport_iata": "SHA", "ingestion_time": "2021-03-20T12:00:10.001Z"}
+
+
+class TestTarget(object):
+
+    def test_from_dict_to_dict(self):
+        """
+        test_from_dict_to_dict tests that target updates convert back unchanged, including unknown fields, except for
+        null fields that are left out
+        """
+        tests = [
+            {
+                T.args: {},
+            }, {
+                T.args: {"icao_address": "ADB984"},
+            }, {
+                T.args: _TARGET_UPDATE,
+            }, {
+                T.args: dict(_TARGET_UPDATE, new_field=[1, 2]),
+            }, {
+                T.args: {"icao_address": "ADB984", "callsign": None, "squawk": None, "new_field": None},
+                T.want: {"icao_address": "ADB984"},
+            }
+        ]
+
+        for test in tests:
+            assert Target.from_dict(test[T.args]).to_dict() == test.get(T.want, test[T.args])
+
+    def test_access(self):
+        """
+        test_access tests attribute, item and get access to core, rare, unknown and missing fields
+        """
+        t = Target.from_dict(dict(_TARGET_UPDATE, new_field=7))
+
+        assert t.icao_address == "780A3F"
+        assert t["latitude"] == 31.19
+        assert t.airline_name == "China Eastern Airlines"
+        assert t.get("tail_number") == "B-1234"
+        assert t.new_field == 7
+        assert t.squawk is None
+        assert t.get("squawk", "7000") == "7000"
+        assert "airline_iata" in t
+        assert "squawk" not in t
+        try:
+            _ = t["squawk"]
+            assert False  # expected behavior is not to arrive here
+        except KeyError:
+            pass
+        try:
+            _ = t.not_a_field
+            assert False  # expected behavior is not to arrive here
+        except AttributeError:
+            pass
+
+    def test_compact(self):
+        """
+        test_compact tests that Target has no per-instance dict and shares repeated strings
+        """
+        a = Target.from_dict(_TARGET_UPDATE)
+        b = Target.from_dict({k: "".join(v) if isinstance(v, str) else v for k, v in _TARGET_UPDATE.items()})
+
+        assert not hasattr(a, "__dict__")
+        assert a.airline_name is b.airline_name
+        assert a == b
+
+    def test_time(self):
+        """
+        test_time tests that timestamps with and without fractional seconds are parsed
+        """
+        tests = [
+            {
+                T.args: "2021-03-20T12:00:09.753Z",
+                T.want: datetime(2021, 3, 20, 12, 0, 9, 753000, tzinfo=timezone.utc)
+            }, {
+                T.args: "2021-03-20T12:00:08Z",
+                T.want: datetime(2021, 3, 20, 12, 0, 8, tzinfo=timezone.utc)
+            }
+        ]
+
+        for test in tests:
+            assert parse_timestamp(test[T.args]) == test[T.want]
+            assert Target.from_dict({"timestamp": test[T.args]}).time == test[T.want]
+        assert Target.from_dict({}).time is None
+
+    def test_pickle(self):
+        """
+        test_pickle tests that targets can be pickled, e.g. to hand them to other processes
+        """
+        t = Target.from_dict(dict(_TARGET_UPDATE, new_field=7))
+        assert pickle.loads(pickle.dumps(t)) == t
+
+    def test_decoder(self):
+        """
+        test_decoder tests that Target plugs into the client's JSONDecoder
+        """
+        d = JSONDecoder(target_factory=Target.from_dict)
+        key, t = d.decode(b'{"target":{"icao_address":"ADB984","airline_iata":"MU"}}')
+
+        assert key == "target"
+        assert isinstance(t, Target)
+        assert t.to_dict() == {"icao_address": "ADB984", "airline_iata": "MU"}
@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+"""
+server is a local stand-in for the Aviation v2 /targets/stream and /targets/history endpoints, so that clients and
+benchmarks can run offline and under load. It serves target updates from recorded NDJSON (lines of {"target": ...}
+messages or of bare target updates) or from a demo.csv-style CSV file.
+
+/v2/targets/stream replays the target updates in a loop, interleaved with position tokens every token_interval
+target updates and with keep-alive status messages when keepalive seconds pass without one. The stream can be paced
+to a message rate, and ended after a number of messages to simulate server disconnects.
+/v2/targets/history returns the target updates between start and end, in timestamp order.
+
+Both endpoints support the filter parameters of the client's Filter* classes, and compression=gzip.
+"""
+
+import argparse
+import base64
+import csv
+import http.server
+import json
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from os import path
+from typing import Optional, Dict, List, Any, Callable
+from urllib.parse import urlparse, parse_qs
+
+DEMO_CSV = path.join(path.dirname(path.abspath(__file__)), "..", "..",
+                     "jupyter-notebooks", "shanghai-airport", "datasets", "demo.csv")
+
+STREAM_PATH = "/v2/targets/stream"
+HISTORY_PATH = "/v2/targets/history"
+
+_FLOAT_FIELDS = {"latitude", "longitude", "altitude_baro", "heading", "vertical_rate", "speed"}
+_BOOL_FIELDS = {"on_ground"}
+# _BATCH_SIZE is the maximum number of messages written at once
+_BATCH_SIZE = 1000
+_POSITION_TOKEN_PREFIX = "local:"
+
+
+def _typed(key: str, value: str) -> Any:
+    if key in _FLOAT_FIELDS:
+        return float(value)
+    if key in _BOOL_FIELDS:
+        return value == "True"
+    return value
+
+
+def load_targets(file_path: str) -> List[Dict[str, Any]]:
+    """
+    load_targets reads target updates from a CSV file (empty cells are omitted, as the API omits unknown fields) or
+    from an NDJSON file
+    """
+    with open(file_path, newline="") as f:
+        if file_path.endswith(".csv"):
+            return [{k: _typed(k, v) for k, v in row.items() if v != ""} for row in csv.DictReader(f)]
+        targets = []
+        for line in f:
+            if line.strip():
+                message = json.loads(line)
+                if "target" in message:
+                    targets.append(message["target"])
+                elif "icao_address" in message:
+                    targets.append(message)
+        return targets
+
+
+def _timestamp_key(timestamp: Optional[str]) -> str:
+    # the history endpoint compares and sorts the timestamps of the requests and of the target updates as strings
+    return timestamp.rstrip("Z") if timestamp is not None else ""
+
+
+def _float_range(value: str):
+    lower, upper = (float(v) for v in value.split(","))
+    return lower, upper
+
+
+def target_filter(params: Dict[str, str]) -> Callable[[Dict[str, Any]], bool]:
+    """
+    target_filter returns a function that decides whether a target update matches the filter parameters of a request
+    """
+    checks = []
+    if "latitude_between" in params:
+        south, north = _float_range(params["latitude_between"])
+        checks.append(lambda t: t.get("latitude") is not None and south <= t["latitude"] <= north)
+    if "longitude_between" in params:
+        west, east = _float_range(params["longitude_between"])
+        if west <= east:
+            checks.append(lambda t: t.get("longitude") is not None and west <= t["longitude"] <= east)
+        else:
+            checks.append(lambda t: t.get("longitude") is not None and (t["longitude"] >= west or
+                                                                         t["longitude"] <= east))
+    if "altitude_between" in params:
+        low, high = _float_range(params["altitude_between"])
+        checks.append(lambda t: t.get("altitude_baro") is not None and low <= t["altitude_baro"] <= high)
+    for param, fields in (("icao_address", ("icao_address",)), ("tail_number", ("tail_number",)),
+                          ("callsign", ("callsign",)), ("airline", ("airline_iata", "airline_name"))):
+        if param in params:
+            values = frozenset(params[param].split(","))
+            checks.append(lambda t, fields=fields, values=values: any(t.get(f) in values for f in fields))
+
+    def match(target_update) -> bool:
+        return all(check(target_update) for check in checks)
+
+    return match
+
+
+def encode_position_token(index: int) -> str:
+    return base64.b64encode("{}{}".format(_POSITION_TOKEN_PREFIX, index).encode()).decode()
+
+
+def decode_position_token(token: str) -> Optional[int]:
+    """
+    decode_position_token returns the index of the replay a position token of this server points to, or None
+    """
+    try:
+        value = base64.b64decode(token.encode()).decode()
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not value.startswith(_POSITION_TOKEN_PREFIX):
+        return None
+    return int(value[len(_POSITION_TOKEN_PREFIX):])
+
+
+def _status(message: str, code: int) -> bytes:
+    timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return json.dumps({"status": {"timestamp": timestamp, "level": "INFO", "message": message, "code": code}},
+                      separators=(",", ":")).encode() + b"\n"
+
+
+class Options(object):
+    """
+    Options configures the stream endpoint.
+    """
+
+    def __init__(self, token: Optional[str] = None, rate: float = 0, token_interval: int = 100,
+                 keepalive: float = 15.0, disconnect_after: Optional[int] = None):
+        """
+
+        :param token: The token that requests must present, any token is accepted if None
+        :param rate: The number of messages per second of a stream, unlimited if 0
+        :param token_interval: The number of target updates between two position tokens
+        :param keepalive: The number of seconds after which a keep-alive status message is sent
+        :param disconnect_after: The number of messages after which the server ends a stream, never if None
+        """
+        self.token = token
+        self.rate = rate
+        self.token_interval = token_interval
+        self.keepalive = keepalive
+        self.disconnect_after = disconnect_after
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    targets: List[Dict[str, Any]] = []
+    lines: List[bytes] = []
+    options = Options()
+    stopping = threading.Event()
+
+    def log_message(self, *args):
+        pass
+
+    def _send_chunk(self, data: bytes):
+        if data:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+    def _start(self, status: int, gzipped: bool):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if gzipped else None
+
+    def _write(self, compressor, data: bytes):
+        if compressor is not None:
+            data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        self._send_chunk(data)
+        self.wfile.flush()
+
+    def _end(self, compressor):
+        if compressor is not None:
+            self._send_chunk(compressor.flush())
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        token = self.options.token
+        if token is not None and self.headers.get("Authorization") != "Bearer {}".format(token):
+            body = json.dumps({"error": "unauthorized"}).encode()
+            self.send_response(401)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        try:
+            if url.path == STREAM_PATH:
+                self._stream(params)
+            elif url.path == HISTORY_PATH:
+                self._history(params)
+            else:
+                self.send_error(404)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def _history(self, params: Dict[str, str]):
+        start, end = _timestamp_key(params.get("start")), _timestamp_key(params.get("end"))
+        match = target_filter(params)
+        targets = sorted((t for t in self.targets if match(t)), key=lambda t: _timestamp_key(t.get("timestamp")))
+        lines = [json.dumps({"target": t}, separators=(",", ":")).encode() + b"\n" for t in targets
+                 if (not start or _timestamp_key(t.get("timestamp")) >= start) and
+                 (not end or _timestamp_key(t.get("timestamp")) <= end)]
+        compressor = self._start(200, params.get("compression") == "gzip")
+        for i in range(0, len(lines), _BATCH_SIZE):
+            self._write(compressor, b"".join(lines[i:i + _BATCH_SIZE]))
+        self._end(compressor)
+
+    def _stream(self, params: Dict[str, str]):
+        options = self.options
+        match = target_filter(params)
+        selected = [i for i, t in enumerate(self.targets) if match(t)]
+        compressor = self._start(200, params.get("compression") == "gzip")
+        if not selected:
+            # nothing matches: the stream only carries keep-alives
+            while not self.stopping.wait(options.keepalive):
+                self._write(compressor, _status("Keep-alive", 101))
+            return
+
+        # index counts the target updates of the replay, position tokens point to the last one delivered
+        index = 0
+        position_token = params.get("position_token")
+        if position_token not in (None, "LATEST", "BEGINNING"):
+            resumed = decode_position_token(position_token)
+            if resumed is not None:
+                index = resumed + 1
+        n = len(selected)
+        lines = self.lines
+        sent = 0
+        start = last_status = time.perf_counter()
+        batch_size = _BATCH_SIZE if not options.rate else max(1, min(_BATCH_SIZE, int(options.rate / 100)))
+        while not self.stopping.is_set():
+            batch = []
+            while len(batch) < batch_size:
+                batch.append(lines[selected[index % n]])
+                index += 1
+                if index % options.token_interval == 0:
+                    batch.append(b'{"position_token":"%s"}\n' % encode_position_token(index - 1).encode())
+            now = time.perf_counter()
+            if now - last_status >= options.keepalive:
+                batch.append(_status("Keep-alive", 101))
+                last_status = now
+            if options.disconnect_after is not None and sent + len(batch) >= options.disconnect_after:
+                self._write(compressor, b"".join(batch[:options.disconnect_after - sent]))
+                break
+            self._write(compressor, b"".join(batch))
+            sent += len(batch)
+            if options.rate:
+                # the stream is paced on average, so that a late batch is caught up with
+                delay = start + sent / options.rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        self._end(compressor)
+
+
+def make_server(targets: List[Dict[str, Any]], host: str = "127.0.0.1", port: int = 8080,
+                options: Optional[Options] = None) -> http.server.ThreadingHTTPServer:
+    """
+    make_server creates a server for the target updates, which runs until stop() is called on it
+    :param targets: The target updates to serve
+    :param host: The address to listen on
+    :param port: The port to listen on, any free port if 0
+    :param options: The options of the stream endpoint
+    """
+    stopping = threading.Event()
+    handler = type("Handler", (_Handler,), {
+        "targets": targets,
+        "lines": [json.dumps({"target": t}, separators=(",", ":")).encode() + b"\n" for t in targets],
+        "options": options if options is not None else Options(),
+        "stopping": stopping,
+    })
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+
+    def stop():
+        stopping.set()
+        server.shutdown()
+        server.server_close()
+
+    server.stop = stop
+    return server
+
+
+def serve_in_background(targets: List[Dict[str, Any]], options: Optional[Options] = None,
+                        host: str = "127.0.0.1") -> http.server.ThreadingHTTPServer:
+    """
+    serve_in_background starts a server on a free port on a daemon thread, e.g. for benchmarks and tests. The stream
+    endpoint is at "http://{}:{}{}".format(*server.server_address, STREAM_PATH).
+    """
+    server = make_server(targets, host, 0, options)
+    threading.Thread(target=server.serve_forever, name="local-airsafe-server", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=DEMO_CSV, help="the NDJSON or CSV file of target updates")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--token", default=None, help="the token requests must present, any if not set")
+    parser.add_argument("--rate", type=float, default=0, help="messages per second and stream, 0 for unlimited")
+    parser.add_argument("--token-interval", type=int, default=100,
+                        help="target updates between two position tokens")
+    parser.add_argument("--keepalive", type=float, default=15.0, help="seconds between keep-alive status messages")
+    parser.add_argument("--disconnect-after", type=int, default=None,
+                        help="messages after which a stream is ended, to simulate server disconnects")
+    args = parser.parse_args()
+
+    targets = load_targets(args.data)
+    server = make_server(targets, args.host, args.port,
+                         Options(args.token, args.rate, args.token_interval, args.keepalive, args.disconnect_after))
+    print("serving {} target updates on http://{}:{}{} and {}".format(len(targets), args.host, args.port,
+                                                                       STREAM_PATH, HISTORY_PATH))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
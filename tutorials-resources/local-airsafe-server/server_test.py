@@ -0,0 +1,104 @@
+import json
+import sys
+from enum import Enum
+from os import path
+
+import requests
+
+sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)), "..", "docker"))
+
+from client import Client, StreamConfig, ContinueFromPositionToken, Compression, FilterIcaoAddress, \
+    FilterLongitude, ErrServerDisconnected, ErrInvalidToken  # noqa: E402
+from server import serve_in_background, load_targets, encode_position_token, decode_position_token, Options, \
+    DEMO_CSV, STREAM_PATH, HISTORY_PATH  # noqa: E402
+
+
+class T(Enum):
+    args = 0
+    want = 1
+    err = 2
+
+
+_TARGETS = [{"icao_address": "A{:05d}".format(i), "timestamp": "2021-05-21T12:00:{:02d}Z".format(59 - i % 60),
+             "latitude": 31.0, "longitude": -179.0 + i, "airline_iata": "MU" if i % 2 else "FM"} for i in range(300)]
+
+
+def _cycle(indexes, start: int):
+    # the first 205 messages of a stream of _TARGETS from start: 203 target updates and 2 position tokens
+    return [_TARGETS[indexes[i % len(indexes)]] for i in range(start, start + 203)]
+
+
+def _url(server, endpoint: str) -> str:
+    return "http://{}:{}{}".format(server.server_address[0], server.server_address[1], endpoint)
+
+
+class TestServer(object):
+
+    def test_stream(self):
+        """
+        test_stream tests that streams carry position tokens, resume after them, end after disconnect_after messages
+        and are filtered and compressed
+        """
+        server = serve_in_background(_TARGETS, Options(token="token", token_interval=100, disconnect_after=205))
+        try:
+            c = Client("token", base_url=_url(server, STREAM_PATH))
+            tests = [
+                {
+                    T.args: [],
+                    T.want: (_cycle(range(300), 0), [99, 199])
+                }, {
+                    T.args: [Compression(Compression.GZIP)],
+                    T.want: (_cycle(range(300), 0), [99, 199])
+                }, {
+                    T.args: [ContinueFromPositionToken(encode_position_token(199))],
+                    T.want: (_cycle(range(300), 200), [299, 399])
+                }, {
+                    T.args: [FilterIcaoAddress(["A00001", "A00002"])],
+                    T.want: (_cycle([1, 2], 0), [99, 199])
+                }, {
+                    T.args: [FilterLongitude(115.5, -178.5)],
+                    T.want: (_cycle([0, 295, 296, 297, 298, 299], 0), [99, 199])
+                },
+            ]
+
+            for test in tests:
+                cfg = StreamConfig()
+                for arg in test[T.args]:
+                    cfg.add(arg)
+                targets = []
+                tokens = []
+                try:
+                    c.stream(targets.append, position_token_callback=lambda t: tokens.append(decode_position_token(t)),
+                             config=cfg)
+                    assert False  # expected behavior is not to arrive here
+                except ErrServerDisconnected:
+                    pass
+                assert targets == test[T.want][0], test[T.args]
+                assert tokens == test[T.want][1], test[T.args]
+
+            try:
+                Client("other", base_url=_url(server, STREAM_PATH)).stream(None)
+                assert False  # expected behavior is not to arrive here
+            except ErrInvalidToken:
+                pass
+        finally:
+            server.stop()
+
+    def test_history(self):
+        """
+        test_history tests that history requests return the matching target updates in timestamp order
+        """
+        server = serve_in_background(load_targets(DEMO_CSV))
+        try:
+            r = requests.get(_url(server, HISTORY_PATH), params={"start": "2021-03-20T12:00:00Z",
+                                                                 "end": "2021-03-20T12:05:00Z",
+                                                                 "airline": "MU"})
+            targets = [json.loads(line)["target"] for line in r.iter_lines() if line]
+
+            assert len(targets) > 0
+            assert all(t["airline_iata"] == "MU" for t in targets)
+            timestamps = [t["timestamp"].rstrip("Z") for t in targets]
+            assert timestamps == sorted(timestamps)
+            assert timestamps[0] >= "2021-03-20T12:00:00" and timestamps[-1] <= "2021-03-20T12:05:00"
+        finally:
+            server.stop()
@@ -6,19 +6,35 @@ It exposes certain failure modes via explicit errors, supports \
 the creation of filters and makes reconnecting to streams easier.
 """
 
+import collections
+import heapq
 import http
+import itertools
 import json
 import logging
 import math
+import random
+import socket
+import tempfile
+import threading
 import time
+import zlib
 from abc import ABC as _ABC, abstractmethod as _abstractmethod
 from enum import Enum as _Enum
-from typing import Optional, Callable, Dict, List
+from typing import Optional, Callable, Dict, List, Tuple, Any, Iterable, Iterator
 
 import requests
+import requests.adapters
+
+try:
+    import orjson as _orjson
+except ImportError:  # orjson is optional; the standard library json module is used as a fallback
+    _orjson = None
 
 _STREAM_V2_URL = "https://api.airsafe.spire.com/v2/targets/stream"
 
+_DEFAULT_POOL_SIZE = 10
+
 _STATUS_LEVELS_MAP = {
     "INFO": logging.INFO,
     "WARN": logging.WARNING,
@@ -61,6 +77,24 @@ class ContinueFromPositionToken(_FilterString):
         return "position_token"
 
 
+_COMPRESSION_KEY = "compression"
+
+
+class Compression(_FilterString):
+    """
+    Compression can be added to StreamConfig and implements parameter "compression".
+    Compression can take two values:
+    - 'gzip' to receive a gzip compressed stream, which the client decompresses incrementally; or
+    - 'none' to receive an uncompressed stream.
+    """
+
+    GZIP = "gzip"
+    NONE = "none"
+
+    def key(self) -> str:
+        return _COMPRESSION_KEY
+
+
 class _FilterInt(_StreamParameter, _ABC):
     def __init__(self, value: int):
         self._value = value
@@ -96,13 +130,16 @@ class FilterLatitude(_FilterFloatRange):
         return "latitude_between"
 
 
+_LONGITUDE_KEY = "longitude_between"
+
+
 class FilterLongitude(_FilterFloatRange):
     """
     FilterLongitude can be added to StreamConfig and implements filter parameter "longitude_between"
     """
 
     def key(self) -> str:
-        return "longitude_between"
+        return _LONGITUDE_KEY
 
 
 class _FilterIntRange(_StreamParameter, _ABC):
@@ -148,13 +185,16 @@ class _FilterStringList(_StreamParameter, _ABC):
         return ",".join(self._values)
 
 
+_ICAO_ADDRESS_KEY = "icao_address"
+
+
 class FilterIcaoAddress(_FilterStringList):
     """
     FilterIcaoAddress can be added to StreamConfig and implements filter parameter "icao_address"
     """
 
     def key(self) -> str:
-        return "icao_address"
+        return _ICAO_ADDRESS_KEY
 
 
 class FilterTailNumber(_FilterStringList):
@@ -209,6 +249,118 @@ class StreamConfig(object):
         """
         return self._parameters
 
+    def copy(self) -> "StreamConfig":
+        """
+        copy returns a new StreamConfig with the same stream parameters
+        """
+        cfg = StreamConfig()
+        cfg._parameters = dict(self._parameters)
+        return cfg
+
+
+def _wrap_longitude(longitude: float) -> float:
+    return longitude - 360 if longitude > 180 else longitude
+
+
+def shard_by_longitude(config: Optional[StreamConfig], shards: int,
+                       boundaries: Optional[List[float]] = None) -> List[StreamConfig]:
+    """
+    shard_by_longitude splits a stream configuration into longitude bands for Client.stream_sharded. The bands cover \
+    the longitude filter of the configuration (west to east, across the antimeridian if west > east), or the whole \
+    globe, in equal widths unless boundaries gives the longitudes between the bands, e.g. to balance busy regions.
+    :param config: The configuration to split, may be None
+    :param shards: The number of bands, ignored if boundaries is given
+    :param boundaries: The longitudes between the bands, from west to east
+    :return: a configuration per band
+    """
+    config = config if config is not None else StreamConfig()
+    west, east = -180.0, 180.0
+    if _LONGITUDE_KEY in config.get():
+        west, east = (float(v) for v in config.get()[_LONGITUDE_KEY].split(","))
+    width = (east - west) % 360 or 360
+    if boundaries is None:
+        boundaries = [west + width * i / shards for i in range(1, shards)]
+    # boundaries are unwrapped to the east of west, so that bands across the antimeridian are ordered as well
+    edges = [west] + sorted(west + (b - west) % 360 for b in boundaries) + [west + width]
+    configs = []
+    for lower, upper in zip(edges, edges[1:]):
+        cfg = config.copy()
+        cfg.add(FilterLongitude(_wrap_longitude(lower), _wrap_longitude(upper)))
+        configs.append(cfg)
+    return configs
+
+
+def shard_by_icao_address(config: StreamConfig, shards: int) -> List[StreamConfig]:
+    """
+    shard_by_icao_address splits the ICAO addresses of a stream configuration (see FilterIcaoAddress) into shards of \
+    similar size for Client.stream_sharded
+    :param config: The configuration to split
+    :param shards: The maximum number of shards
+    :return: a configuration per shard
+    """
+    if not config.get().get(_ICAO_ADDRESS_KEY):
+        raise ValueError("shard_by_icao_address requires a FilterIcaoAddress")
+    addresses = config.get()[_ICAO_ADDRESS_KEY].split(",")
+    configs = []
+    for i in range(min(shards, len(addresses))):
+        cfg = config.copy()
+        cfg.add(FilterIcaoAddress(addresses[i::shards]))
+        configs.append(cfg)
+    return configs
+
+
+# _CHUNK_SIZE is the maximum number of bytes read from the connection at once. It is kept small so that lines are
+# handed over as soon as they arrive (the stream is sent with chunked transfer encoding).
+_CHUNK_SIZE = 512
+_GZIP_MAGIC = b"\x1f\x8b"
+
+
+def _iter_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    _iter_lines frames a stream of byte chunks into lines, without the trailing newline
+    """
+    pending = b""
+    for chunk in chunks:
+        lines = (pending + chunk).split(b"\n") if pending else chunk.split(b"\n")
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+def _gunzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    _gunzip incrementally decompresses a stream of gzip chunks, including streams of several concatenated gzip
+    members. Decompressed data is handed over as soon as a chunk arrives. Data that is not gzip compressed (e.g. if the
+    server ignored the compression parameter) is passed through.
+    """
+    chunks = iter(chunks)
+    head = b""
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= len(_GZIP_MAGIC):
+            break
+    if not head.startswith(_GZIP_MAGIC):
+        if head:
+            yield head
+        yield from chunks
+        return
+
+    d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in itertools.chain([head], chunks):
+        pending = chunk
+        while pending:
+            data = d.decompress(pending)
+            if data:
+                yield data
+            pending = b""
+            if d.eof:
+                pending = d.unused_data
+                d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    data = d.flush()
+    if data:
+        yield data
+
 
 class _MessageKey(_Enum):
     POSITION_TOKEN = "position_token"
@@ -216,6 +368,130 @@ class _MessageKey(_Enum):
     STATUS = "status"
 
 
+# _MESSAGE_KEYS is ordered by message frequency, target updates being by far the most common messages
+_MESSAGE_KEYS = (_MessageKey.TARGET.value, _MessageKey.POSITION_TOKEN.value, _MessageKey.STATUS.value)
+
+
+_TARGET_PREFIX = b'{"target":'
+_STATUS_PREFIX = b'{"status":'
+_POSITION_TOKEN_PREFIX = b'{"position_token":"'
+_POSITION_TOKEN_SUFFIX = b'"}'
+
+
+def _default_loads() -> Callable[[bytes], Any]:
+    if _orjson is not None:
+        return _orjson.loads
+    return json.loads
+
+
+class StreamMetrics(object):
+    """
+    StreamMetrics receives measurements of the stream loop, see the metrics parameter of Client, e.g. \
+    metrics.PrometheusStreamMetrics. The methods do nothing unless overridden. With workers, they are called from \
+    several threads at once.
+    """
+
+    def read(self, n_bytes: int):
+        """
+        read is called with the size of every chunk read from the connection
+        """
+
+    def decoded(self, key: Optional[str], seconds: float):
+        """
+        decoded is called for every message with its key (see Decoder) and the time it took to decode it
+        """
+
+    def handled(self, key: str, seconds: float):
+        """
+        handled is called for every message with its key and the time its callbacks took
+        """
+
+    def target(self, target_update):
+        """
+        target is called with every target update that arrives, before it is filtered
+        """
+
+    def position_token(self):
+        """
+        position_token is called when a position token has been handled
+        """
+
+    def reconnect(self):
+        """
+        reconnect is called when stream_forever reconnects
+        """
+
+
+class Decoder(_ABC):
+    """
+    Decoder turns a raw line received from the stream into a message key and its payload.
+    A custom Decoder can be passed to Client to replace the default JSON handling.
+    """
+
+    @_abstractmethod
+    def decode(self, line: bytes) -> Tuple[Optional[str], Any]:
+        """
+        decode classifies and parses a single line
+        :param line: The raw line as received from the stream, without the trailing newline
+        :return: the message key ("target", "position_token" or "status") and the respective payload, \
+        or (None, None) if the line could not be classified
+        """
+        pass
+
+
+class JSONDecoder(Decoder):
+    """
+    JSONDecoder is the default Decoder. It parses raw bytes without decoding them to str first, and classifies \
+    messages by their leading key, so that only the payload (and not the surrounding message object) is parsed.
+    Position tokens are extracted without any JSON parsing at all.
+    Lines that do not match the compact message layout fall back to a full parse.
+    """
+
+    def __init__(self, loads: Optional[Callable[[bytes], Any]] = None,
+                 target_factory: Optional[Callable[[Dict], Any]] = None):
+        """
+
+        :param loads: The JSON parsing function, which must accept bytes. Defaults to orjson.loads when orjson is \
+        installed, and to json.loads otherwise.
+        :param target_factory: A function that converts target update dicts into another representation, \
+        e.g. target.Target.from_dict
+        """
+        self._loads = loads if loads is not None else _default_loads()
+        self._target_factory = target_factory
+
+    def decode(self, line: bytes) -> Tuple[Optional[str], Any]:
+        key, payload = self._decode(line)
+        if self._target_factory is not None and key == _MessageKey.TARGET.value:
+            payload = self._target_factory(payload)
+        return key, payload
+
+    def _decode(self, line: bytes) -> Tuple[Optional[str], Any]:
+        line = line.strip()
+        try:
+            if line.startswith(_TARGET_PREFIX) and line.endswith(b"}"):
+                return _MessageKey.TARGET.value, self._loads(line[len(_TARGET_PREFIX):-1])
+
+            if line.startswith(_POSITION_TOKEN_PREFIX) and line.endswith(_POSITION_TOKEN_SUFFIX):
+                token = line[len(_POSITION_TOKEN_PREFIX):-len(_POSITION_TOKEN_SUFFIX)]
+                if b'"' not in token and b"\\" not in token:
+                    return _MessageKey.POSITION_TOKEN.value, token.decode("utf-8")
+
+            if line.startswith(_STATUS_PREFIX) and line.endswith(b"}"):
+                return _MessageKey.STATUS.value, self._loads(line[len(_STATUS_PREFIX):-1])
+        except ValueError:
+            pass  # e.g. a message with additional keys, the full parse below handles it
+
+        return self._decode_full(line)
+
+    def _decode_full(self, line: bytes) -> Tuple[Optional[str], Any]:
+        data = self._loads(line)
+        if isinstance(data, dict):
+            for key in _MESSAGE_KEYS:
+                if key in data:
+                    return key, data[key]
+        return None, None
+
+
 class _StatusFields(_Enum):
     TIMESTAMP = "timestamp"
     LEVEL = "level"
@@ -237,14 +513,39 @@ class ErrServerDisconnected(Exception):
 
 
 class _Timer(object):
+    """
+    _Timer keeps the deadline of a stream. A watchdog flags the timer when fewer than _min_reasonable_timeout seconds
+    are left (graceful) and when the deadline has passed (expired), and then interrupts the watched connections, so
+    that a stream times out on time even if no message arrives. Stream loops only check the due flag, which is set
+    by both, instead of the clock.
+    The watchdog is a thread, unless watchdog is False, e.g. for an event loop that calls grace() and expire() itself.
+    """
+
     class ErrTimerUp(Exception):
         pass
 
-    def __init__(self, timeout: Optional[float]):
+    def __init__(self, timeout: Optional[float], watchdog: bool = True):
         self._start_time = time.perf_counter()
         self._timeout = timeout
         if timeout is None:
             self._timeout = math.inf
+        self._lock = threading.Lock()
+        self._interrupts: List[Callable[[], None]] = []
+        self._cancelled = threading.Event()
+        # timeouts that are too low to wait for the graceful period start within it, or expired
+        self.expired: bool = self._timeout <= 0
+        self.graceful: bool = self.expired or self._timeout < _min_reasonable_timeout
+        self.due: bool = self.graceful
+        if watchdog and timeout is not None and not self.expired:
+            threading.Thread(target=self._watch, name="stream-timer", daemon=True).start()
+
+    def _watch(self):
+        if not self.graceful:
+            if self._cancelled.wait(self.remaining() - _min_reasonable_timeout):
+                return
+            self.grace()
+        if not self._cancelled.wait(max(self.remaining(), 0)):
+            self.expire()
 
     def elapsed(self):
         return time.perf_counter() - self._start_time
@@ -252,65 +553,940 @@ class _Timer(object):
     def remaining(self):
         return self._timeout - self.elapsed()
 
-    def up(self) -> bool:
-        return (time.perf_counter() - self._start_time) > self._timeout
+    def grace(self):
+        """
+        grace flags that the graceful period before the deadline has begun
+        """
+        self.graceful = self.due = True
+
+    def expire(self):
+        """
+        expire flags that the deadline has passed, and interrupts the watched connections
+        """
+        with self._lock:
+            self.expired = self.graceful = self.due = True
+            interrupts = list(self._interrupts)
+        for interrupt in interrupts:
+            interrupt()
+
+    def watch(self, interrupt: Callable[[], None]):
+        """
+        watch calls interrupt when the timer expires, or now if it has expired already
+        """
+        with self._lock:
+            self._interrupts.append(interrupt)
+            expired = self.expired
+        if expired:
+            interrupt()
+
+    def unwatch(self, interrupt: Callable[[], None]):
+        with self._lock:
+            self._interrupts.remove(interrupt)
+
+    def cancel(self):
+        """
+        cancel ends the watchdog, once the timer is not needed anymore
+        """
+        self._cancelled.set()
+
+    def stop(self):
+        """
+        stop makes the timer run out now, e.g. to end the other shards of a sharded stream
+        """
+        self._timeout = -math.inf
+        self.cancel()
+        self.expire()
+
+
+def _interrupt(response: requests.Response):
+    """
+    _interrupt makes a read that blocks on the connection of a response fail. Closing the response from another thread
+    does not wake up the read.
+    """
+    sock = getattr(getattr(response.raw, "connection", None), "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class BatchBuilder(_ABC):
+    """
+    BatchBuilder accumulates the target updates of a batch for target_batch_callback, see the batch_builder \
+    parameter of Client.stream. The default builds lists of target updates, columnar.ColumnarBuilder builds \
+    columnar batches.
+    """
+
+    @_abstractmethod
+    def append(self, target_update):
+        """
+        append adds a target update to the batch
+        """
+        pass
+
+    @_abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    @_abstractmethod
+    def build(self) -> Any:
+        """
+        build returns the batch of all target updates appended since the last build, and empties the builder
+        """
+        pass
+
+
+class _ListBuilder(BatchBuilder):
+
+    def __init__(self, capacity: int = 0):
+        self._batch: List = []
+
+    def append(self, target_update):
+        self._batch.append(target_update)
+
+    def __len__(self) -> int:
+        return len(self._batch)
+
+    def build(self) -> List:
+        batch, self._batch = self._batch, []
+        return batch
+
+
+class _TargetBatcher(object):
+    """
+    _TargetBatcher gathers target updates and hands them to the batch callback when the batch is full, or when the
+    oldest target in the batch has waited for max_latency seconds. The latency is checked whenever a message arrives,
+    so that batches are delivered on the stream's threads, never on a timer thread.
+    Batches are delivered one at a time, also when target updates are added from several worker threads.
+    """
+
+    def __init__(self, callback: Callable[[Any], None], max_size: int, max_latency: float,
+                 builder: Optional[BatchBuilder] = None):
+        self._callback = callback
+        self._max_size = max_size
+        self._max_latency = max_latency
+        self._builder = builder if builder is not None else _ListBuilder()
+        self._deadline = math.inf
+        self._lock = threading.Lock()
+
+    def add(self, target_update):
+        with self._lock:
+            if not len(self._builder):
+                self._deadline = time.perf_counter() + self._max_latency
+            self._builder.append(target_update)
+            if len(self._builder) >= self._max_size or time.perf_counter() >= self._deadline:
+                self._flush()
+
+    def poll(self):
+        with self._lock:
+            if len(self._builder) and time.perf_counter() >= self._deadline:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if len(self._builder):
+            self._callback(self._builder.build())
+
+
+class Backpressure(_Enum):
+    """
+    Backpressure selects what Client.stream does when its work queue is full (see the workers parameter of stream):
+    - BLOCK stops reading from the connection until a worker takes the next message;
+    - DROP_OLDEST discards the oldest queued message to make room; or
+    - SPILL appends messages to a temporary file, which the workers drain in order before returning to memory.
+    """
+    BLOCK = "block"
+    DROP_OLDEST = "drop-oldest"
+    SPILL = "spill"
+
+
+class QueueMetrics(object):
+    """
+    QueueMetrics describes the work queue of the last Client.stream call that ran with workers.
+    """
+
+    def __init__(self):
+        self.depth: int = 0
+        self.max_depth: int = 0
+        self.blocked_seconds: float = 0.0
+        self.dropped: int = 0
+        self.spilled: int = 0
+
+
+class _SpillFile(object):
+    """
+    _SpillFile is a FIFO of queue items in a temporary file. It is not thread-safe, _WorkQueue serializes access.
+    """
+
+    def __init__(self, directory: Optional[str]):
+        self._f = tempfile.TemporaryFile(dir=directory)
+        self._read_pos = 0
+        self._write_pos = 0
+        self.size = 0
+
+    def put(self, item: Tuple[int, bytes]):
+        self._f.seek(self._write_pos)
+        self._f.write(b"%d " % item[0] + item[1] + b"\n")
+        self._write_pos = self._f.tell()
+        self.size += 1
+
+    def get(self) -> Tuple[int, bytes]:
+        self._f.seek(self._read_pos)
+        seq, line = self._f.readline()[:-1].split(b" ", 1)
+        self._read_pos = self._f.tell()
+        self.size -= 1
+        if self.size == 0:
+            self._f.truncate(0)
+            self._read_pos = self._write_pos = 0
+        return int(seq), line
+
+    def close(self):
+        self._f.close()
+
+
+class _WorkQueue(object):
+    """
+    _WorkQueue is the bounded queue between the reader and the workers of Client.stream, applying a Backpressure
+    policy when it is full. Items are (sequence number, line) tuples.
+    """
+
+    def __init__(self, maxsize: int, backpressure: Backpressure, metrics: QueueMetrics,
+                 spill_directory: Optional[str] = None):
+        self._items = collections.deque()
+        self._maxsize = maxsize
+        self._backpressure = backpressure
+        self._metrics = metrics
+        self._spill = _SpillFile(spill_directory) if backpressure == Backpressure.SPILL else None
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item: Tuple[int, bytes]) -> Optional[Tuple[int, bytes]]:
+        """
+        put adds an item to the queue
+        :return: the item that was dropped to make room, if any
+        """
+        dropped = None
+        with self._cond:
+            if self._spill is not None and (self._spill.size > 0 or len(self._items) >= self._maxsize):
+                self._spill.put(item)  # once spilling, all items go through the file to keep them in order
+                self._metrics.spilled += 1
+                self._cond.notify()
+                return None
+            if len(self._items) >= self._maxsize:
+                if self._backpressure == Backpressure.DROP_OLDEST:
+                    dropped = self._items.popleft()
+                    self._metrics.dropped += 1
+                else:
+                    start = time.perf_counter()
+                    while len(self._items) >= self._maxsize and not self._closed:
+                        self._cond.wait()
+                    self._metrics.blocked_seconds += time.perf_counter() - start
+            self._items.append(item)
+            self._set_depth()
+            self._cond.notify()
+        return dropped
+
+    def get(self) -> Optional[Tuple[int, bytes]]:
+        """
+        get returns the next item, blocking until one is available
+        :return: the next item, or None when the queue is closed and empty
+        """
+        with self._cond:
+            while not self._items and not (self._spill is not None and self._spill.size > 0):
+                if self._closed:
+                    return None
+                self._cond.wait()
+            if self._items:
+                item = self._items.popleft()
+                while self._spill is not None and self._spill.size > 0 and len(self._items) < self._maxsize:
+                    self._items.append(self._spill.get())
+            else:
+                item = self._spill.get()
+            self._set_depth()
+            self._cond.notify_all()
+            return item
+
+    def close(self, discard: bool = False):
+        """
+        close wakes up all waiting readers and workers. Workers drain the remaining items, unless discard is True.
+        """
+        with self._cond:
+            self._closed = True
+            if discard:
+                self._items.clear()
+                if self._spill is not None:
+                    self._spill.close()
+                    self._spill = None
+            self._set_depth()
+            self._cond.notify_all()
+
+    def _set_depth(self):
+        depth = len(self._items) + (self._spill.size if self._spill is not None else 0)
+        self._metrics.depth = depth
+        if depth > self._metrics.max_depth:
+            self._metrics.max_depth = depth
+
+
+class _CompletionTracker(object):
+    """
+    _CompletionTracker commits position tokens in order, and only once every message that arrived before a position
+    token has been processed. Messages are identified by their sequence number.
+    """
+
+    def __init__(self, commit: Callable[[int, str], None]):
+        self._commit = commit
+        self._lock = threading.Lock()
+        self._next = 0
+        self._done = set()
+        self._tokens: Dict[int, str] = dict()
+
+    def done(self, seq: int, token: Optional[str] = None):
+        """
+        done marks a message as processed, and commits all position tokens that are no longer waiting for messages
+        :param seq: The sequence number of the message
+        :param token: The position token, if the message is a position token
+        """
+        with self._lock:
+            if token is not None:
+                self._tokens[seq] = token
+            self._done.add(seq)
+            while self._next in self._done:
+                self._done.remove(self._next)
+                token = self._tokens.pop(self._next, None)
+                if token is not None:
+                    self._commit(self._next, token)
+                self._next += 1
+
+
+class ReconnectStats(object):
+    """
+    ReconnectStats describes the reconnects of the last Client.stream_forever call.
+    - reconnect_latencies holds, per reconnect, the seconds from the interruption to the first message of the new \
+    connection;
+    - duplicates counts target updates that were delivered again after resuming from a position token;
+    - unresumed_reconnects counts reconnects without a position token to resume from, for which target updates \
+    were lost; unresumed_seconds and estimated_lost (based on the previous connection's target rate) describe \
+    the extent of the loss.
+    """
+
+    def __init__(self):
+        self.reconnects: int = 0
+        self.reconnect_latencies: List[float] = []
+        self.duplicates: int = 0
+        self.unresumed_reconnects: int = 0
+        self.unresumed_seconds: float = 0.0
+        self.estimated_lost: int = 0
+        self.last_error: Optional[BaseException] = None
+
+
+def _fingerprint(target_update) -> Tuple:
+    return (target_update.get("icao_address"), target_update.get("timestamp"),
+            target_update.get("latitude"), target_update.get("longitude"))
+
+
+class _ResumeTracker(object):
+    """
+    _ResumeTracker remembers the target updates delivered since the last position token. After resuming from that
+    token, the server delivers these target updates again, which _ResumeTracker detects until the first position
+    token of the new connection.
+    """
+
+    def __init__(self, stats: ReconnectStats, drop_duplicates: bool):
+        self._stats = stats
+        self._drop_duplicates = drop_duplicates
+        self._lock = threading.Lock()
+        self._since_token = set()
+        self._redelivery = set()
+        self._interrupted_at: Optional[float] = None
+        self._n_targets = 0
+        self.first_message_time: Optional[float] = None
+
+    def message(self):
+        if self.first_message_time is None:
+            self.first_message_time = time.perf_counter()
+            if self._interrupted_at is not None:
+                self._stats.reconnect_latencies.append(self.first_message_time - self._interrupted_at)
+
+    def target(self, target_update) -> bool:
+        """
+        target records a target update
+        :return: False if the target update is a duplicate that should not be delivered
+        """
+        fingerprint = _fingerprint(target_update)
+        with self._lock:
+            self._n_targets += 1
+            if fingerprint in self._redelivery:
+                self._redelivery.discard(fingerprint)
+                self._stats.duplicates += 1
+                return not self._drop_duplicates
+            self._since_token.add(fingerprint)
+        return True
+
+    def position_token(self):
+        with self._lock:
+            self._since_token.clear()
+            self._redelivery.clear()
+
+    def target_rate(self, interrupted_at: float) -> float:
+        if self.first_message_time is None or interrupted_at <= self.first_message_time:
+            return 0.0
+        return self._n_targets / (interrupted_at - self.first_message_time)
+
+    def reconnect(self, resumed: bool, interrupted_at: float):
+        with self._lock:
+            # target updates that were not delivered again yet are still expected, if the position token is the same
+            self._redelivery = self._redelivery | self._since_token if resumed else set()
+            self._since_token = set()
+            self._interrupted_at = interrupted_at
+            self._n_targets = 0
+            self.first_message_time = None
+
+
+# _DEDUP_TTL is the default number of seconds for which Deduplicator remembers a target update
+_DEDUP_TTL = 600.0
+# _DEDUP_MAX_SIZE is the default number of target updates per generation of Deduplicator, which bounds its memory
+_DEDUP_MAX_SIZE = 1000000
+
+
+class Deduplicator(object):
+    """
+    Deduplicator detects target updates that were already delivered, e.g. after resuming from a position token that \
+    was not the last message of the previous connection (in stream_forever, or across calls to stream). Target \
+    updates are identified by icao_address, timestamp and position.
+    Fingerprints are kept in two generations of sets: the current generation is retired once it is ttl seconds old \
+    or holds max_size fingerprints, and the retired one is then forgotten. A target update is hence remembered for \
+    at least ttl seconds (unless more than max_size arrive in that time), and memory stays bounded by 2 * max_size \
+    fingerprints. Only the 64 bit hash of a fingerprint is stored; the chance that two distinct target updates share \
+    it is negligible.
+    Calling a Deduplicator with a target update returns False for duplicates, so it can be used as predicate, or \
+    passed as deduplicator to stream(). It can be shared by concurrent streams.
+    """
+
+    def __init__(self, ttl: float = _DEDUP_TTL, max_size: int = _DEDUP_MAX_SIZE):
+        """
+
+        :param ttl: The minimum number of seconds a target update is remembered
+        :param max_size: The maximum number of target updates per generation
+        """
+        self.ttl: float = ttl
+        self.max_size: int = max_size
+        self.seen: int = 0
+        self.duplicates: int = 0
+        self._lock = threading.Lock()
+        self._current = set()
+        self._previous = set()
+        self._rotate_at = time.monotonic() + ttl
+
+    def __call__(self, target_update) -> bool:
+        key = hash(_fingerprint(target_update))
+        with self._lock:
+            self.seen += 1
+            if key in self._current or key in self._previous:
+                self.duplicates += 1
+                return False
+            if len(self._current) >= self.max_size or time.monotonic() >= self._rotate_at:
+                self._previous, self._current = self._current, set()
+                self._rotate_at = time.monotonic() + self.ttl
+            self._current.add(key)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._current) + len(self._previous)
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        """
+        hit_rate is the share of target updates that were duplicates, or None before the first target update
+        """
+        return self.duplicates / self.seen if self.seen else None
+
+
+class _StreamState(object):
+    """
+    _StreamState holds the state of a single stream, so that one Client can run several streams concurrently.
+    """
+
+    def __init__(self):
+        self.last_position_token: Optional[str] = None
+        self.last_message_type: Optional[_MessageKey] = None
+        # target_filter decides which target updates are handed to the callbacks and batches, e.g. to drop duplicates
+        self.target_filter: Optional[Callable[[Any], bool]] = None
+
+
+# _SHARD_DEDUP_SIZE is the number of target updates after which the older of the two generations of fingerprints that
+# detect duplicates across shards is forgotten
+_SHARD_DEDUP_SIZE = 100000
+
+
+def _timestamp_key(target_update) -> str:
+    # ISO 8601 timestamps in UTC sort as strings without the "Z", whatever their number of fractional digits
+    timestamp = target_update.get("timestamp")
+    return timestamp.rstrip("Z") if timestamp is not None else ""
+
+
+class ShardStats(object):
+    """
+    ShardStats describes the last Client.stream_sharded call.
+    - targets counts the target updates received per shard;
+    - duplicates counts target updates that were received on more than one shard and delivered once;
+    - position_tokens holds the last position token committed per shard.
+    """
+
+    def __init__(self, shards: int):
+        self.targets: List[int] = [0] * shards
+        self.duplicates: int = 0
+        self.position_tokens: List[Optional[str]] = [None] * shards
+
+
+class _ShardMerger(object):
+    """
+    _ShardMerger merges the shards of a sharded stream into one stream of callbacks, which are called under a lock and
+    hence never concurrently. Target updates are held back for window seconds and released in timestamp order, and
+    target updates received on several shards (e.g. on the border of two longitude bands) are delivered once.
+    A shard's position token is committed once all target updates the shard received before it have been delivered.
+    """
+
+    def __init__(self, stats: ShardStats, deliver: Callable[[Any], None], commit: Callable[[int, str], None],
+                 window: float, batcher: Optional[_TargetBatcher] = None, dedup_size: int = _SHARD_DEDUP_SIZE):
+        self._stats = stats
+        self._deliver = deliver
+        self._commit = commit
+        self._window = window
+        self._batcher = batcher
+        self._dedup_size = dedup_size
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._heap = []
+        self._recent = set()
+        self._previous = set()
+        shards = len(stats.targets)
+        # target updates belong to the epoch of their shard, i.e. the number of position tokens before them
+        self._epochs = [0] * shards
+        self._pending = [collections.Counter() for _ in range(shards)]
+        self._tokens = [collections.deque() for _ in range(shards)]
+
+    def add(self, shard: int, target_update):
+        fingerprint = _fingerprint(target_update)
+        now = time.perf_counter()
+        with self._lock:
+            self._stats.targets[shard] += 1
+            if fingerprint in self._recent or fingerprint in self._previous:
+                self._stats.duplicates += 1
+            else:
+                self._recent.add(fingerprint)
+                if len(self._recent) >= self._dedup_size:
+                    self._previous, self._recent = self._recent, set()
+                epoch = self._epochs[shard]
+                self._pending[shard][epoch] += 1
+                heapq.heappush(self._heap,
+                               (_timestamp_key(target_update), next(self._seq), now, shard, epoch, target_update))
+            self._release(now)
+
+    def position_token(self, shard: int, token: str):
+        with self._lock:
+            self._tokens[shard].append((self._epochs[shard], token))
+            self._epochs[shard] += 1
+            self._commit_tokens(shard)
+
+    def poll(self):
+        with self._lock:
+            self._poll()
+
+    def status(self, callback: Optional[Callable], status):
+        """
+        status releases the target updates that are due, and calls callback with a status message under the same lock
+        as the other callbacks
+        """
+        with self._lock:
+            self._poll()
+            if callback is not None:
+                callback(status)
+
+    def _poll(self):
+        self._release(time.perf_counter())
+        if self._batcher is not None:
+            self._batcher.poll()
+
+    def flush(self):
+        with self._lock:
+            self._release(math.inf)
+            if self._batcher is not None:
+                self._batcher.flush()
+
+    def _release(self, now: float):
+        heap = self._heap
+        deadline = now - self._window
+        # the earliest target update is held back until it is old enough, so later ones wait for it
+        while heap and heap[0][2] <= deadline:
+            _, _, _, shard, epoch, target_update = heapq.heappop(heap)
+            self._deliver(target_update)
+            pending = self._pending[shard]
+            pending[epoch] -= 1
+            if not pending[epoch]:
+                del pending[epoch]
+                self._commit_tokens(shard)
+
+    def _commit_tokens(self, shard: int):
+        tokens = self._tokens[shard]
+        pending = self._pending[shard]
+        while tokens and not any(epoch <= tokens[0][0] for epoch in pending):
+            _, token = tokens.popleft()
+            if self._batcher is not None:
+                self._batcher.flush()
+            self._stats.position_tokens[shard] = token
+            self._commit(shard, token)
 
 
 class Client(object):
     """
     Client contains the Airsafe streaming client configuration and is used to call stream()
+    The client owns a pooled HTTP session, which is reused across stream() calls and can be shared by concurrent \
+    streams. Create the client once (e.g. at module scope in serverless functions) to benefit from it.
     """
 
-    def __init__(self, token: str, logger: Optional[logging.Logger] = None, base_url: str = _STREAM_V2_URL):
+    def __init__(self, token: str, logger: Optional[logging.Logger] = None, base_url: str = _STREAM_V2_URL,
+                 decoder: Optional[Decoder] = None, session: Optional[requests.Session] = None,
+                 pool_size: int = _DEFAULT_POOL_SIZE, keep_alive: bool = True,
+                 metrics: Optional[StreamMetrics] = None):
         """
 
         :param token: The customer token, issued by the Spire sales team
         :param logger: The custom logger that is used to log debug statements, infos, warnings and errors
         :param base_url: The base url the client will attempt to connect to when stream() is called
+        :param decoder: The Decoder that parses incoming lines, defaults to JSONDecoder
+        :param session: A requests session to use instead of the client's own; it is not closed by close()
+        :param pool_size: The maximum number of connections the client's own session keeps open per host, \
+        i.e. the number of concurrent streams that can reuse connections
+        :param keep_alive: If False, connections are closed after every request instead of being reused
+        :param metrics: The StreamMetrics that measure the stream loop, which is not instrumented if None
         """
         self.token: str = token
         self.logger: logging.Logger = logging.getLogger()
         self.base_url: str = base_url
         if logger is not None:
             self.logger = logger
+        self.decoder: Decoder = JSONDecoder()
+        if decoder is not None:
+            self.decoder = decoder
+
+        self._owns_session = session is None
+        self.session: requests.Session = session
+        if session is None:
+            self.session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            self.session.mount("https://", adapter)
+            self.session.mount("http://", adapter)
+        self._keep_alive = keep_alive
+
+        self.queue_metrics: QueueMetrics = QueueMetrics()
+        self.reconnect_stats: ReconnectStats = ReconnectStats()
+        self.metrics: Optional[StreamMetrics] = metrics
+        self.shard_stats: ShardStats = ShardStats(0)
+
+    def __enter__(self) -> "Client":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        close closes the connections of the client's own session
+        """
+        if self._owns_session:
+            self.session.close()
 
-        self._last_position_token: Optional[str] = None
-        self._last_message_type: Optional[_MessageKey] = None
-
-    def _position_token_callback(self, token: str):
-        self._last_message_type = _MessageKey.POSITION_TOKEN
+    def _position_token_callback(self, state: _StreamState, token: str):
+        state.last_message_type = _MessageKey.POSITION_TOKEN
 
-        self._last_position_token = token
+        state.last_position_token = token
         self.logger.debug("position_token: {}".format(token))
 
-    def _status_callback(self, status: Dict):
-        self._last_message_type = _MessageKey.STATUS
+    def _status_callback(self, state: _StreamState, status: Dict):
+        state.last_message_type = _MessageKey.STATUS
 
         log_level = _STATUS_LEVELS_MAP[status[_StatusFields.LEVEL.value]]
         message = status[_StatusFields.MESSAGE.value]
         timestamp = status[_StatusFields.TIMESTAMP.value]
         self.logger.log(log_level, "status at {}: {}".format(timestamp, message))
 
-    def _target_callback(self):
-        self._last_message_type = _MessageKey.TARGET
+    @staticmethod
+    def _target_callback(state: _StreamState):
+        state.last_message_type = _MessageKey.TARGET
 
-    def _general_callback(self, t: _Timer):
-        if t.up():
+    def _general_callback(self, state: _StreamState, t: _Timer, graceful_timeout: bool):
+        if t.expired:
             self.logger.info("hard timeout after {}s".format(t.elapsed()))
             raise _Timer.ErrTimerUp
-        if self._last_message_type is not None and \
-                self._last_message_type == _MessageKey.POSITION_TOKEN and \
-                t.remaining() < _min_reasonable_timeout:
+        if graceful_timeout and \
+                state.last_message_type is not None and \
+                state.last_message_type == _MessageKey.POSITION_TOKEN and \
+                t.graceful:
             self.logger.info("graceful timeout after {}s".format(t.elapsed()))
             raise _Timer.ErrTimerUp
 
+    def _handlers(self,
+                  state: _StreamState,
+                  target_callback: Optional[Callable],
+                  position_token_callback: Optional[Callable],
+                  status_message_callback: Optional[Callable],
+                  batcher: Optional[_TargetBatcher] = None,
+                  target_filter: Optional[Callable[[Any], bool]] = None) -> Dict[str, Callable]:
+        """
+        _handlers precomputes the dispatch table that maps message keys to their handlers, so that the stream loop
+        does not need to check for missing callbacks on every message.
+        Pending target batches are flushed before a position token is recorded, so that a position token is never
+        ahead of the target updates that have been delivered.
+        Target updates for which target_filter returns False are neither handed to the target callback nor batched.
+        """
+        if batcher is not None:
+            target_callback = self._chain(target_callback, batcher.add)
+
+        def on_target(target_update):
+            self._target_callback(state)
+            target_callback(target_update)
+
+        def on_filtered_target(target_update):
+            self._target_callback(state)
+            if target_filter(target_update) and target_callback is not None:
+                target_callback(target_update)
+
+        def on_position_token(token):
+            if batcher is not None:
+                batcher.flush()
+            self._position_token_callback(state, token)
+            if position_token_callback is not None:
+                position_token_callback(token)
+
+        def on_status(status):
+            if batcher is not None:
+                batcher.poll()
+            self._status_callback(state, status)
+            if status_message_callback is not None:
+                status_message_callback(status)
+
+        if target_filter is not None:
+            target_handler = on_filtered_target
+        elif target_callback is not None:
+            target_handler = on_target
+        else:
+            def target_handler(_):
+                self._target_callback(state)
+
+        return {
+            _MessageKey.TARGET.value: target_handler,
+            _MessageKey.POSITION_TOKEN.value: on_position_token,
+            _MessageKey.STATUS.value: on_status,
+        }
+
+    @staticmethod
+    def _all(first: Optional[Callable[[Any], bool]],
+             second: Optional[Callable[[Any], bool]]) -> Optional[Callable[[Any], bool]]:
+        if first is None:
+            return second
+        if second is None:
+            return first
+
+        def both(message) -> bool:
+            return first(message) and second(message)
+
+        return both
+
+    @staticmethod
+    def _chain(first: Optional[Callable], second: Callable) -> Callable:
+        if first is None:
+            return second
+
+        def chained(message):
+            first(message)
+            second(message)
+
+        return chained
+
+    def _instrument(self, handlers: Dict[str, Callable],
+                    decode: Callable[[bytes], Tuple[Optional[str], Any]]) -> Tuple[Dict[str, Callable], Callable]:
+        """
+        _instrument wraps the decoder and the handlers, so that they report to the client's metrics. Streams without
+        metrics do not pay for the measurements.
+        """
+        metrics = self.metrics
+        clock = time.perf_counter
+
+        def timed_decode(line: bytes) -> Tuple[Optional[str], Any]:
+            start = clock()
+            key, payload = decode(line)
+            metrics.decoded(key, clock() - start)
+            return key, payload
+
+        def timed(key: str, handler: Callable, before: Optional[Callable], after: Optional[Callable]) -> Callable:
+            def timed_handler(payload):
+                if before is not None:
+                    before(payload)
+                start = clock()
+                handler(payload)
+                metrics.handled(key, clock() - start)
+                if after is not None:
+                    after()
+
+            return timed_handler
+
+        hooks = {_MessageKey.TARGET.value: (metrics.target, None),
+                 _MessageKey.POSITION_TOKEN.value: (None, metrics.position_token)}
+        return {key: timed(key, handler, *hooks.get(key, (None, None))) for key, handler in handlers.items()}, \
+            timed_decode
+
+    def _read(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        read = self.metrics.read
+        for chunk in chunks:
+            read(len(chunk))
+            yield chunk
+
+    def _prepare(self,
+                 state: _StreamState,
+                 target_callback: Optional[Callable],
+                 position_token_callback: Optional[Callable],
+                 status_message_callback: Optional[Callable],
+                 target_batch_callback: Optional[Callable[[Any], None]],
+                 batch_size: int,
+                 batch_latency: float,
+                 batch_builder: Optional[Callable[[int], BatchBuilder]],
+                 predicate: Optional[Callable[[Any], bool]],
+                 deduplicator: Optional[Deduplicator]) -> Tuple[Optional[_TargetBatcher], Dict[str, Callable],
+                                                                  Callable[[bytes], Tuple[Optional[str], Any]]]:
+        """
+        _prepare builds the batcher, the handlers and the decoder of a stream or a replay
+        """
+        batcher = None
+        if target_batch_callback is not None:
+            builder = batch_builder(batch_size) if batch_builder is not None else None
+            batcher = _TargetBatcher(target_batch_callback, batch_size, batch_latency, builder)
+        # duplicates are detected among the target updates that pass the predicate, so that only those are remembered
+        target_filter = self._all(self._all(state.target_filter, predicate), deduplicator)
+        handlers = self._handlers(state, target_callback, position_token_callback, status_message_callback, batcher,
+                                  target_filter)
+        decode = self.decoder.decode
+        if self.metrics is not None:
+            handlers, decode = self._instrument(handlers, decode)
+        return batcher, handlers, decode
+
+    @staticmethod
+    def _tee(lines: Iterable[bytes], line_callback: Callable[[bytes], None]) -> Iterator[bytes]:
+        for line in lines:
+            line_callback(line)
+            yield line
+
+    def _consume(self, state: _StreamState, lines, handlers: Dict[str, Callable], timer: _Timer,
+                 graceful_timeout: bool, decode: Callable[[bytes], Tuple[Optional[str], Any]]):
+        for line in lines:
+            if not line:
+                continue
+            key, payload = decode(line)
+            handler = handlers.get(key)
+            if handler is None:
+                self.logger.error("unprocessable message: {}".format(line.decode('utf-8', errors='replace')))
+            else:
+                handler(payload)
+
+            if timer.due:
+                # for client-side disconnect (graceful or hard timeout)
+                self._general_callback(state, timer, graceful_timeout)
+
+    def _consume_with_workers(self, lines, handlers: Dict[str, Callable], timer: _Timer, graceful_timeout: bool,
+                              workers: int, queue: _WorkQueue, decode: Callable[[bytes], Tuple[Optional[str], Any]]):
+        stop = threading.Event()
+        graceful_seq = [math.inf]  # messages after a graceful stop are not processed anymore
+        errors = []
+
+        def commit(seq: int, token: str):
+            handlers[_MessageKey.POSITION_TOKEN.value](token)
+            if graceful_timeout and timer.graceful and not stop.is_set():
+                self.logger.info("graceful timeout after {}s".format(timer.elapsed()))
+                graceful_seq[0] = seq
+                stop.set()
+
+        tracker = _CompletionTracker(commit)
+
+        def process(seq: int, line: bytes):
+            key, payload = decode(line)
+            if key == _MessageKey.POSITION_TOKEN.value:
+                tracker.done(seq, payload)
+                return
+            handler = handlers.get(key)
+            if handler is None:
+                self.logger.error("unprocessable message: {}".format(line.decode('utf-8', errors='replace')))
+            else:
+                handler(payload)
+            tracker.done(seq)
+
+        def work():
+            while True:
+                item = queue.get()
+                if item is None:
+                    return
+                if item[0] > graceful_seq[0]:
+                    continue
+                try:
+                    process(*item)
+                except BaseException as e:
+                    errors.append(e)
+                    stop.set()
+                    queue.close(discard=True)
+                    return
+
+        threads = [threading.Thread(target=work, name="stream-worker-{}".format(i), daemon=True)
+                   for i in range(workers)]
+        for t in threads:
+            t.start()
+
+        timed_out = False
+        try:
+            seq = 0
+            for line in lines:
+                if stop.is_set():
+                    break
+                if not line:
+                    continue
+                dropped = queue.put((seq, line))
+                if dropped is not None:
+                    tracker.done(dropped[0])
+                seq += 1
+                if timer.expired:
+                    self.logger.info("hard timeout after {}s".format(timer.elapsed()))
+                    timed_out = True
+                    break
+        finally:
+            # messages that are queued when the timer expires are dropped, as after a hard timeout on the stream loop
+            queue.close(discard=timed_out or stop.is_set() or timer.expired)
+            for t in threads:
+                t.join()
+
+        if errors:
+            raise errors[0]
+        if timed_out or stop.is_set():
+            raise _Timer.ErrTimerUp
+
     def stream(self,
                target_callback: Callable,
                position_token_callback: Optional[Callable] = None,
                status_message_callback: Optional[Callable] = None,
                config: Optional[StreamConfig] = None,
                timeout: Optional[float] = None,
-               graceful_timeout: bool = True) -> Optional[str]:
+               graceful_timeout: bool = True,
+               target_batch_callback: Optional[Callable[[Any], None]] = None,
+               batch_size: int = 500,
+               batch_latency: float = 1.0,
+               batch_builder: Optional[Callable[[int], BatchBuilder]] = None,
+               predicate: Optional[Callable[[Any], bool]] = None,
+               deduplicator: Optional[Deduplicator] = None,
+               workers: int = 0,
+               queue_size: int = 10000,
+               backpressure: Backpressure = Backpressure.BLOCK,
+               spill_directory: Optional[str] = None,
+               line_callback: Optional[Callable[[bytes], None]] = None) -> Optional[str]:
         """
         stream connects to the stream API, clearly exposes some common error modes, handles graceful timeout for use \
         cases where consumers want to deliberately disconnect, and calls the provided callbacks when the respective \
@@ -319,70 +1495,385 @@ class Client(object):
         Per default the client does not time out. If a timeout is provided, the stream attempts to gracefully \
         disconnect i.e. to disconnect right after a position token has been transmitted. This is to avoid the delivery \
         of duplicate messages. A graceful disconnect might not be possible when the timeout is lower than 20s.
-        :param target_callback: The function that is called when a target update arrives.
+        Target updates can also be delivered in batches via target_batch_callback, e.g. for bulk writes to files or \
+        databases. A batch is delivered when it holds batch_size targets, when its oldest target has waited for \
+        batch_latency seconds (checked whenever a message arrives), and always before the next position token is \
+        handled. Hence position tokens passed to position_token_callback and returned by stream never get ahead of \
+        delivered target updates. Batches are lists of target updates, unless a batch_builder is given, e.g. \
+        columnar.ColumnarBuilder for columnar NumPy/Arrow batches.
+        Target updates can be filtered on the client side with a predicate, e.g. a predicate.Predicate for \
+        conditions that the Filter* parameters of the config do not cover. Target updates that do not match are \
+        dropped before they reach target_callback and the batches.
+        Target updates that were already delivered, e.g. again after resuming from a position token that was not the \
+        last message of a previous connection, are dropped by a deduplicator. Keep it across calls to stream() to \
+        detect redeliveries after reconnecting; its hit_rate tells how many target updates were duplicates.
+        With workers > 0 the calling thread only reads and frames lines, and hands them to a pool of worker threads \
+        via a bounded queue, so that slow callbacks do not hold up the connection. Callbacks must then be \
+        thread-safe, and target updates may be delivered out of order. Position tokens are still only handled once \
+        all messages before them have been processed. When the queue is full, backpressure decides whether reading \
+        blocks, the oldest queued message is dropped, or messages are spilled to disk. The queue is described by \
+        queue_metrics after (and during) the stream. A graceful timeout may let through the few target updates that \
+        workers already started processing after the last position token.
+        Raw lines can be recorded with a line_callback, e.g. a recorder.Recorder, to reproduce a stream with replay().
+        :param target_callback: The function that is called when a target update arrives, may be None.
         :param position_token_callback: The function that is called when a position token arrives.
         :param status_message_callback: The function that is called when a status message arrives.
         :param config: A StreamConfig object that defines server-side message filters and restart behavior.
         :param timeout: The timeout in seconds.
         :param graceful_timeout: If True, the client will attempt to disconnect right after a position_token message.
+        :param target_batch_callback: The function that is called with a batch of target updates.
+        :param batch_size: The maximum number of target updates per batch.
+        :param batch_latency: The time in seconds after which a batch is delivered. It is checked when a message \
+        arrives, not by a timer: on a sparse stream, a batch can wait past batch_latency until the next target update \
+        or keep-alive status message, i.e. for up to about 15s.
+        :param batch_builder: The factory of the BatchBuilder that builds the batches, called with batch_size.
+        :param predicate: The function that decides whether a target update is handed over.
+        :param deduplicator: The Deduplicator that drops target updates which were already handed over.
+        :param workers: The number of worker threads that process messages, 0 processes them on the calling thread.
+        :param queue_size: The maximum number of messages waiting for a worker.
+        :param backpressure: The policy that applies when the queue is full.
+        :param spill_directory: The directory for the spill file of Backpressure.SPILL, defaults to the temp dir.
+        :param line_callback: The function that is called with every raw line (without newline) before it is decoded.
         :return: stream returns the last received position_token or None.
         """
-
+        return self._stream(_StreamState(), target_callback, position_token_callback, status_message_callback, config,
+                            timeout, graceful_timeout, target_batch_callback, batch_size, batch_latency, batch_builder,
+                            predicate, deduplicator, workers, queue_size, backpressure, spill_directory, line_callback)
+
+    def _stream(self,
+                state: _StreamState,
+                target_callback: Optional[Callable],
+                position_token_callback: Optional[Callable] = None,
+                status_message_callback: Optional[Callable] = None,
+                config: Optional[StreamConfig] = None,
+                timeout: Optional[float] = None,
+                graceful_timeout: bool = True,
+                target_batch_callback: Optional[Callable[[Any], None]] = None,
+                batch_size: int = 500,
+                batch_latency: float = 1.0,
+                batch_builder: Optional[Callable[[int], BatchBuilder]] = None,
+                predicate: Optional[Callable[[Any], bool]] = None,
+                deduplicator: Optional[Deduplicator] = None,
+                workers: int = 0,
+                queue_size: int = 10000,
+                backpressure: Backpressure = Backpressure.BLOCK,
+                spill_directory: Optional[str] = None,
+                line_callback: Optional[Callable[[bytes], None]] = None,
+                timer: Optional[_Timer] = None) -> Optional[str]:
         if timeout is not None and timeout < _min_reasonable_timeout and graceful_timeout:
             self.logger.warning("timeout of {}s might be too low to gracefully time out; "
                                 "recommended values are > {}s".format(timeout, _min_reasonable_timeout))
         self.logger.debug("attempting to connect to {}".format(self.base_url))
 
-        timer = _Timer(timeout)
+        self.queue_metrics = QueueMetrics()
+        batcher, handlers, decode = self._prepare(state, target_callback, position_token_callback,
+                                                  status_message_callback, target_batch_callback, batch_size,
+                                                  batch_latency, batch_builder, predicate, deduplicator)
+        owned = timer is None
+        if owned:
+            timer = _Timer(timeout)
         headers = {'Authorization': 'Bearer {0}'.format(self.token)}
         params = None
         if config is not None:
             params = config.get()
+        compressed = params is not None and params.get(_COMPRESSION_KEY) == Compression.GZIP
+        if compressed:
+            headers['Accept-Encoding'] = 'gzip'
+        if not self._keep_alive:
+            headers['Connection'] = 'close'
         # Timeout here is connect timeout + read-timeout
         # Read-timeout in this context is the wait-time between bytes sent from the server
         # Keep-alive status messages are sent every 15 seconds if no other messages are available.
         # If no data arrives for much longer than that something failed.
         try:
-            with requests.get(self.base_url,
-                              params=params,
-                              headers=headers,
-                              stream=True,
-                              timeout=_min_reasonable_timeout) as r:
+            # The connection returns to the session's pool if the server ended the response, it is closed if the
+            # client disconnects early (e.g. on timeout).
+            with self.session.get(self.base_url,
+                                  params=params,
+                                  headers=headers,
+                                  stream=True,
+                                  timeout=_min_reasonable_timeout) as r:
                 if r.status_code == http.HTTPStatus.UNAUTHORIZED:
                     raise ErrInvalidToken(r.json())
                 logging.debug("connection established")
 
-                for line in r.iter_lines():
-                    decoded_line = line.decode('utf-8')
-                    data = json.loads(decoded_line)
-
-                    if _MessageKey.TARGET.value in data.keys():
-                        self._target_callback()
-                        if target_callback is not None:
-                            target_update = data[_MessageKey.TARGET.value]
-                            target_callback(target_update)
-
-                    elif _MessageKey.POSITION_TOKEN.value in data.keys():
-                        token = data[_MessageKey.POSITION_TOKEN.value]
-                        self._position_token_callback(token)
-                        if position_token_callback is not None:
-                            position_token_callback(token)
+                # the watchdog of the timer shuts the connection down at the deadline, also if no message arrives
+                interrupt = lambda: _interrupt(r)  # noqa: E731
+                timer.watch(interrupt)
+                try:
+                    self._read_stream(r, state, handlers, timer, graceful_timeout, workers, queue_size, backpressure,
+                                      spill_directory, compressed, line_callback, decode)
+                finally:
+                    timer.unwatch(interrupt)
+
+            if batcher is not None:
+                batcher.flush()
+            if timer.expired:
+                self.logger.info("hard timeout after {}s".format(timer.elapsed()))
+                raise _Timer.ErrTimerUp
+            raise ErrServerDisconnected
 
-                    elif _MessageKey.STATUS.value in data.keys():
-                        status = data[_MessageKey.STATUS.value]
-                        self._status_callback(status)
-                        if status_message_callback is not None:
-                            status_message_callback(status)
+        except _Timer.ErrTimerUp:
+            if batcher is not None:
+                batcher.flush()
+        except OSError:
+            # the interrupted connection raises a connection error
+            if not timer.expired:
+                raise
+            self.logger.info("hard timeout after {}s".format(timer.elapsed()))
+            if batcher is not None:
+                batcher.flush()
+        finally:
+            if owned:
+                timer.cancel()
+
+        self.logger.info("last position_token: {}".format(state.last_position_token))
+        return state.last_position_token
+
+    def _read_stream(self, r: requests.Response, state: _StreamState, handlers, timer: _Timer,
+                     graceful_timeout: bool, workers: int, queue_size: int, backpressure: Backpressure,
+                     spill_directory: Optional[str], compressed: bool,
+                     line_callback: Optional[Callable[[bytes], None]], decode):
+        # a gzip Content-Encoding is decoded by requests, a gzip body is decoded by _gunzip
+        chunks = r.iter_content(_CHUNK_SIZE)
+        if self.metrics is not None:
+            chunks = self._read(chunks)
+        if compressed:
+            chunks = _gunzip(chunks)
+        lines = _iter_lines(chunks)
+        if line_callback is not None:
+            lines = self._tee(lines, line_callback)
+        if workers > 0:
+            queue = _WorkQueue(queue_size, backpressure, self.queue_metrics, spill_directory)
+            self._consume_with_workers(lines, handlers, timer, graceful_timeout, workers, queue, decode)
+        else:
+            self._consume(state, lines, handlers, timer, graceful_timeout, decode)
+
+    def replay(self,
+               lines: Iterable[bytes],
+               target_callback: Optional[Callable],
+               position_token_callback: Optional[Callable] = None,
+               status_message_callback: Optional[Callable] = None,
+               target_batch_callback: Optional[Callable[[Any], None]] = None,
+               batch_size: int = 500,
+               batch_latency: float = 1.0,
+               batch_builder: Optional[Callable[[int], BatchBuilder]] = None,
+               predicate: Optional[Callable[[Any], bool]] = None,
+               deduplicator: Optional[Deduplicator] = None) -> Optional[str]:
+        """
+        replay hands raw /stream lines, e.g. recorded with a recorder.Recorder and read by a recorder.Replayer, to the \
+        callbacks as stream() would have, with the same batching, filters and duplicate suppression. It does not \
+        connect to the API, and returns when the lines are exhausted.
+        :param lines: The raw lines, without newlines
+        :return: replay returns the last position_token of the lines or None.
+        """
+        state = _StreamState()
+        batcher, handlers, decode = self._prepare(state, target_callback, position_token_callback,
+                                                  status_message_callback, target_batch_callback, batch_size,
+                                                  batch_latency, batch_builder, predicate, deduplicator)
+        self._consume(state, lines, handlers, _Timer(None), False, decode)
+        if batcher is not None:
+            batcher.flush()
+        return state.last_position_token
+
+    def stream_forever(self,
+                       target_callback: Optional[Callable],
+                       position_token_callback: Optional[Callable] = None,
+                       status_message_callback: Optional[Callable] = None,
+                       config: Optional[StreamConfig] = None,
+                       timeout: Optional[float] = None,
+                       graceful_timeout: bool = True,
+                       backoff: float = 1.0,
+                       max_backoff: float = 60.0,
+                       max_reconnects: Optional[int] = None,
+                       drop_duplicates: bool = True,
+                       target_batch_callback: Optional[Callable[[Any], None]] = None,
+                       **stream_kwargs) -> Optional[str]:
+        """
+        stream_forever calls stream() and reconnects whenever the server disconnects (ErrServerDisconnected, e.g. for \
+        maintenance events), the network fails or a read times out. It resumes from the last received position token, \
+        and waits for a jittered, exponentially growing backoff between consecutive failed attempts.
+        Target updates that the server delivers again after resuming are detected and, with drop_duplicates, not \
+        handed to the callbacks. Reconnects are described by reconnect_stats.
+        ErrInvalidToken is not retried.
+        :param target_callback: The function that is called when a target update arrives, may be None.
+        :param position_token_callback: The function that is called when a position token arrives.
+        :param status_message_callback: The function that is called when a status message arrives.
+        :param config: A StreamConfig object that defines server-side message filters and the initial restart \
+        behavior.
+        :param timeout: The timeout in seconds across all connections, per default stream_forever does not time out.
+        :param graceful_timeout: If True, the client will attempt to disconnect right after a position_token message.
+        :param backoff: The backoff in seconds after the first failed attempt, doubled for every further attempt.
+        :param max_backoff: The maximum backoff in seconds.
+        :param max_reconnects: The number of consecutive failed attempts after which the last error is raised.
+        :param drop_duplicates: If True, target updates delivered again after resuming are not handed over.
+        :param target_batch_callback: The function that is called with a batch of target updates, see stream().
+        :param stream_kwargs: Further arguments to stream(), e.g. batch_size or workers.
+        :return: stream_forever returns the last received position_token or None, once the timeout is up.
+        """
+        state = _StreamState()
+        stats = ReconnectStats()
+        self.reconnect_stats = stats
+        tracker = _ResumeTracker(stats, drop_duplicates)
+        timer = _Timer(timeout)
+        config = config.copy() if config is not None else StreamConfig()
 
-                    else:
-                        self.logger.error("unprocessable message: {}".format(decoded_line))
+        def on_position_token(token):
+            tracker.message()
+            tracker.position_token()
+            if position_token_callback is not None:
+                position_token_callback(token)
 
-                    self._general_callback(timer)  # for client-side disconnect (graceful or hard timeout)
+        def on_status(status):
+            tracker.message()
+            if status_message_callback is not None:
+                status_message_callback(status)
 
-            raise ErrServerDisconnected
+        def keep_target(target_update) -> bool:
+            # duplicates are neither handed to target_callback nor added to batches
+            tracker.message()
+            return tracker.target(target_update)
 
-        except _Timer.ErrTimerUp:
-            pass
+        state.target_filter = keep_target
 
-        self.logger.info("last position_token: {}".format(self._last_position_token))
-        return self._last_position_token
+        failures = 0
+        try:
+            while True:
+                try:
+                    # one timer, and its watchdog, spans all connections
+                    return self._stream(state,
+                                        target_callback,
+                                        position_token_callback=on_position_token,
+                                        status_message_callback=on_status,
+                                        config=config,
+                                        timeout=timeout,
+                                        graceful_timeout=graceful_timeout,
+                                        target_batch_callback=target_batch_callback,
+                                        timer=timer,
+                                        **stream_kwargs)
+                except (ErrServerDisconnected, requests.exceptions.RequestException) as e:
+                    interrupted_at = time.perf_counter()
+                    stats.last_error = e
+                    if tracker.first_message_time is not None:
+                        failures = 0  # the connection worked, so this is not a consecutive failure
+                    failures += 1
+                    if max_reconnects is not None and failures > max_reconnects:
+                        raise
+
+                    delay = random.uniform(0.5, 1.0) * min(max_backoff, backoff * 2 ** (failures - 1))
+                    if delay >= timer.remaining():
+                        self.logger.info("no time left to reconnect after {}".format(repr(e)))
+                        self.logger.info("last position_token: {}".format(state.last_position_token))
+                        return state.last_position_token
+                    self.logger.warning(
+                        "stream interrupted ({}), reconnecting in {:.1f}s from position_token {}".format(
+                            repr(e), delay, state.last_position_token))
+                    time.sleep(delay)
+
+                    if state.last_position_token is not None:
+                        config.add(ContinueFromPositionToken(state.last_position_token))
+                    # a position token in the initial config is resumed from as well, LATEST starts with a gap
+                    resumed = config.get().get("position_token", "LATEST") != "LATEST"
+                    if not resumed:
+                        stats.unresumed_reconnects += 1
+                        stats.unresumed_seconds += time.perf_counter() - interrupted_at
+                        stats.estimated_lost += int(tracker.target_rate(interrupted_at) *
+                                                    (time.perf_counter() - interrupted_at))
+                    stats.reconnects += 1
+                    if self.metrics is not None:
+                        self.metrics.reconnect()
+                    tracker.reconnect(resumed, interrupted_at)
+        finally:
+            timer.cancel()
+
+    def stream_sharded(self,
+                       shards: List[StreamConfig],
+                       target_callback: Optional[Callable],
+                       position_token_callback: Optional[Callable[[int, str], None]] = None,
+                       status_message_callback: Optional[Callable] = None,
+                       timeout: Optional[float] = None,
+                       graceful_timeout: bool = True,
+                       target_batch_callback: Optional[Callable[[Any], None]] = None,
+                       batch_size: int = 500,
+                       batch_latency: float = 1.0,
+                       batch_builder: Optional[Callable[[int], BatchBuilder]] = None,
+                       merge_window: float = 0.0,
+                       **stream_kwargs) -> List[Optional[str]]:
+        """
+        stream_sharded streams several parts of one logical stream (shards, see shard_by_longitude and \
+        shard_by_icao_address) at once, each over its own connection and on its own thread, and merges them into \
+        one stream of callbacks. The callbacks, including status_message_callback, are never called concurrently.
+        Target updates are held back for merge_window seconds, and delivered in timestamp order across the shards \
+        within that window. With the default merge_window of 0.0, target updates are delivered in the order they \
+        arrive, which orders them within every shard but not across shards. Target updates received on more than one \
+        shard (e.g. on the border of two longitude bands) are delivered once.
+        Every shard has its own position tokens: a shard's position token is passed to position_token_callback, \
+        together with the index of the shard, once all target updates the shard received before it have been \
+        delivered. Store them per shard, and resume each shard from its own token with ContinueFromPositionToken.
+        When a shard fails, the connections of the other shards are shut down right away, without waiting for \
+        their next message, and the first error is raised once pending target updates have been delivered. The merge \
+        is described by shard_stats.
+        :param shards: The configuration of every shard.
+        :param target_callback: The function that is called when a target update arrives, may be None.
+        :param position_token_callback: The function that is called with the shard index and position token.
+        :param status_message_callback: The function that is called when a status message arrives on any shard.
+        :param timeout: The timeout in seconds, shared by all shards.
+        :param graceful_timeout: If True, every shard attempts to disconnect right after a position_token message.
+        :param target_batch_callback: The function that is called with a batch of target updates, see stream().
+        :param batch_size: The maximum number of target updates per batch.
+        :param batch_latency: The time in seconds after which a batch is delivered, checked when a message arrives \
+        on any shard, see stream().
+        :param batch_builder: The factory of the BatchBuilder that builds the batches, called with batch_size.
+        :param merge_window: The time in seconds target updates are held back to be ordered across shards, 0.0 for \
+        the order of arrival.
+        :param stream_kwargs: Further arguments to stream() for every shard, e.g. predicate or workers.
+        :return: stream_sharded returns the last committed position token of every shard.
+        """
+        stats = ShardStats(len(shards))
+        self.shard_stats = stats
+        timer = _Timer(timeout)
+        batcher = None
+        deliver = target_callback if target_callback is not None else lambda _: None
+        if target_batch_callback is not None:
+            builder = batch_builder(batch_size) if batch_builder is not None else None
+            batcher = _TargetBatcher(target_batch_callback, batch_size, batch_latency, builder)
+            deliver = self._chain(target_callback, batcher.add)
+
+        def commit(shard: int, token: str):
+            if position_token_callback is not None:
+                position_token_callback(shard, token)
+
+        merger = _ShardMerger(stats, deliver, commit, merge_window, batcher)
+        errors = []
+
+        def run(shard: int, config: StreamConfig):
+            def on_status(status):
+                merger.status(status_message_callback, status)
+
+            try:
+                self._stream(_StreamState(),
+                             lambda target_update: merger.add(shard, target_update),
+                             position_token_callback=lambda token: merger.position_token(shard, token),
+                             status_message_callback=on_status,
+                             config=config,
+                             timeout=timeout,
+                             graceful_timeout=graceful_timeout,
+                             timer=timer,
+                             **stream_kwargs)
+            except BaseException as e:
+                self.logger.warning("shard {} failed: {}".format(shard, repr(e)))
+                errors.append(e)
+                timer.stop()
+
+        threads = [threading.Thread(target=run, args=(i, config), name="stream-shard-{}".format(i), daemon=True)
+                   for i, config in enumerate(shards)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        timer.cancel()
+        merger.flush()
+
+        if errors:
+            raise errors[0]
+        return list(stats.position_tokens)
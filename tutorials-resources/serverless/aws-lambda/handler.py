@@ -3,11 +3,14 @@ import os
 from typing import Dict, Any, Optional
 
 import boto3
-from client import Client, StreamConfig, ContinueFromPositionToken
+from checkpoint import S3CheckpointStore
+from client import Client, StreamConfig, ContinueFromPositionToken, Deduplicator
 from client import FilterLongitude, FilterLatitude
 
 TIMEOUT = 295
 LAST_POSITION_TOKEN_KEY = "last_position_token"
+# CHECKPOINT_INTERVAL is the minimum number of seconds between two writes of the last position token
+CHECKPOINT_INTERVAL = 10
 
 
 class TargetProcessor(object):
@@ -27,21 +30,18 @@ def must_getenv(key) -> str:
     return result
 
 
-def get_last_position_token(s3, bucket, key, logger) -> Optional[str]:
-    try:
-        response = s3.get_object(Bucket=bucket, Key=key)
-        last_position_token = response['Body'].read().decode('UTF-8')
-        return last_position_token
-    except Exception as e:
-        logger.warning("could not get last position_token: {}".format(e))
-        return None
+# The client is kept at module scope, so that warm invocations reuse its connection pool.
+_client: Optional[Client] = None
+# So is the deduplicator, so that target updates delivered again after resuming from the previous invocation's last
+# position token are not processed twice.
+_deduplicator = Deduplicator()
 
 
-def put_last_position_token(s3, bucket, key, token, logger):
-    try:
-        s3.put_object(Bucket=bucket, Key=key, Body=token, ContentType="text/plain")
-    except Exception as e:
-        logger.warning("could not put last position_token: {}".format(e))
+def get_client(logger) -> Client:
+    global _client
+    if _client is None:
+        _client = Client(must_getenv("AIRSAFE2_TOKEN"), logger=logger)
+    return _client
 
 
 def handler(event: Dict[str, Any], context):
@@ -51,11 +51,10 @@ def handler(event: Dict[str, Any], context):
     logger.setLevel(logging.INFO)
     logger.info("event:{}".format(event))
 
-    # Retrieve the AirSafe2 token, and create a client
-    AIRSAFE2_TOKEN = must_getenv("AIRSAFE2_TOKEN")
+    # Retrieve the AirSafe2 token, and create a client (or reuse the one of a previous invocation)
     LAST_POSITION_TOKEN_BUCKET = must_getenv("LAST_POSITION_TOKEN_BUCKET")
 
-    c = Client(AIRSAFE2_TOKEN, logger=logger)
+    c = get_client(logger)
 
     # Filter for planes that depart or arrive in Atlanta
     cfg = StreamConfig()
@@ -64,16 +63,24 @@ def handler(event: Dict[str, Any], context):
     cfg.add(FilterLongitude(*atlanta_lon))
     cfg.add(FilterLatitude(*atlanta_lat))
 
-    # Restart the stream from it's last position, if this position is known
-    last_position_token = get_last_position_token(s3, LAST_POSITION_TOKEN_BUCKET, LAST_POSITION_TOKEN_KEY, logger)
+    # Restart the stream from it's last position, if this position is known. Position tokens are written in the
+    # background while streaming, so that a function that is stopped early still resumes from a recent token
+    checkpoints = S3CheckpointStore(s3, LAST_POSITION_TOKEN_BUCKET, LAST_POSITION_TOKEN_KEY,
+                                    min_interval=CHECKPOINT_INTERVAL, logger=logger)
+    last_position_token = checkpoints.load()
     if last_position_token is not None:
         logger.info("starting from position_token: {}".format(last_position_token))
         cfg.add(ContinueFromPositionToken(last_position_token))
 
-    # Create the callback class and start the stream
+    # Create the callback class and start the stream, reconnecting from the last position token if the connection is
+    # interrupted before the timeout
     tp = TargetProcessor(logger)
-    last_position_token = c.stream(tp.callback, config=cfg, timeout=TIMEOUT)
-
-    put_last_position_token(s3, LAST_POSITION_TOKEN_BUCKET, LAST_POSITION_TOKEN_KEY, last_position_token, logger)
+    try:
+        last_position_token = c.stream_forever(tp.callback, position_token_callback=checkpoints, config=cfg,
+                                               timeout=TIMEOUT, deduplicator=_deduplicator)
+        checkpoints.save(last_position_token)
+    finally:
+        checkpoints.close()
+    logger.info("duplicates dropped: {} of {} target updates".format(_deduplicator.duplicates, _deduplicator.seen))
 
     return last_position_token
@@ -1,14 +1,22 @@
+import gzip
+import http.server
+import json
 import logging
+import threading
+import time
 from enum import Enum
+from urllib.parse import urlparse, parse_qs
 
+import requests
 import responses
 from testfixtures import LogCapture
 
-from client import Client, StreamConfig
-from client import ContinueFromPositionToken, FilterMaxAge, FilterLatitude, FilterLate, \
+from client import Client, StreamConfig, JSONDecoder, Backpressure, BatchBuilder, Deduplicator
+from client import Compression, ContinueFromPositionToken, FilterMaxAge, FilterLatitude, FilterLate, \
     FilterLongitude, FilterCallSign, FilterAltitude, FilterAirline, FilterTailNumber, FilterIcaoAddress
 from client import ErrInvalidToken, ErrServerDisconnected
-from client import _STREAM_V2_URL
+from client import shard_by_longitude, shard_by_icao_address, ShardStats
+from client import _STREAM_V2_URL, _ShardMerger
 
 
 class T(Enum):
@@ -30,6 +38,7 @@ class TestStreamConfig(object):
                 T.want: {}
             }, {
                 T.args: [ContinueFromPositionToken('BEGINNING'),
+                         Compression(Compression.GZIP),
                          FilterMaxAge(15),
                          FilterLatitude(100.0, 120.0),
                          FilterLongitude(170.0, -170.0),
@@ -50,6 +59,7 @@ class TestStreamConfig(object):
                          "tail_number": "tail1,tail2",
                          "icao_address": "icao1,icao2",
                          "position_token": "BEGINNING",
+                         "compression": "gzip",
                          }
             }
         ]
@@ -62,6 +72,114 @@ class TestStreamConfig(object):
             got = cfg.get()
             assert got == test[T.want]
 
+    def test_shard(self):
+        """
+        test_shard tests that configurations are split into longitude bands and ICAO address lists
+        """
+        cfg = StreamConfig()
+        cfg.add(FilterAirline(["airline1"]))
+        across = cfg.copy()
+        across.add(FilterLongitude(170.0, -170.0))
+        icao = cfg.copy()
+        icao.add(FilterIcaoAddress(["icao1", "icao2", "icao3"]))
+        tests = [
+            {
+                T.args: lambda: shard_by_longitude(None, 3),
+                T.want: [{"longitude_between": "-180.0,-60.0"}, {"longitude_between": "-60.0,60.0"},
+                         {"longitude_between": "60.0,180.0"}]
+            }, {
+                T.args: lambda: shard_by_longitude(across, 2),
+                T.want: [{"airline": "airline1", "longitude_between": "170.0,180.0"},
+                         {"airline": "airline1", "longitude_between": "180.0,-170.0"}]
+            }, {
+                T.args: lambda: shard_by_longitude(cfg, 0, boundaries=[30.0, -100.0]),
+                T.want: [{"airline": "airline1", "longitude_between": "-180.0,-100.0"},
+                         {"airline": "airline1", "longitude_between": "-100.0,30.0"},
+                         {"airline": "airline1", "longitude_between": "30.0,180.0"}]
+            }, {
+                T.args: lambda: shard_by_icao_address(icao, 2),
+                T.want: [{"airline": "airline1", "icao_address": "icao1,icao3"},
+                         {"airline": "airline1", "icao_address": "icao2"}]
+            }, {
+                T.args: lambda: shard_by_icao_address(cfg, 2),
+                T.err: ValueError
+            }
+        ]
+
+        for test in tests:
+            try:
+                got = [c.get() for c in test[T.args]()]
+                assert T.err not in test
+                assert got == test[T.want]
+            except ValueError:
+                assert test.get(T.err) is ValueError
+        assert cfg.get() == {"airline": "airline1"}
+
+
+class TestJSONDecoder(object):
+
+    def test_decode(self):
+        """
+        test_decode tests that the fast paths and the full parse classify and parse messages identically
+        """
+        tests = [
+            {
+                T.args: b'{"target":{"icao_address":"ADB984","latitude":33.6}}',
+                T.want: ("target", {"icao_address": "ADB984", "latitude": 33.6})
+            }, {
+                T.args: b'    {"target": {"icao_address": "ADB984"}}\r',
+                T.want: ("target", {"icao_address": "ADB984"})
+            }, {
+                T.args: b'{"position_token":"the=token=="}',
+                T.want: ("position_token", "the=token==")
+            }, {
+                T.args: b'{"position_token": "the=token=="}',
+                T.want: ("position_token", "the=token==")
+            }, {
+                T.args: b'{"position_token":"escaped\\"token"}',
+                T.want: ("position_token", 'escaped"token')
+            }, {
+                T.args: b'{"status":{"timestamp":"2020-09-07T16:33:10Z","level":"INFO","message":"hi","code":100}}',
+                T.want: ("status", {"timestamp": "2020-09-07T16:33:10Z", "level": "INFO", "message": "hi",
+                                    "code": 100})
+            }, {
+                T.args: b'{"target":{"icao_address":"ADB984"},"unexpected":{}}',
+                T.want: ("target", {"icao_address": "ADB984"})
+            }, {
+                T.args: b'{"unexpected":{}}',
+                T.want: (None, None)
+            }
+        ]
+
+        for loads in [None, json.loads]:
+            d = JSONDecoder(loads=loads)
+            for test in tests:
+                assert d.decode(test[T.args]) == test[T.want]
+
+    def test_decode_target_factory(self):
+        """
+        test_decode_target_factory tests that the target_factory is applied to target updates only
+        """
+        tests = [
+            {
+                T.args: b'{"target":{"icao_address":"ADB984","latitude":33.6}}',
+                T.want: ("target", [("icao_address", "ADB984"), ("latitude", 33.6)])
+            }, {
+                T.args: b'{"target":{"icao_address":"ADB984"},"unexpected":{}}',
+                T.want: ("target", [("icao_address", "ADB984")])
+            }, {
+                T.args: b'{"position_token":"the=token=="}',
+                T.want: ("position_token", "the=token==")
+            }, {
+                T.args: b'{"status":{"level":"INFO"}}',
+                T.want: ("status", {"level": "INFO"})
+            }
+        ]
+
+        d = JSONDecoder(target_factory=lambda t: sorted(t.items()))
+        for test in tests:
+            assert d.decode(test[T.args]) == test[T.want]
+
 
 class TestClient(object):
     class CallbackRecorder(object):
@@ -212,3 +330,561 @@ class TestClient(object):
                 assert last_but_one_entry[1] == "INFO"
                 assert test[T.want]["msg"] in last_but_one_entry[2]
                 assert len(r.messages) == test[T.want]["n_targets"]
+
+    @responses.activate
+    def test_stream_no_graceful_timeout(self):
+        """
+        test_stream_no_graceful_timeout tests that without graceful_timeout the client does not disconnect after a
+        position token, with and without workers
+        """
+        tests = [{
+            T.args: 0,
+        }, {
+            T.args: 2,
+        }]
+
+        for test in tests:
+            responses.reset()
+            responses.add(responses.GET, _STREAM_V2_URL,
+                          body='{"target":{"icao_address": "ADB984"}}\n'
+                               '{"position_token":"the=token=="}\n'
+                               '{"target":{"icao_address": "ADB985"}}\n',
+                          status=200)
+            r = self.CallbackRecorder()
+            try:
+                Client("token").stream(r.callback, timeout=1, graceful_timeout=False, workers=test[T.args])
+                assert False  # expected behavior is not to arrive here
+            except ErrServerDisconnected:
+                pass
+
+            assert r.messages == [{"icao_address": "ADB984"}, {"icao_address": "ADB985"}]
+
+    def test_stream_hard_timeout_silent_stream(self):
+        """
+        test_stream_hard_timeout_silent_stream tests that the hard timeout fires on time even when no messages arrive,
+        for a single connection and across reconnects
+        """
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                body = b'{"position_token":"the=token=="}\n'
+                self.send_response(200)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(body), body))
+                self.wfile.flush()
+                time.sleep(10)  # far longer than the timeout, and shorter than the 15s between keep-alive messages
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = "http://127.0.0.1:{}/".format(server.server_address[1])
+
+        tests = [{
+            T.args: lambda c: c.stream(None, timeout=0.5),
+        }, {
+            T.args: lambda c: c.stream_forever(None, timeout=0.5),
+        }]
+
+        try:
+            for test in tests:
+                with Client("token", base_url=url) as c:
+                    start = time.perf_counter()
+                    token = test[T.args](c)
+                    elapsed = time.perf_counter() - start
+
+                assert token == "the=token=="
+                assert elapsed < 5
+        finally:
+            server.shutdown()
+
+    @responses.activate
+    def test_stream_target_batch_callback(self):
+        """
+        test_stream_target_batch_callback tests that target updates are batched by size, that pending batches are
+        delivered before position tokens and on disconnect, and that a zero latency delivers targets right away
+        """
+        tests = [{
+            T.args: {"batch_size": 2, "batch_latency": 60},
+            T.want: [["ADB981", "ADB982"], ["ADB983"], "the=token==", ["ADB984"]],
+        }, {
+            T.args: {"batch_size": 100, "batch_latency": 0},
+            T.want: [["ADB981"], ["ADB982"], ["ADB983"], "the=token==", ["ADB984"]],
+        }]
+
+        for test in tests:
+            responses.add(responses.GET, _STREAM_V2_URL,
+                          body="""{"target":{"icao_address": "ADB981"}}
+{"target":{"icao_address": "ADB982"}}
+{"target":{"icao_address": "ADB983"}}
+{"position_token":"the=token=="}
+{"target":{"icao_address": "ADB984"}}""",
+                          status=200)
+
+            c = Client("token")
+            r = self.CallbackRecorder()
+
+            try:
+                c.stream(None,
+                         target_batch_callback=lambda batch: r.callback([t["icao_address"] for t in batch]),
+                         position_token_callback=r.callback,
+                         **test[T.args])
+                assert False  # expected behavior is not to arrive here
+            except ErrServerDisconnected:
+                pass
+
+            assert r.messages == test[T.want]
+
+    @responses.activate
+    def test_stream_batch_builder(self):
+        """
+        test_stream_batch_builder tests that batches are built by the given BatchBuilder, which is created once per
+        stream with the batch size
+        """
+
+        class IcaoBuilder(BatchBuilder):
+            capacities = []
+
+            def __init__(self, capacity):
+                self.capacities.append(capacity)
+                self._icao_addresses = []
+
+            def append(self, target_update):
+                self._icao_addresses.append(target_update["icao_address"])
+
+            def __len__(self):
+                return len(self._icao_addresses)
+
+            def build(self):
+                batch, self._icao_addresses = ",".join(self._icao_addresses), []
+                return batch
+
+        responses.add(responses.GET, _STREAM_V2_URL,
+                      body="""{"target":{"icao_address": "ADB981"}}
+{"target":{"icao_address": "ADB982"}}
+{"target":{"icao_address": "ADB983"}}
+{"position_token":"the=token=="}
+{"target":{"icao_address": "ADB984"}}""",
+                      status=200)
+
+        c = Client("token")
+        r = self.CallbackRecorder()
+
+        try:
+            c.stream(None, target_batch_callback=r.callback, position_token_callback=r.callback, batch_size=2,
+                     batch_builder=IcaoBuilder)
+            assert False  # expected behavior is not to arrive here
+        except ErrServerDisconnected:
+            pass
+
+        assert r.messages == ["ADB981,ADB982", "ADB983", "the=token==", "ADB984"]
+        assert IcaoBuilder.capacities == [2]
+
+    @responses.activate
+    def test_stream_predicate(self):
+        """
+        test_stream_predicate tests that target updates that do not match the predicate are neither handed to the
+        target_callback nor batched
+        """
+        responses.add(responses.GET, _STREAM_V2_URL,
+                      body="""{"target":{"icao_address": "ADB981", "speed": 310}}
+{"target":{"icao_address": "ADB982", "speed": 120}}
+{"position_token":"the=token=="}
+{"target":{"icao_address": "ADB983"}}""",
+                      status=200)
+
+        c = Client("token")
+        r = self.CallbackRecorder()
+
+        try:
+            c.stream(r.callback, position_token_callback=r.callback,
+                     target_batch_callback=lambda batch: r.callback([t["icao_address"] for t in batch]),
+                     predicate=lambda t: t.get("speed", 0) > 300)
+            assert False  # expected behavior is not to arrive here
+        except ErrServerDisconnected:
+            pass
+
+        assert r.messages == [{"icao_address": "ADB981", "speed": 310}, ["ADB981"], "the=token=="]
+
+    def test_deduplicator(self):
+        """
+        test_deduplicator tests that target updates are remembered for at least one generation, and forgotten after two
+        """
+        d = Deduplicator(max_size=2)
+        targets = [{"icao_address": i, "timestamp": "2021-05-21T12:00:00Z", "latitude": 1.0, "longitude": 2.0}
+                   for i in "ABCDE"]
+        got = [d(targets[i]) for i in [0, 1, 0, 2, 0, 1, 3, 4, 2, 0]]
+
+        assert got == [True, True, False, True, False, False, True, True, False, True]
+        assert d({"icao_address": "A", "timestamp": "2021-05-21T12:00:01Z", "latitude": 1.0, "longitude": 2.0})
+        assert (d.seen, d.duplicates, d.hit_rate) == (11, 4, 4 / 11)
+        assert len(d) <= 4
+        assert Deduplicator().hit_rate is None
+
+        d = Deduplicator(ttl=0)
+        assert [d(targets[i]) for i in [0, 0, 1, 0, 2, 0]] == [True, False, True, False, True, True]
+
+    @responses.activate
+    def test_stream_deduplicator(self):
+        """
+        test_stream_deduplicator tests that target updates delivered again by a later stream are dropped
+        """
+        responses.add(responses.GET, _STREAM_V2_URL,
+                      body="""{"target":{"icao_address": "A"}}
+{"position_token":"token1"}
+{"target":{"icao_address": "B", "speed": 300}}""",
+                      status=200)
+        responses.add(responses.GET, _STREAM_V2_URL,
+                      body="""{"target":{"icao_address": "B", "speed": 300}}
+{"target":{"icao_address": "C"}}""",
+                      status=200)
+
+        c = Client("token")
+        r = self.CallbackRecorder()
+        d = Deduplicator()
+        for _ in range(2):
+            try:
+                c.stream(r.callback, deduplicator=d, predicate=lambda t: t["icao_address"] != "A")
+                assert False  # expected behavior is not to arrive here
+            except ErrServerDisconnected:
+                pass
+
+        assert r.messages == [{"icao_address": "B", "speed": 300}, {"icao_address": "C"}]
+        assert (d.seen, d.duplicates) == (3, 1)
+
+    @responses.activate
+    def test_stream_workers(self):
+        """
+        test_stream_workers tests that all target updates are processed by the worker pool, and that position tokens
+        are only handed over once all preceding target updates have been processed
+        """
+        lines = []
+        for i in range(200):
+            lines.append('{{"target":{{"icao_address": "{:06d}"}}}}'.format(i))
+            if i % 50 == 49:
+                lines.append('{{"position_token":"token{}"}}'.format(i))
+        responses.add(responses.GET, _STREAM_V2_URL, body="\n".join(lines), status=200)
+
+        lock = threading.Lock()
+        delivered = []
+        tokens = {}
+
+        def target_callback(target):
+            time.sleep(0.001)
+            with lock:
+                delivered.append(target["icao_address"])
+
+        def position_token_callback(token):
+            with lock:
+                tokens[token] = set(delivered)
+
+        c = Client("token")
+        try:
+            c.stream(target_callback, position_token_callback=position_token_callback, workers=4, queue_size=10)
+            assert False  # expected behavior is not to arrive here
+        except ErrServerDisconnected:
+            pass
+
+        assert sorted(delivered) == ["{:06d}".format(i) for i in range(200)]
+        assert list(tokens.keys()) == ["token49", "token99", "token149", "token199"]
+        for token, seen in tokens.items():
+            last = int(token[len("token"):])
+            assert {"{:06d}".format(i) for i in range(last + 1)} <= seen
+        assert c.queue_metrics.max_depth <= 10
+        assert c.queue_metrics.depth == 0
+
+    @responses.activate
+    def test_stream_backpressure(self):
+        """
+        test_stream_backpressure tests the behavior of the backpressure policies when a slow callback lets the work
+        queue fill up
+        """
+        tests = [{
+            T.args: Backpressure.BLOCK,
+            T.want: {"in_order": True, "all": True},
+        }, {
+            T.args: Backpressure.SPILL,
+            T.want: {"in_order": True, "all": True},
+        }, {
+            T.args: Backpressure.DROP_OLDEST,
+            T.want: {"in_order": True, "all": False},
+        }]
+
+        for test in tests:
+            responses.add(responses.GET, _STREAM_V2_URL,
+                          body="\n".join('{{"target":{{"n": {}}}}}'.format(i) for i in range(20)),
+                          status=200)
+            delivered = []
+
+            def target_callback(target):
+                if target["n"] == 0:
+                    time.sleep(0.2)
+                delivered.append(target["n"])
+
+            c = Client("token")
+            try:
+                c.stream(target_callback, workers=1, queue_size=2, backpressure=test[T.args])
+                assert False  # expected behavior is not to arrive here
+            except ErrServerDisconnected:
+                pass
+
+            assert (delivered == sorted(delivered)) == test[T.want]["in_order"]
+            assert (delivered == list(range(20))) == test[T.want]["all"]
+            metrics = c.queue_metrics
+            if test[T.args] == Backpressure.BLOCK:
+                assert metrics.blocked_seconds > 0.1
+            if test[T.args] == Backpressure.SPILL:
+                assert metrics.spilled > 0
+                assert metrics.max_depth > 2
+            if test[T.args] == Backpressure.DROP_OLDEST:
+                assert metrics.dropped == 20 - len(delivered)
+
+    @responses.activate
+    def test_stream_forever(self):
+        """
+        test_stream_forever tests that stream_forever resumes from the last position token after server disconnects
+        and network errors, drops target updates that are delivered again, and records the reconnects
+        """
+        responses.add(responses.GET, _STREAM_V2_URL,
+                      body="""{"target":{"icao_address": "A"}}
+{"position_token":"token1"}
+{"target":{"icao_address": "B"}}
+{"target":{"icao_address": "C"}}""",
+                      status=200)
+        responses.add(responses.GET, _STREAM_V2_URL,
+                      body=requests.exceptions.ConnectionError("connection reset"))
+        responses.add(responses.GET, _STREAM_V2_URL,
+                      body="""{"target":{"icao_address": "B"}}
+{"target":{"icao_address": "C"}}
+{"position_token":"token2"}
+{"target":{"icao_address": "D"}}""",
+                      status=200)
+        responses.add(responses.GET, _STREAM_V2_URL, body='{}', status=401)
+
+        c = Client("token")
+        r = self.CallbackRecorder()
+        cfg = StreamConfig()
+        cfg.add(FilterAirline(["airline1"]))
+
+        try:
+            c.stream_forever(r.callback, position_token_callback=r.callback, config=cfg, backoff=0)
+            assert False  # expected behavior is not to arrive here
+        except ErrInvalidToken:
+            pass
+
+        assert r.messages == [{"icao_address": "A"}, "token1", {"icao_address": "B"}, {"icao_address": "C"},
+                              "token2", {"icao_address": "D"}]
+        tokens = [parse_qs(urlparse(call.request.url).query).get("position_token") for call in responses.calls]
+        assert tokens == [None, ["token1"], ["token1"], ["token2"]]
+        assert cfg.get() == {"airline": "airline1"}
+
+        stats = c.reconnect_stats
+        assert stats.reconnects == 3
+        assert stats.duplicates == 2
+        assert stats.unresumed_reconnects == 0
+        assert len(stats.reconnect_latencies) == 1
+
+    @responses.activate
+    def test_stream_forever_batches(self):
+        """
+        test_stream_forever_batches tests that target updates delivered again after resuming are not added to batches
+        """
+        responses.add(responses.GET, _STREAM_V2_URL,
+                      body="""{"target":{"icao_address": "A"}}
+{"position_token":"token1"}
+{"target":{"icao_address": "B"}}""",
+                      status=200)
+        responses.add(responses.GET, _STREAM_V2_URL,
+                      body="""{"target":{"icao_address": "B"}}
+{"target":{"icao_address": "C"}}""",
+                      status=200)
+        responses.add(responses.GET, _STREAM_V2_URL, body='{}', status=401)
+
+        c = Client("token")
+        r = self.CallbackRecorder()
+
+        try:
+            c.stream_forever(None, position_token_callback=r.callback, backoff=0,
+                             target_batch_callback=lambda batch: r.callback([t["icao_address"] for t in batch]))
+            assert False  # expected behavior is not to arrive here
+        except ErrInvalidToken:
+            pass
+
+        assert r.messages == [["A"], "token1", ["B"], ["C"]]
+        assert c.reconnect_stats.duplicates == 1
+
+    @responses.activate
+    def test_stream_forever_max_reconnects(self):
+        """
+        test_stream_forever_max_reconnects tests that consecutive failures are given up on after max_reconnects
+        """
+        responses.add(responses.GET, _STREAM_V2_URL, body=requests.exceptions.ConnectionError("unreachable"))
+
+        c = Client("token")
+        try:
+            c.stream_forever(None, backoff=0, max_reconnects=2)
+            assert False  # expected behavior is not to arrive here
+        except requests.exceptions.ConnectionError:
+            pass
+
+        assert len(responses.calls) == 3
+        assert c.reconnect_stats.reconnects == 2
+        assert c.reconnect_stats.unresumed_reconnects == 2
+
+    @responses.activate
+    def test_stream_compression(self):
+        """
+        test_stream_compression tests that gzip compressed streams are decompressed, whether they are sent as a gzip
+        body, as several gzip members, or with a gzip Content-Encoding, and that uncompressed streams pass through
+        """
+        lines = [b'{"target":{"icao_address": "ADB984"}}', b'{"position_token":"the=token=="}',
+                 b'{"target":{"icao_address": "ADB985"}}']
+        members = b"".join(gzip.compress(line + b"\n") for line in lines)
+        tests = [{
+            T.args: {"body": gzip.compress(b"\n".join(lines))},
+        }, {
+            T.args: {"body": members},
+        }, {
+            T.args: {"body": gzip.compress(b"\n".join(lines)), "headers": {"Content-Encoding": "gzip"}},
+        }, {
+            T.args: {"body": b"\n".join(lines)},
+        }]
+
+        for test in tests:
+            responses.add(responses.GET, _STREAM_V2_URL, status=200, **test[T.args])
+            cfg = StreamConfig()
+            cfg.add(Compression(Compression.GZIP))
+            c = Client("token")
+            r = self.CallbackRecorder()
+
+            try:
+                c.stream(r.callback, position_token_callback=r.callback, config=cfg)
+                assert False  # expected behavior is not to arrive here
+            except ErrServerDisconnected:
+                pass
+
+            assert r.messages == [{"icao_address": "ADB984"}, "the=token==", {"icao_address": "ADB985"}]
+            assert responses.calls[-1].request.headers["Accept-Encoding"] == "gzip"
+
+    @responses.activate
+    def test_stream_session_reuse(self):
+        """
+        test_stream_session_reuse tests that consecutive streams share the client's session but not their state,
+        and that keep-alive can be turned off
+        """
+        tests = [{
+            T.args: True,
+            T.want: "keep-alive",
+        }, {
+            T.args: False,
+            T.want: "close",
+        }]
+
+        for test in tests:
+            responses.reset()
+            responses.add(responses.GET, _STREAM_V2_URL, body='{"position_token":"the=token=="}', status=200)
+            responses.add(responses.GET, _STREAM_V2_URL, body='{"target":{"icao_address": "ADB984"}}', status=200)
+
+            with Client("token", keep_alive=test[T.args]) as c:
+                session = c.session
+                tokens = []
+                for _ in range(2):
+                    try:
+                        tokens.append(c.stream(None, timeout=0, graceful_timeout=False))
+                    except ErrServerDisconnected:
+                        pass
+                assert c.session is session
+
+            assert tokens == ["the=token==", None]
+            assert responses.calls[-1].request.headers["Connection"] == test[T.want]
+
+    def test_shard_merger(self):
+        """
+        test_shard_merger tests that target updates of several shards are delivered once, in timestamp order within
+        the merge window, and that a shard's position tokens wait for the shard's target updates before them
+        """
+        r = self.CallbackRecorder()
+        stats = ShardStats(2)
+        merger = _ShardMerger(stats, lambda t: r.callback(t["icao_address"]),
+                              lambda shard, token: r.callback((shard, token)), window=60)
+
+        merger.add(0, {"icao_address": "A", "timestamp": "2021-05-21T12:00:02Z"})
+        merger.add(1, {"icao_address": "B", "timestamp": "2021-05-21T12:00:01.5Z"})
+        merger.position_token(1, "token1")
+        merger.add(0, {"icao_address": "C", "timestamp": "2021-05-21T12:00:01Z", "longitude": 0.0})
+        merger.add(1, {"icao_address": "C", "timestamp": "2021-05-21T12:00:01Z", "longitude": 0.0})
+        merger.position_token(0, "token0")
+        merger.add(1, {"icao_address": "D", "timestamp": "2021-05-21T12:00:00Z"})
+        merger.position_token(1, "token2")
+        assert r.messages == []
+
+        merger.flush()
+        assert r.messages == ["D", "C", "B", (1, "token1"), (1, "token2"), "A", (0, "token0")]
+        assert stats.targets == [2, 3]
+        assert stats.duplicates == 1
+        assert stats.position_tokens == ["token0", "token2"]
+
+        r.messages = []
+        merger = _ShardMerger(ShardStats(1), r.callback, lambda shard, token: r.callback(token), window=0)
+        merger.add(0, {"icao_address": "E"})
+        merger.position_token(0, "token3")
+        assert r.messages == [{"icao_address": "E"}, "token3"]
+
+        # a status message of another shard waits for the target callback
+        r.messages = []
+        status = []
+
+        def deliver(target_update):
+            thread = threading.Thread(target=merger.status, args=(r.callback, "status"))
+            thread.start()
+            status.append(thread)
+            time.sleep(0.05)
+            r.callback(target_update["icao_address"])
+
+        merger = _ShardMerger(ShardStats(2), deliver, lambda shard, token: None, window=0)
+        merger.add(0, {"icao_address": "F"})
+        status[0].join(5)
+        assert r.messages == ["F", "status"]
+
+    @responses.activate
+    def test_stream_sharded(self):
+        """
+        test_stream_sharded tests that stream_sharded streams every shard with its own configuration, delivers its
+        position tokens with the shard index, and raises the error of a failed shard
+        """
+        responses.add(responses.GET, _STREAM_V2_URL,
+                      body="""{"target":{"icao_address": "A"}}
+{"position_token":"token1"}
+{"target":{"icao_address": "B"}}""",
+                      status=200)
+
+        c = Client("token")
+        r = self.CallbackRecorder()
+        batches = []
+        try:
+            c.stream_sharded(shard_by_longitude(None, 1), r.callback, position_token_callback=lambda *a: r.callback(a),
+                             target_batch_callback=batches.append)
+            assert False  # expected behavior is not to arrive here
+        except ErrServerDisconnected:
+            pass
+
+        assert r.messages == [{"icao_address": "A"}, (0, "token1"), {"icao_address": "B"}]
+        assert batches == [[{"icao_address": "A"}], [{"icao_address": "B"}]]
+        assert c.shard_stats.position_tokens == ["token1"]
+
+        responses.reset()
+        responses.add(responses.GET, _STREAM_V2_URL, body='{}', status=401)
+        cfg = StreamConfig()
+        cfg.add(FilterIcaoAddress(["icao1", "icao2"]))
+        try:
+            c.stream_sharded(shard_by_icao_address(cfg, 2), r.callback)
+            assert False  # expected behavior is not to arrive here
+        except ErrInvalidToken:
+            pass
+        assert sorted(parse_qs(urlparse(call.request.url).query)["icao_address"] for call in responses.calls) == \
+            [["icao1"], ["icao2"]]
@@ -3,10 +3,13 @@ import os
 from typing import Dict, Any, Optional
 
 from google.cloud import storage
-from client import Client, StreamConfig, ContinueFromPositionToken
+from checkpoint import GCSCheckpointStore
+from client import Client, StreamConfig, ContinueFromPositionToken, Deduplicator
 from client import FilterLongitude, FilterLatitude
 
 LAST_POSITION_TOKEN_KEY = "last_position_token"
+# CHECKPOINT_INTERVAL is the minimum number of seconds between two writes of the last position token
+CHECKPOINT_INTERVAL = 10
 
 
 class TargetProcessor(object):
@@ -26,24 +29,18 @@ def must_getenv(key) -> str:
     return result
 
 
-def get_last_position_token(storage_client: storage.Client, bucket, key, logger) -> Optional[str]:
-    try:
-        bucket = storage_client.get_bucket(bucket)
-        blob = bucket.get_blob(key)
-        last_position_token = blob.download_as_string().decode("UTF-8")
-        return last_position_token
-    except Exception as e:
-        logger.warning("could not get last position_token: {}".format(e))
-        return None
+# The client is kept at module scope, so that warm invocations reuse its connection pool.
+_client: Optional[Client] = None
+# So is the deduplicator, so that target updates delivered again after resuming from the previous invocation's last
+# position token are not processed twice.
+_deduplicator = Deduplicator()
 
 
-def put_last_position_token(storage_client, bucket, key, token, logger):
-    try:
-        bucket = storage_client.bucket(bucket)
-        blob = bucket.blob(key)
-        blob.upload_from_string(token)
-    except Exception as e:
-        logger.warning("could not put last position_token: {}".format(e))
+def get_client(logger) -> Client:
+    global _client
+    if _client is None:
+        _client = Client(must_getenv("AIRSAFE2_TOKEN"), logger=logger)
+    return _client
 
 
 def handler(event: Dict[str, Any]):
@@ -53,12 +50,11 @@ def handler(event: Dict[str, Any]):
     logger.setLevel(logging.INFO)
     logger.info("event:{}".format(event))
 
-    # Retrieve the AirSafe2 token, and create a client
+    # Retrieve the AirSafe2 token, and create a client (or reuse the one of a previous invocation)
     TIMEOUT = int(must_getenv("TIMEOUT"))
-    AIRSAFE2_TOKEN = must_getenv("AIRSAFE2_TOKEN")
     LAST_POSITION_TOKEN_BUCKET = must_getenv("LAST_POSITION_TOKEN_BUCKET")
 
-    c = Client(AIRSAFE2_TOKEN, logger=logger)
+    c = get_client(logger)
 
     # Filter for planes that depart or arrive in Atlanta
     cfg = StreamConfig()
@@ -67,18 +63,24 @@ def handler(event: Dict[str, Any]):
     cfg.add(FilterLongitude(*atlanta_lon))
     cfg.add(FilterLatitude(*atlanta_lat))
 
-    # Restart the stream from it's last position, if this position is known
-    last_position_token = get_last_position_token(storage_client, LAST_POSITION_TOKEN_BUCKET, LAST_POSITION_TOKEN_KEY,
-                                                  logger)
+    # Restart the stream from it's last position, if this position is known. Position tokens are written in the
+    # background while streaming, so that a function that is stopped early still resumes from a recent token
+    checkpoints = GCSCheckpointStore(storage_client, LAST_POSITION_TOKEN_BUCKET, LAST_POSITION_TOKEN_KEY,
+                                     min_interval=CHECKPOINT_INTERVAL, logger=logger)
+    last_position_token = checkpoints.load()
     if last_position_token is not None:
         logger.info("starting from position_token: {}".format(last_position_token))
         cfg.add(ContinueFromPositionToken(last_position_token))
 
-    # Create the callback class and start the stream
+    # Create the callback class and start the stream, reconnecting from the last position token if the connection is
+    # interrupted before the timeout
     tp = TargetProcessor(logger)
-    last_position_token = c.stream(tp.callback, config=cfg, timeout=TIMEOUT)
-
-    put_last_position_token(storage_client, LAST_POSITION_TOKEN_BUCKET, LAST_POSITION_TOKEN_KEY, last_position_token,
-                            logger)
+    try:
+        last_position_token = c.stream_forever(tp.callback, position_token_callback=checkpoints, config=cfg,
+                                               timeout=TIMEOUT, deduplicator=_deduplicator)
+        checkpoints.save(last_position_token)
+    finally:
+        checkpoints.close()
+    logger.info("duplicates dropped: {} of {} target updates".format(_deduplicator.duplicates, _deduplicator.seen))
 
     return last_position_token
@@ -2,46 +2,60 @@ import sys
 import os
 import yaml
 import json
-import requests
-import csv
+
+from csv_sink import CSVSink
+from geofence import Geofence
+from history import HistoryClient, ErrInvalidToken, ErrSliceFailed
+from parquet_sink import ParquetSink
+
+
+def read_targets(lines, fence):
+    """
+    read_targets yields the target updates of the lines of a /history response that are within the zones of fence,
+    as the lines arrive
+    """
+    for line in lines:
+        if line:
+            target = json.loads(line)["target"]
+            if fence(target):
+                yield target
+
+
+def new_sink():
+    """
+    new_sink returns the CSVSink that writes data.csv, with the union of the fields of all target updates as columns.
+    If MAX_FILE_MB is set in env.yaml, data_0.csv, data_1.csv, ... are written instead, each holding up to
+    MAX_FILE_MB megabytes of rows.
+    If FORMAT is "parquet", the ParquetSink that writes the dataset data/ is returned instead, partitioned by date and
+    hour, and by cells of CELL_DEGREES degrees if CELL_DEGREES is set.
+    """
+    if os.environ.get("FORMAT", "csv").lower() == "parquet":
+        cell_degrees = float(os.environ.get("CELL_DEGREES", "0"))
+        return ParquetSink("data", cell_degrees=cell_degrees if cell_degrees > 0 else None)
+    max_file_mb = float(os.environ.get("MAX_FILE_MB", "0"))
+    if max_file_mb > 0:
+        return CSVSink(".", name_format="data_{sequence}.csv", max_bytes=int(max_file_mb * 2 ** 20))
+    return CSVSink(".", name_format="data.csv")
+
 
 if __name__ == "__main__":
     config = yaml.load(open("env.yaml"), Loader=yaml.FullLoader)
     os.environ.update(config)
+    # The API filters on the bounding box of the zones, target updates in the box but outside the zones are dropped
+    fence = Geofence.from_file("zone.geojson")
 
+    # The window is downloaded in CONNECTIONS time slices at once, each of them retried on its own if it fails, and
+    # the target updates are written in timestamp order as the slices complete
+    connections = int(os.environ.get("CONNECTIONS", "4"))
     try:
-        response = requests.get(
-            "https://api.airsafe.spire.com/v2/targets/history",
-            params={
-                "longitude_between": "0.9008789062499999,3.8452148437499996",
-                "latitude_between": "48.122101028190805,49.5822260446217",
-                "start": "2021-05-21T12:00:00Z",
-                "end": "2021-05-21T15:59:59Z",
-            },
-            headers={"Authorization": f"Bearer {os.environ['AVIATION_TOKEN']}"},
-        )
-    except Exception as e:
-        print("Failed to query API")
-        sys.exit()
-    if response.status_code == 401:
+        with HistoryClient(os.environ["AVIATION_TOKEN"], connections=connections) as client, new_sink() as sink:
+            lines = client.lines("2021-05-21T12:00:00Z", "2021-05-21T15:59:59Z",
+                                 params=fence.bounding_box().params())
+            sink.write_all(read_targets(lines, fence))
+        print("Export generated successfully")
+    except ErrInvalidToken:
         print("Unauthorized, token might be invalid")
-        sys.exit()
-    data_file = open("data.csv", "w")
-
-    # create the csv writer object
-    csv_writer = csv.writer(data_file)
-
-    data = []
-    for line in response.iter_lines(decode_unicode=True):
-        if line:
-            data.append(json.loads(line)["target"])
-    # To generate the right number of columns for the CSV, we find the row with the biggest number of items
-    most_keys = max(data, key=lambda item: len(item.keys()))
-    try:
-        csv_writer.writerow(most_keys.keys())
-        for elem in data:
-            csv_writer.writerow(map(lambda key: elem.get(key, ""), most_keys.keys()))
-        data_file.close()
-        print("CSV file generated successfully")
+    except ErrSliceFailed as e:
+        print("Failed to query API", e)
     except Exception as e:
         print("Something went wrong", e)
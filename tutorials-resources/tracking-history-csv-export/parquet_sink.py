@@ -0,0 +1,330 @@
+"""
+parquet_sink writes target updates to Parquet files, partitioned by date and hour of their timestamp, and optionally
+by a grid cell of their position, in the directory layout that pyarrow.dataset, pandas, Spark and DuckDB read as a
+partitioned dataset:
+
+    exports/date=2021-05-21/hour=12/part-00000-1f2e3d4c.parquet
+    exports/date=2021-05-21/hour=12/cell=33_-85/part-00001-1f2e3d4c.parquet    (with cell_degrees=1)
+
+    sink = ParquetSink("exports", cell_degrees=1)
+    for target_update in target_updates:
+        sink.write(target_update)
+    sink.close()
+
+    df = pyarrow.dataset.dataset("exports", partitioning="hive").to_table().to_pandas()
+
+The columns are typed after the fields of the API (see AIRSAFE_FIELDS). Fields that are not part of the schema
+are kept as string columns: a file in which such a field appears is completed, and the next file of the partition has
+the extended schema. Values that do not fit the type of their column are written as nulls and counted.
+
+Target updates are buffered per partition and written as a row group once row_group_size of them are buffered, or
+when the sink is flushed, rotated or closed. Files are written under a hidden name and renamed once complete. pyarrow
+is required.
+"""
+
+import json
+import math
+import os
+import re
+import uuid
+from collections import OrderedDict
+from os import path
+from typing import Optional, Dict, List, Any, Iterable, Tuple
+
+try:
+    import pyarrow as _pa
+    import pyarrow.parquet as _pq
+except ImportError:
+    _pa = None
+    _pq = None
+
+_DEFAULT_ROW_GROUP_SIZE = 128 * 1024
+_DEFAULT_MAX_BUFFERED_ROWS = 1024 * 1024
+_DEFAULT_MAX_OPEN_FILES = 64
+# _EXCESS_DIGITS matches the fractional digits of a timestamp beyond nanoseconds
+_EXCESS_DIGITS = re.compile(r"(\.\d{9})\d+")
+# _UNKNOWN_PARTITION is the date and hour of target updates without a valid timestamp
+_UNKNOWN_PARTITION = ("unknown", "unknown")
+
+# AIRSAFE_FIELDS are the fields of target updates by type, in the order of the API documentation; they are the fields
+# of columnar.AIRSAFE_SCHEMA
+AIRSAFE_FIELDS: Tuple[Tuple[str, str], ...] = (
+    ("icao_address", "string"),
+    ("timestamp", "timestamp"),
+    ("latitude", "float"),
+    ("longitude", "float"),
+    ("altitude_baro", "float"),
+    ("heading", "float"),
+    ("vertical_rate", "float"),
+    ("on_ground", "bool"),
+    ("callsign", "string"),
+    ("tail_number", "string"),
+    ("collection_type", "string"),
+    ("flight_number", "string"),
+    ("ingestion_time", "timestamp"),
+    ("speed", "float"),
+    ("squawk", "string"),
+    ("aircraft_type_icao", "string"),
+    ("aircraft_type_name", "string"),
+    ("airline_iata", "string"),
+    ("airline_name", "string"),
+    ("departure_utc_offset", "string"),
+    ("departure_airport_icao", "string"),
+    ("departure_airport_iata", "string"),
+    ("departure_scheduled_time", "timestamp"),
+    ("departure_estimated_time", "timestamp"),
+    ("arrival_utc_offset", "string"),
+    ("arrival_airport_icao", "string"),
+    ("arrival_airport_iata", "string"),
+    ("arrival_scheduled_time", "timestamp"),
+    ("arrival_estimated_time", "timestamp"),
+    ("takeoff_time", "timestamp"),
+    ("landing_time", "timestamp"),
+    ("source", "string"),
+)
+
+
+def airsafe_arrow_schema():
+    """
+    airsafe_arrow_schema returns AIRSAFE_FIELDS as a pyarrow schema. Timestamps are in milliseconds, UTC.
+    """
+    if _pa is None:
+        raise ImportError("parquet_sink requires pyarrow")
+    types = {
+        "string": _pa.string(),
+        "timestamp": _pa.timestamp("ms", tz="UTC"),
+        "float": _pa.float64(),
+        "bool": _pa.bool_(),
+    }
+    return _pa.schema([(name, types[field_type]) for name, field_type in AIRSAFE_FIELDS])
+
+
+def _partition(target_update: Dict[str, Any], cell_degrees: Optional[float]) -> Tuple:
+    timestamp = target_update.get("timestamp")
+    if isinstance(timestamp, str) and len(timestamp) >= 13:
+        key = (timestamp[:10], timestamp[11:13])
+    else:
+        key = _UNKNOWN_PARTITION
+    if cell_degrees is None:
+        return key
+    latitude, longitude = target_update.get("latitude"), target_update.get("longitude")
+    if not isinstance(latitude, (int, float)) or not isinstance(longitude, (int, float)):
+        return key + ("unknown",)
+    return key + ("{:g}_{:g}".format(math.floor(latitude / cell_degrees) * cell_degrees,
+                                     math.floor(longitude / cell_degrees) * cell_degrees),)
+
+
+def _nanoseconds(value):
+    if isinstance(value, str):
+        return _EXCESS_DIGITS.sub(r"\1", value)
+    return value
+
+
+def _string(value) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+class _Partition(object):
+    """
+    _Partition holds the buffered target updates and the open file of a partition
+    """
+
+    def __init__(self, directory: str):
+        self.directory: str = directory
+        self.rows: List[Dict[str, Any]] = []
+        self.writer = None
+        self.schema = None
+        self.path: Optional[str] = None
+        self.hidden_path: Optional[str] = None
+
+
+class ParquetSink(object):
+    """
+    ParquetSink appends target updates to partitioned Parquet files, see the module documentation. It is not
+    thread-safe.
+    """
+
+    def __init__(self, directory: str, cell_degrees: Optional[float] = None,
+                 row_group_size: int = _DEFAULT_ROW_GROUP_SIZE, max_buffered_rows: int = _DEFAULT_MAX_BUFFERED_ROWS,
+                 max_open_files: int = _DEFAULT_MAX_OPEN_FILES, compression: str = "zstd"):
+        """
+
+        :param directory: The root directory of the dataset, created if it does not exist
+        :param cell_degrees: The size in degrees of the latitude/longitude grid cells that partition the target
+        updates below the hour, None to not partition by position
+        :param row_group_size: The number of target updates per row group
+        :param max_buffered_rows: The number of target updates buffered across all partitions, above which the
+        partition with the most buffered target updates is written
+        :param max_open_files: The number of open files, above which the least recently written file is completed
+        :param compression: The Parquet compression codec, e.g. "zstd", "snappy" or "none"
+        """
+        if _pa is None:
+            raise ImportError("parquet_sink requires pyarrow")
+        self.directory: str = directory
+        self.cell_degrees: Optional[float] = cell_degrees
+        self.row_group_size: int = row_group_size
+        self.max_buffered_rows: int = max_buffered_rows
+        self.max_open_files: int = max_open_files
+        self.compression: str = compression
+        os.makedirs(directory, exist_ok=True)
+
+        self._base_schema = airsafe_arrow_schema()
+        self._known = set(self._base_schema.names)
+        # _extra lists the fields that are not part of the schema, in the order they were first seen
+        self._extra: List[str] = []
+        self._partitions: Dict[Tuple, _Partition] = {}
+        # _open lists the partitions with an open file, least recently written first
+        self._open: "OrderedDict[Tuple, _Partition]" = OrderedDict()
+        self._buffered: int = 0
+        self._id: str = uuid.uuid4().hex[:8]
+        self._sequence: int = 0
+        self.rows: int = 0
+        self.row_groups: int = 0
+        self.invalid_values: int = 0
+        # files lists the paths of the completed files
+        self.files: List[str] = []
+        self._rotated: int = 0
+
+    def _schema(self):
+        if not self._extra:
+            return self._base_schema
+        return _pa.schema(list(self._base_schema) + [_pa.field(name, _pa.string()) for name in self._extra])
+
+    def _partition_directory(self, key: Tuple) -> str:
+        names = ["date={}".format(key[0]), "hour={}".format(key[1])]
+        if len(key) > 2:
+            names.append("cell={}".format(key[2]))
+        return path.join(self.directory, *names)
+
+    def write(self, target_update: Dict[str, Any]):
+        """
+        write buffers a target update in its partition, and writes row groups and completes files as needed
+        """
+        if not target_update.keys() <= self._known:
+            for name in target_update:
+                if name not in self._known:
+                    self._known.add(name)
+                    self._extra.append(name)
+        key = _partition(target_update, self.cell_degrees)
+        partition = self._partitions.get(key)
+        if partition is None:
+            partition = self._partitions[key] = _Partition(self._partition_directory(key))
+        partition.rows.append(target_update)
+        self._buffered += 1
+        self.rows += 1
+        if len(partition.rows) >= self.row_group_size:
+            self._write_row_group(key, partition)
+        elif self._buffered >= self.max_buffered_rows:
+            largest = max(self._partitions, key=lambda k: len(self._partitions[k].rows))
+            self._write_row_group(largest, self._partitions[largest])
+
+    __call__ = write
+
+    def write_all(self, target_updates: Iterable[Dict[str, Any]]):
+        """
+        write_all buffers target updates, see write
+        """
+        for target_update in target_updates:
+            self.write(target_update)
+
+    def _column(self, rows: List[Dict[str, Any]], field):
+        values = [row.get(field.name) for row in rows]
+        if field.name not in self._base_schema.names:
+            return _pa.array([_string(v) for v in values], type=_pa.string())
+        try:
+            return self._convert(values, field.type)
+        except (_pa.ArrowException, TypeError, ValueError):
+            # the values that do not fit the type are written as nulls, the others are kept
+            converted = []
+            for value in values:
+                try:
+                    converted.append(self._convert([value], field.type)[0].as_py())
+                except (_pa.ArrowException, TypeError, ValueError):
+                    converted.append(None)
+                    self.invalid_values += 1
+            return _pa.array(converted, type=field.type)
+
+    @staticmethod
+    def _convert(values: List, arrow_type):
+        if _pa.types.is_timestamp(arrow_type):
+            # the timestamps of the API are ISO 8601 strings in UTC, with any number of fractional digits: they are
+            # parsed in nanoseconds, and truncated to the unit of the column
+            nanoseconds = _pa.timestamp("ns", tz=arrow_type.tz)
+            try:
+                parsed = _pa.array(values, type=_pa.string()).cast(nanoseconds)
+            except _pa.ArrowInvalid:
+                parsed = _pa.array([_nanoseconds(v) for v in values], type=_pa.string()).cast(nanoseconds)
+            return parsed.cast(arrow_type, safe=False)
+        return _pa.array(values, type=arrow_type)
+
+    def _write_row_group(self, key: Tuple, partition: _Partition):
+        if not partition.rows:
+            return
+        schema = self._schema()
+        if partition.writer is not None and partition.schema != schema:
+            # a field appeared that the open file does not have
+            self._complete(key, partition)
+        if partition.writer is None:
+            if len(self._open) >= self.max_open_files:
+                oldest = next(iter(self._open))
+                self._complete(oldest, self._open[oldest])
+            self._open_file(partition, schema)
+            self._open[key] = partition
+        self._open.move_to_end(key)
+
+        table = _pa.Table.from_arrays([self._column(partition.rows, field) for field in schema], schema=schema)
+        partition.writer.write_table(table, row_group_size=len(partition.rows))
+        self.row_groups += 1
+        self._buffered -= len(partition.rows)
+        partition.rows = []
+
+    def _open_file(self, partition: _Partition, schema):
+        os.makedirs(partition.directory, exist_ok=True)
+        name = "part-{:05d}-{}.parquet".format(self._sequence, self._id)
+        self._sequence += 1
+        partition.path = path.join(partition.directory, name)
+        # readers of the dataset skip hidden files, so that incomplete files are not read
+        partition.hidden_path = path.join(partition.directory, "." + name)
+        partition.writer = _pq.ParquetWriter(partition.hidden_path, schema, compression=self.compression)
+        partition.schema = schema
+
+    def _complete(self, key: Tuple, partition: _Partition):
+        partition.writer.close()
+        os.replace(partition.hidden_path, partition.path)
+        self.files.append(partition.path)
+        partition.writer = None
+        partition.schema = None
+        del self._open[key]
+
+    def flush(self):
+        """
+        flush writes the buffered target updates of all partitions as row groups
+        """
+        for key, partition in list(self._partitions.items()):
+            self._write_row_group(key, partition)
+
+    def rotate(self) -> List[str]:
+        """
+        rotate writes the buffered target updates and completes all files; the next target updates start new files
+        :return: rotate returns the paths of the files completed since the last rotation
+        """
+        self.flush()
+        for key in list(self._open):
+            self._complete(key, self._open[key])
+        self._partitions = {}
+        completed, self._rotated = self.files[self._rotated:], len(self.files)
+        return completed
+
+    def close(self) -> List[str]:
+        """
+        close completes all files, see rotate
+        """
+        return self.rotate()
+
+    def __enter__(self) -> "ParquetSink":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,197 @@
+"""
+csv_sink writes target updates to CSV files as they arrive, instead of holding them in memory until a file is
+written. The columns are the union of the fields of all target updates of a file, in the order they were first seen:
+
+    sink = CSVSink("exports", max_bytes=256 * 2 ** 20)
+    for target_update in target_updates:
+        sink.write(target_update)
+    sink.close()
+
+Rows are appended to a part file, with the columns known so far. When a file is rotated, by size, by age or by
+calling rotate(), the header is written and the part file is copied behind it. Only rows that were written before a
+field first appeared are parsed again, to pad them with empty cells; all later rows are copied as they are.
+"""
+
+import csv
+import gzip
+import io
+import itertools
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from os import path
+from typing import Optional, Dict, List, Any, Callable, Iterable, Tuple
+
+# _CHECK_EVERY is the number of rows after which the size and the age of a file are checked
+_CHECK_EVERY = 256
+_TIME_FORMAT = "%m_%d_%Y_%H_%M_%S"
+_COPY_BUFFER = 1024 * 1024
+# _COPY_ROWS is the number of rows that are padded at once
+_COPY_ROWS = 4096
+
+
+class CSVSink(object):
+    """
+    CSVSink appends target updates to rotated CSV files, see the module documentation. Memory does not grow with
+    the number of rows, only with the number of distinct fields. It is not thread-safe.
+    """
+
+    def __init__(self, directory: str = ".", name_format: str = "data_{start}_{end}.csv",
+                 max_bytes: Optional[int] = None, max_seconds: Optional[float] = None, compress: bool = False,
+                 compresslevel: int = 6, clock: Callable[[], datetime] = datetime.now):
+        """
+
+        :param directory: The directory of the files, created if it does not exist
+        :param name_format: The name of a file, with the placeholders start and end (the times of the first row and
+        of the rotation) and sequence (the number of the file, from 0)
+        :param max_bytes: The number of bytes of rows after which a file is rotated, None for no limit
+        :param max_seconds: The age in seconds after which a file is rotated, None for no limit
+        :param compress: If True, files are gzip compressed, and ".gz" is appended to their names
+        :param compresslevel: The gzip compression level, from 1 (fastest) to 9 (smallest)
+        :param clock: The clock that names the files and that max_seconds refers to
+        """
+        self.directory: str = directory
+        self.name_format: str = name_format
+        self.max_bytes: Optional[int] = max_bytes
+        self.max_seconds: Optional[float] = max_seconds
+        self.compress: bool = compress
+        self.compresslevel: int = compresslevel
+        self._clock = clock
+        os.makedirs(directory, exist_ok=True)
+
+        # the fields of the current file, in the order they were first seen, and their index
+        self.fields: List[str] = []
+        self._index: Dict[str, int] = {}
+        # _widths lists where in the part file the number of columns changed: (offset, number of columns, row)
+        self._widths: List[Tuple[int, int, int]] = []
+        self._file_rows: int = 0
+        self._part = None
+        self._part_path: Optional[str] = None
+        self._writer = None
+        self._start: Optional[datetime] = None
+        self._sequence: int = 0
+        self.rows: int = 0
+        # files lists the paths of the completed files
+        self.files: List[str] = []
+
+    def _open(self):
+        fd, self._part_path = tempfile.mkstemp(prefix=".", suffix=".csv.part", dir=self.directory)
+        self._part = io.open(fd, "w", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._part)
+        self._start = self._clock()
+
+    def _add_fields(self, target_update: Dict[str, Any]):
+        for key in target_update:
+            if key not in self._index:
+                self._index[key] = len(self.fields)
+                self.fields.append(key)
+        self._widths.append((self._part.tell(), len(self.fields), self._file_rows))
+
+    def write(self, target_update: Dict[str, Any]):
+        """
+        write appends a target update to the current file, and rotates the file if it is too big or too old
+        """
+        if self._part is None:
+            self._open()
+        if not target_update.keys() <= self._index.keys():
+            self._add_fields(target_update)
+        get = target_update.get
+        self._writer.writerow([get(field, "") for field in self.fields])
+        self._file_rows += 1
+        self.rows += 1
+        if self.rows % _CHECK_EVERY == 0 and self._due():
+            self.rotate()
+
+    __call__ = write
+
+    def write_all(self, target_updates: Iterable[Dict[str, Any]]):
+        """
+        write_all appends target updates to the current file, rotating files as needed
+        """
+        for target_update in target_updates:
+            self.write(target_update)
+
+    def _due(self) -> bool:
+        if self.max_bytes is not None and self._part.tell() >= self.max_bytes:
+            return True
+        return self.max_seconds is not None and (self._clock() - self._start).total_seconds() >= self.max_seconds
+
+    def rotate(self) -> Optional[str]:
+        """
+        rotate completes the current file: the header is written, followed by the rows. The next row starts a new
+        file.
+        :return: rotate returns the path of the completed file, or None if no row was written since the last rotation
+        """
+        if self._part is None:
+            return None
+        self._part.close()
+        name = self.name_format.format(start=self._start.strftime(_TIME_FORMAT),
+                                       end=self._clock().strftime(_TIME_FORMAT), sequence=self._sequence)
+        suffix = ".gz" if self.compress else ""
+        if path.join(self.directory, name + suffix) in self.files:
+            # e.g. files that are rotated by size within the same second are numbered, instead of overwritten
+            root, extension = path.splitext(name)
+            name = "{}-{}{}".format(root, self._sequence, extension)
+        file_path = path.join(self.directory, name + suffix)
+        try:
+            self._finalize(file_path)
+        finally:
+            os.remove(self._part_path)
+            self._part = None
+            self._writer = None
+        self._sequence += 1
+        self.fields = []
+        self._index = {}
+        self._widths = []
+        self._file_rows = 0
+        self.files.append(file_path)
+        return file_path
+
+    def _finalize(self, file_path: str):
+        """
+        _finalize writes the header and the rows of the part file to file_path, which appears once it is complete
+        """
+        width = len(self.fields)
+        tmp = file_path + ".tmp"
+        if self.compress:
+            out = gzip.open(tmp, "wb", compresslevel=self.compresslevel)
+        else:
+            out = open(tmp, "wb")
+        with out, open(self._part_path, "rb") as part:
+            out.write(_encode_rows([self.fields]))
+            ends = [row for _, _, row in self._widths[1:]] + [self._file_rows]
+            for (offset, columns, row), end in zip(self._widths, ends):
+                part.seek(offset)
+                if columns == width:
+                    # the rows from here on have all columns: they are copied as they are
+                    shutil.copyfileobj(part, out, _COPY_BUFFER)
+                    break
+                padding = [""] * (width - columns)
+                text = io.TextIOWrapper(part, encoding="utf-8", newline="")
+                rows = csv.reader(text)
+                try:
+                    for start in range(row, end, _COPY_ROWS):
+                        chunk = itertools.islice(rows, min(_COPY_ROWS, end - start))
+                        out.write(_encode_rows(r + padding for r in chunk))
+                finally:
+                    text.detach()
+        os.replace(tmp, file_path)
+
+    def close(self) -> Optional[str]:
+        """
+        close completes the current file, see rotate
+        """
+        return self.rotate()
+
+    def __enter__(self) -> "CSVSink":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _encode_rows(rows: Iterable[List[str]]) -> bytes:
+    text = io.StringIO()
+    csv.writer(text).writerows(rows)
+    return text.getvalue().encode("utf-8")
@@ -3,9 +3,9 @@ import yaml
 import logging
 from datetime import datetime, timedelta
 import sys
-import copy
 import json
-import csv
+import queue
+import threading
 import requests
 from requests.adapters import HTTPAdapter
 from requests.exceptions import RetryError
@@ -14,53 +14,203 @@ from requests.packages.urllib3.util.retry import Retry
 import time
 
 from apscheduler.schedulers.background import BackgroundScheduler
+from checkpoint import FileCheckpointStore
+from csv_sink import CSVSink
+from parquet_sink import ParquetSink
 from exceptions import MaxRetries, ConnectionLost
 
 log = logging.getLogger(__name__)
 
+# target_updates is the buffer the stream appends to. Only the stream thread swaps it for an empty one (see
+# hand_over), so that neither the stream nor the export needs a lock or a copy: at the first position token after
+# CHUNK_ROWS target updates, the stream hands them over to the exporter thread, which appends them to the current CSV
+# file while the stream fills the next buffer, and the export job only asks for a rotation of the file.
+# Target updates are handed over at position tokens only, so that every file ends at a position token: the target
+# updates after the last position token (from token_rows on) are dropped when the connection is lost, and delivered
+# again after resuming from that token.
 target_updates = []
-time_from = None
+token_rows = 0
+rotation_due = False
+# position_token is the last position token of the stream, which the next connection resumes from
+position_token = None
+# CHUNK_ROWS is the number of target updates after which they are handed over to the exporter thread
+CHUNK_ROWS = 10000
+# EXPORT_QUEUE_SIZE is the number of chunks that wait for the exporter thread before the stream waits for it, so that
+# at most EXPORT_QUEUE_SIZE + 2 chunks of target updates, of up to 15 seconds of the stream each, are held in memory
+EXPORT_QUEUE_SIZE = 8
+export_queue = queue.Queue(EXPORT_QUEUE_SIZE)
+exporter = None
+# ROTATE and STOP are queued for the exporter thread with the position token the file ends at, to complete the
+# current file and store the token, and to stop after that
+ROTATE = "rotate"
+STOP = "stop"
+# RETRY_SECONDS is the wait before reconnecting once all retries of a connection failed
+RETRY_SECONDS = 60 * 30
+
+
+class ExportMetrics(object):
+    """
+    ExportMetrics counts the exports, their duration (writing and compressing the file) and the peak number of
+    target updates that were buffered before they were handed over to the exporter thread
+    """
+
+    def __init__(self):
+        self.exports = 0
+        self.rows = 0
+        self.last_seconds = 0.0
+        self.max_seconds = 0.0
+        self.total_seconds = 0.0
+        self.peak_buffered_rows = 0
+
+    def __str__(self):
+        return (
+            f"exports: {self.exports}, rows: {self.rows}, export seconds: last {self.last_seconds:.3f} "
+            f"max {self.max_seconds:.3f} total {self.total_seconds:.3f}, peak buffered rows: {self.peak_buffered_rows}"
+        )
+
+
+export_metrics = ExportMetrics()
 
 
 def reset_bucket():
-    global target_updates
+    global target_updates, token_rows
 
     target_updates = []
+    token_rows = 0
 
 
-def export_to_csv_job():
-    global time_from
-    global target_updates
-    # Do the CSV export here
+def drop_since_token():
+    """
+    drop_since_token drops the target updates after the last position token, which the stream delivers again when it
+    resumes from that token
+    """
+    del target_updates[token_rows:]
 
-    to_proccess = copy.deepcopy(target_updates)
-    old_time_from = copy.deepcopy(time_from)
-    time_from = datetime.now()
-    reset_bucket()
+
+def hand_over():
+    """
+    hand_over runs on the stream thread: it swaps the buffer for an empty one, in O(1), and queues the full buffer
+    for the exporter thread
+    """
+    global target_updates, token_rows
+
+    to_proccess, target_updates = target_updates, []
+    token_rows = 0
+    export_metrics.peak_buffered_rows = max(export_metrics.peak_buffered_rows, len(to_proccess))
     if len(to_proccess) > 0:
-        print(to_proccess[0])
-        data_file = open(
-            f"data_{old_time_from.strftime('%m_%d_%Y_%H_%M_%S')}_{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.csv",
-            "w",
-        )
+        export_queue.put(to_proccess)
 
-        # create the csv writer object
-        csv_writer = csv.writer(data_file)
 
-        most_keys = max(to_proccess, key=lambda item: len(item.keys()))
-        csv_writer.writerow(most_keys.keys())
-        for elem in to_proccess:
-            csv_writer.writerow(map(lambda key: elem.get(key, ""), most_keys.keys()))
-        data_file.close()
+def rotate_buffer(token=None):
+    """
+    rotate_buffer runs on the stream thread: it hands the buffer over, and then asks the exporter thread to complete
+    the current CSV file, which ends at the position token token
+    """
+    global rotation_due
 
+    hand_over()
+    rotation_due = False
+    export_queue.put((ROTATE, token))
 
-def listen_to_stream(timeout=None):
-    global time_from
-    reset_bucket()
-    if timeout is not None:
-        timeout = datetime.now() + timedelta(0, timeout)
 
-    scheduler = BackgroundScheduler()
+def new_sink():
+    # Files are gzip compressed if COMPRESS is "true" in env.yaml, and also rotated once they hold MAX_FILE_MB
+    # megabytes of rows if MAX_FILE_MB is set. If FORMAT is "parquet", every rotation completes the files of the
+    # Parquet dataset exports/ instead, partitioned by date and hour, and by cells of CELL_DEGREES degrees if set
+    if os.environ.get("FORMAT", "csv").lower() == "parquet":
+        cell_degrees = float(os.environ.get("CELL_DEGREES", "0"))
+        return ParquetSink("exports", cell_degrees=cell_degrees if cell_degrees > 0 else None)
+    max_file_mb = float(os.environ.get("MAX_FILE_MB", "0"))
+    return CSVSink(
+        ".",
+        name_format="data_{start}_{end}.csv",
+        max_bytes=int(max_file_mb * 2 ** 20) if max_file_mb > 0 else None,
+        compress=str(os.environ.get("COMPRESS", "false")).lower() == "true",
+    )
+
+
+def export_worker(sink, checkpoints=None):
+    seconds = 0.0
+    rows = 0
+    while True:
+        export = export_queue.get()
+        start = time.perf_counter()
+        if isinstance(export, tuple):
+            command, token = export
+            try:
+                # Do the export here: the CSV header is written and the rows are copied behind it, or the Parquet
+                # files are completed. rotate returns the completed file, or the list of completed files
+                if sink.rotate():
+                    seconds += time.perf_counter() - start
+                    export_metrics.exports += 1
+                    export_metrics.rows += rows
+                    export_metrics.last_seconds = seconds
+                    export_metrics.max_seconds = max(export_metrics.max_seconds, seconds)
+                    export_metrics.total_seconds += seconds
+                    log.info(export_metrics)
+                # The files hold all target updates up to token: a restart resumes from it
+                if checkpoints is not None and token is not None:
+                    checkpoints.save(token)
+            except Exception as e:
+                log.warn(e)
+                print("failed to export CSV")
+            seconds, rows = 0.0, 0
+            # the worker stops even if the last export failed, so that stop_exporter does not wait forever
+            if command == STOP:
+                return
+            continue
+        try:
+            if rows == 0:
+                print(export[0])
+            sink.write_all(export)
+            rows += len(export)
+        except Exception as e:
+            log.warn(e)
+            print("failed to export CSV")
+        seconds += time.perf_counter() - start
+
+
+def start_exporter(checkpoints=None):
+    global exporter
+
+    exporter = threading.Thread(target=export_worker, args=(new_sink(), checkpoints), name="csv-exporter",
+                                daemon=True)
+    exporter.start()
+
+
+def stop_exporter():
+    """
+    stop_exporter waits for the queued target updates to be written and the current file to be completed, and stops
+    the exporter thread. The target updates after the last position token are left to the next run, which resumes
+    from that token.
+    """
+    global exporter
+
+    if exporter is not None:
+        drop_since_token()
+        hand_over()
+        export_queue.put((STOP, position_token))
+        exporter.join()
+        exporter = None
+
+
+def export_to_csv_job():
+    global rotation_due
+    # Runs on the scheduler thread, the stream thread rotates the file at its next position token (at least every 15
+    # seconds)
+    rotation_due = True
+
+
+def listen_to_stream(deadline=None):
+    """
+    listen_to_stream reads the stream from position_token, or from the latest target updates if there is none,
+    until deadline
+    :return: listen_to_stream returns once deadline is reached, and raises MaxRetries (the request failed after all
+    retries, or was rejected) or ConnectionLost otherwise
+    """
+    global position_token, token_rows
+
+    drop_since_token()
     retry_strategy = Retry(
         # 10 retries before throwing exception
         total=10,
@@ -73,72 +223,114 @@ def listen_to_stream(timeout=None):
     http.mount("https://", adapter)
     http.mount("http://", adapter)
 
+    params = {
+        "longitude_between": "0.9008789062499999,3.8452148437499996",
+        "latitude_between": "48.122101028190805,49.5822260446217",
+    }
+    if position_token is not None:
+        params["position_token"] = position_token
     try:
         response = http.get(
             "https://api.airsafe.spire.com/v2/targets/stream?compression=none",
-            params={
-                "longitude_between": "0.9008789062499999,3.8452148437499996",
-                "latitude_between": "48.122101028190805,49.5822260446217",
-            },
+            params=params,
             headers={"Authorization": f"Bearer {os.environ['AVIATION_TOKEN']}"},
             stream=True,
         )
     except RetryError:
         log.warn(RetryError)
         raise MaxRetries()
+    except requests.exceptions.RequestException as e:
+        log.warn(e)
+        raise ConnectionLost()
     if response.status_code == 401:
         print("Unauthorized, token might be invalid")
         sys.exit()
-
-    try:
-        scheduler.add_job(
-            export_to_csv_job,
-            "cron",
-            minute="*/30",
-            id="airsafe_stream_csv",
-        )
-        time_from = datetime.now()
-        scheduler.start()
-    except Exception as e:
-        log.warn(e)
-        print("failed to start scheduler")
-        raise ConnectionLost()
+    if response.status_code != 200:
+        # e.g. a position token that is not valid anymore, reading the body as a stream would fail the same way
+        log.warn("stream request failed with status {}".format(response.status_code))
+        response.close()
+        raise MaxRetries()
 
     try:
         for line in response.iter_lines(decode_unicode=True):
-            if timeout is not None and datetime.now() >= timeout:
-                scheduler.remove_job("airsafe_stream_csv")
-                scheduler.shutdown()
-                export_to_csv_job()
-                response.close()
-                sys.exit()
-            if line and '"target":{' in line:
-                target = json.loads(line)["target"]
-                target_updates.append(target)
+            if deadline is not None and datetime.now() >= deadline:
+                return
+            if not line:
+                continue
+            if '"target":{' in line:
+                target_updates.append(json.loads(line)["target"])
+            elif line.startswith('{"position_token":'):
+                position_token = json.loads(line)["position_token"]
+                token_rows = len(target_updates)
+                if rotation_due:
+                    rotate_buffer(position_token)
+                elif len(target_updates) >= CHUNK_ROWS:
+                    hand_over()
     except Exception as e:
         log.warn(e)
-        scheduler.remove_job("airsafe_stream_csv")
-        scheduler.shutdown()
-        export_to_csv_job()
         raise ConnectionLost()
+    finally:
+        response.close()
+    # The server closed the stream
+    raise ConnectionLost()
+
 
+def connection_manager(timeout=None):
+    """
+    connection_manager exports the stream until timeout seconds have passed, or forever if timeout is None. The
+    stream resumes from the position token stored with the last exported file, and reconnects from the last position
+    token when the connection is lost. The export job and the current file are kept across reconnects.
+    """
+    global position_token
 
-def connection_manager():
+    reset_bucket()
+    deadline = None
+    if timeout is not None:
+        deadline = datetime.now() + timedelta(0, timeout)
+    # The position token of the last exported file is stored next to the files, in token.txt
+    checkpoints = FileCheckpointStore(".", min_interval=0)
+    position_token = checkpoints.load()
+    # stored is True until a connection from the stored position token succeeded
+    stored = position_token is not None
+    if stored:
+        print("resuming from the last exported position token")
+
+    scheduler = BackgroundScheduler()
+    scheduler.add_job(
+        export_to_csv_job,
+        "cron",
+        minute="*/30",
+        id="airsafe_stream_csv",
+    )
+    scheduler.start()
+    start_exporter(checkpoints)
     try:
-        # If you wish to listen for a specific time:
-        # listen_to_stream(70) will listen for 70 seconds
-        listen_to_stream()
-    except MaxRetries:
-        print("stream failed to connect multiple times, will retry in 30mn")
-        time.sleep(60 * 30)
-        connection_manager()
-    except ConnectionLost:
-        print("Connection was lost retrying now ...")
-        connection_manager()
+        while True:
+            try:
+                listen_to_stream(deadline)
+                return
+            except MaxRetries:
+                if stored:
+                    # position tokens are only valid for a while, the stored one may have expired
+                    print("stream failed to resume from the last exported position token, starting from the latest")
+                    position_token = None
+                    stored = False
+                    continue
+                print("stream failed to connect multiple times, will retry in 30mn")
+                time.sleep(RETRY_SECONDS)
+            except ConnectionLost:
+                stored = False
+                print("Connection was lost retrying now ...")
+    finally:
+        scheduler.shutdown()
+        stop_exporter()
+        checkpoints.close()
 
 
 if __name__ == "__main__":
     config = yaml.load(open("env.yaml"), Loader=yaml.FullLoader)
     os.environ.update(config)
 
+    # If you wish to listen for a specific time:
+    # connection_manager(70) will listen for 70 seconds
     connection_manager()
@@ -0,0 +1,104 @@
+import contextlib
+import io
+import os
+import queue
+import threading
+
+import main
+from exceptions import MaxRetries
+
+
+class Sink(object):
+    """
+    Sink is a sink whose rotation fails
+    """
+
+    def __init__(self):
+        self.rows = []
+
+    def write_all(self, target_updates):
+        self.rows.extend(target_updates)
+
+    def rotate(self):
+        raise OSError("disk full")
+
+
+class Checkpoints(object):
+    def __init__(self):
+        self.tokens = []
+
+    def save(self, token):
+        self.tokens.append(token)
+
+
+class Response(object):
+    """
+    Response is a response that is not a stream
+    """
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.closed = False
+
+    def iter_lines(self, decode_unicode=False):
+        raise AssertionError("the body is not a stream")
+
+    def close(self):
+        self.closed = True
+
+
+class Session(object):
+    response = None
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def get(self, url, params=None, headers=None, stream=False):
+        return self.response
+
+
+class TestListenToStream(object):
+
+    def test_rejected_request(self):
+        """
+        test_rejected_request tests that a request that is rejected, e.g. for an expired position token, raises
+        MaxRetries instead of being read as a stream
+        """
+        session = main.requests.Session
+        main.requests.Session = Session
+        os.environ.setdefault("AVIATION_TOKEN", "token")
+        try:
+            Session.response = Response(400)
+            try:
+                main.listen_to_stream()
+                assert False  # expected behavior is not to arrive here
+            except MaxRetries:
+                pass
+            assert Session.response.closed
+        finally:
+            main.requests.Session = session
+
+
+class TestExportWorker(object):
+
+    def test_stop_after_failed_rotation(self):
+        """
+        test_stop_after_failed_rotation tests that the exporter thread stops on STOP even if the rotation of the last
+        file fails, and that the position token of a failed rotation is not stored
+        """
+        export_queue = main.export_queue
+        main.export_queue = queue.Queue()
+        try:
+            sink, checkpoints = Sink(), Checkpoints()
+            main.export_queue.put([{"icao_address": "A"}])
+            main.export_queue.put((main.ROTATE, "token1"))
+            main.export_queue.put((main.STOP, "token2"))
+            with contextlib.redirect_stdout(io.StringIO()):
+                worker = threading.Thread(target=main.export_worker, args=(sink, checkpoints), daemon=True)
+                worker.start()
+                worker.join(5)
+            assert not worker.is_alive()
+            assert sink.rows == [{"icao_address": "A"}]
+            assert checkpoints.tokens == []
+        finally:
+            main.export_queue = export_queue